@@ -9,6 +9,7 @@ echo "Configuration:"
 echo "  PROMETHEUS_HOST: ${PROMETHEUS_HOST}"
 echo "  PROMETHEUS_PORT: ${PROMETHEUS_PORT}"
 echo "  SCAN_INTERVAL: ${SCAN_INTERVAL}s"
+echo "  METRICS_PORT: ${METRICS_PORT}"
 echo ""
 
 # Create symlinks to data volume for persistent storage
@@ -34,21 +35,6 @@ done
 echo "Prometheus is ready!"
 echo ""
 
-# Main loop
-while true; do
-    echo ""
-    echo "[$(date '+%Y-%m-%d %H:%M:%S')] Starting network scan..."
-
-    # Run discovery
-    cd /app
-    python3 network_discovery.py --scan --config /app/network_discovery.yml || echo "Scan failed, will retry"
-
-    # Copy generated targets to data volume
-    if [ -f /app/prometheus/network_devices.json ]; then
-        cp /app/prometheus/network_devices.json /data/network_devices.json
-        echo "Targets saved to /data/network_devices.json"
-    fi
-
-    echo "[$(date '+%Y-%m-%d %H:%M:%S')] Scan complete. Next scan in ${SCAN_INTERVAL}s..."
-    sleep "${SCAN_INTERVAL}"
-done
+# Run the discovery daemon (internal scheduler, config hot reload, /metrics)
+cd /app
+exec python3 /app/network_discovery.py --daemon --config "${CONFIG_FILE:-/app/config/network_discovery.yml}"
@@ -4,85 +4,56 @@ Health Check Script
 Provides overall system health status for the observability stack.
 """
 
-import requests
-import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_api import PrometheusError, default_client
 
-PROMETHEUS_URL = "http://localhost:9990"
 GRAFANA_URL = "http://localhost:3000"
 
 def check_prometheus_targets():
     """Check status of all Prometheus targets."""
     try:
-        response = requests.get(f"{PROMETHEUS_URL}/api/v1/targets", timeout=5)
-        if response.status_code != 200:
-            return None, "Prometheus API not accessible"
-        
-        data = response.json().get('data', {})
-        targets = data.get('activeTargets', [])
-        
-        up = sum(1 for t in targets if t.get('health') == 'up')
-        down = sum(1 for t in targets if t.get('health') != 'up')
-        
-        return {
-            'total': len(targets),
-            'up': up,
-            'down': down,
-            'targets': targets
-        }, None
-    except requests.exceptions.ConnectionError:
-        return None, "Cannot connect to Prometheus"
-    except Exception as e:
-        return None, str(e)
+        targets = default_client().targets()
+    except PrometheusError as e:
+        return None, "Cannot connect to Prometheus" if e.unreachable else str(e)
+
+    up = sum(1 for t in targets if t.health == 'up')
+    return {
+        'total': len(targets),
+        'up': up,
+        'down': len(targets) - up,
+        'targets': targets
+    }, None
 
 def check_active_alerts():
     """Check for active alerts in Prometheus."""
     try:
-        response = requests.get(f"{PROMETHEUS_URL}/api/v1/alerts", timeout=5)
-        if response.status_code != 200:
-            return None, "Prometheus alerts API not accessible"
-        
-        data = response.json().get('data', {})
-        alerts = data.get('alerts', [])
-        
-        firing = [a for a in alerts if a.get('state') == 'firing']
-        pending = [a for a in alerts if a.get('state') == 'pending']
-        
-        return {
-            'total': len(alerts),
-            'firing': firing,
-            'pending': pending
-        }, None
-    except Exception as e:
+        alerts = default_client().alerts()
+    except PrometheusError as e:
         return None, str(e)
 
+    return {
+        'total': len(alerts),
+        'firing': [a for a in alerts if a.state == 'firing'],
+        'pending': [a for a in alerts if a.state == 'pending']
+    }, None
+
 def check_metrics_availability():
     """Check what metrics are available."""
     try:
         # Check for node metrics
-        response = requests.get(
-            f"{PROMETHEUS_URL}/api/v1/query",
-            params={'query': 'up{job=~"monitoring_stack|remote_hosts|remote_docker|remote_mysql"}'},
-            timeout=5
-        )
-        
-        if response.status_code != 200:
-            return None, "Prometheus query API not accessible"
-        
-        data = response.json().get('data', {})
-        results = data.get('result', [])
-        
-        metrics = {}
-        for r in results:
-            job = r['metric'].get('job', 'unknown')
-            instance = r['metric'].get('instance', 'unknown')
-            value = r['value'][1]
-            metrics[f"{job}/{instance}"] = value == '1'
-        
-        return metrics, None
-    except Exception as e:
+        samples = default_client().query('up{job=~"monitoring_stack|remote_hosts|remote_docker|remote_mysql"}')
+    except PrometheusError as e:
         return None, str(e)
 
+    metrics = {}
+    for sample in samples:
+        job = sample.labels.get('job', 'unknown')
+        instance = sample.labels.get('instance', 'unknown')
+        metrics[f"{job}/{instance}"] = sample.value == 1
+    return metrics, None
+
 def print_header(text):
     """Print a formatted header."""
     print(f"\n{'='*60}")
@@ -99,10 +70,16 @@ def main():
     print_header("System Status")
     
     overall_health = True
-    
+
+    # The three checks hit different API endpoints and don't depend on each other
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        targets_check = pool.submit(check_prometheus_targets)
+        alerts_check = pool.submit(check_active_alerts)
+        metrics_check = pool.submit(check_metrics_availability)
+
     # Check Prometheus targets
     print_section("📡 Prometheus Targets")
-    targets_data, error = check_prometheus_targets()
+    targets_data, error = targets_check.result()
     
     if error:
         print(f"✗ {error}")
@@ -115,19 +92,14 @@ def main():
             overall_health = False
             print("\nDown targets:")
             for target in targets_data['targets']:
-                if target.get('health') != 'up':
-                    labels = target.get('labels', {})
-                    job = labels.get('job', 'unknown')
-                    instance = labels.get('instance', 'unknown')
-                    health = target.get('health', 'unknown')
-                    last_error = target.get('lastError', 'N/A')
-                    print(f"  ✗ {job}/{instance} - {health}")
-                    if last_error and last_error != 'N/A':
-                        print(f"    Error: {last_error}")
+                if target.health != 'up':
+                    print(f"  ✗ {target.job}/{target.instance} - {target.health}")
+                    if target.last_error:
+                        print(f"    Error: {target.last_error}")
     
     # Check active alerts
     print_section("🔔 Active Alerts")
-    alerts_data, error = check_active_alerts()
+    alerts_data, error = alerts_check.result()
     
     if error:
         print(f"✗ {error}")
@@ -136,23 +108,19 @@ def main():
         if alerts_data['firing']:
             print(f"🔥 Firing: {len(alerts_data['firing'])}")
             for alert in alerts_data['firing']:
-                name = alert['labels'].get('alertname', 'unknown')
-                severity = alert['labels'].get('severity', 'unknown')
-                summary = alert['annotations'].get('summary', 'No summary')
-                print(f"  ✗ [{severity.upper()}] {name}")
-                print(f"    {summary}")
+                print(f"  ✗ [{alert.severity.upper()}] {alert.name}")
+                print(f"    {alert.summary}")
         else:
             print("✓ No firing alerts")
         
         if alerts_data['pending']:
             print(f"⏱️  Pending: {len(alerts_data['pending'])}")
             for alert in alerts_data['pending']:
-                name = alert['labels'].get('alertname', 'unknown')
-                print(f"  ⏱️  {name}")
+                print(f"  ⏱️  {alert.name}")
     
     #Check metrics availability
     print_section("📊 Metrics Availability")
-    metrics, error = check_metrics_availability()
+    metrics, error = metrics_check.result()
     
     if error:
         print(f"✗ {error}")
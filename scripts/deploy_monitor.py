@@ -1,9 +1,24 @@
+import hashlib
 import json
 import os
 import subprocess
 import sys
 import time
 import argparse
+import re
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+
+import http_probe
+import ssh_pool
+import target_files
+from exporter_artifacts import ArtifactCache, download_command
+from exposition import SERIES_LIMIT, ExpositionParser
+from run_log import RunLog, completed_hosts, latest_log
+from prometheus_api import PROMETHEUS_URL, default_client
+from target_health import TargetHealth
 # from fix_dashboards import fix_dashboards
 
 # Paths
@@ -11,8 +26,10 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 HOSTS_FILE = os.path.join(BASE_DIR, 'hosts.txt')
 TARGETS_FILE = os.path.join(BASE_DIR, 'prometheus', 'targets.json')
 
-# Node Exporter Version
+# Exporter Versions
 NODE_EXPORTER_VERSION = "1.8.2"
+CADVISOR_VERSION = "v0.47.0"
+MYSQLD_EXPORTER_VERSION = "0.15.1"
 
 # CADVISOR Port
 CADVISOR_PORT = "9991"
@@ -20,11 +37,128 @@ CADVISOR_PORT = "9991"
 # Default Username
 USERNAME = "root"
 
+# Host facts cache (see gather_facts)
+FACTS_CACHE_FILE = os.path.join(BASE_DIR, '.host_facts.json')
+FACTS_TTL = 3600
+
+# One remote script that reports everything deploy_host needs to know about a host as JSON
+FACTS_ESC = r"""
+esc() { printf '%s' "$1" | tr -d '\r' | tr '\n' ' ' | sed 's/\\/\\\\/g; s/"/\\"/g'; }
+"""
+
+# Facts that don't change between deploys; cached for FACTS_TTL
+FACTS_STATIC_SCRIPT = r"""
+os=$(. /etc/os-release 2>/dev/null; echo "$PRETTY_NAME")
+arch=$(uname -m)
+host=$(hostname 2>/dev/null || cat /etc/hostname 2>/dev/null)
+virt=$(systemd-detect-virt 2>/dev/null)
+grep -qa 'container=lxc' /proc/1/environ 2>/dev/null && virt=lxc
+pve=$(cat /etc/pve/.version 2>/dev/null)
+printf '{"os":"%s","arch":"%s","hostname":"%s","virt":"%s","pve_version":"%s"}\n' \
+  "$(esc "$os")" "$(esc "$arch")" "$(esc "$host")" "$(esc "$virt")" "$(esc "$pve")"
+"""
+
+# Listening ports and services drive the plan and change with every deploy; probed every run
+FACTS_DYNAMIC_SCRIPT = r"""
+ports=$( (ss -tlnH 2>/dev/null || netstat -tln 2>/dev/null | tail -n +3) | awk '{print $4}' | sed 's/.*://' | grep -E '^[0-9]+$' | sort -un | tr '\n' ',' | sed 's/,$//')
+docker=$(docker --version 2>/dev/null)
+docker_mysql=$(docker ps --format '{{.Image}} {{.Names}}' 2>/dev/null | grep -E 'mysql|mariadb' | head -1)
+mysql=$(systemctl is-active mysql 2>/dev/null || systemctl is-active mariadb 2>/dev/null)
+postgres=$(systemctl is-active postgresql 2>/dev/null)
+printf '{"ports":[%s],"docker":"%s","docker_mysql":"%s","mysql":"%s","postgres":"%s"}\n' \
+  "$ports" "$(esc "$docker")" "$(esc "$docker_mysql")" "$(esc "$mysql")" "$(esc "$postgres")"
+"""
+
+_facts_lock = threading.Lock()
+_facts_cache = None
+
+# Per-host SSH user (user@ip entries in hosts.txt), so concurrent hosts never share state
+HOST_USERS = {}
+
+# Hosts deployed at once (--parallel)
+DEFAULT_PARALLEL = 8
+
+# How exporter binaries reach hosts (--artifacts): 'push' streams them over SSH from the
+# local cache, 'http' has hosts fetch them from this machine, 'download' wgets from GitHub per host
+ARTIFACT_MODE = "push"
+ARTIFACT_PORT = 9993
+_artifact_cache = None
+_target_health = None
+
+# Staged rollouts (--rollout): how long each stage soaks before it is judged, and how much
+# slower a host may scrape than before the upgrade
+ROLLOUT_SOAK = 60
+ROLLOUT_MAX_REGRESSION = 1.5
+
+# JSON-lines log of the current run (see run_log.py) and per-host step timings
+RUN_LOG = None
+_host_steps = {}
+_steps_lock = threading.Lock()
+
+def ssh_user(ip):
+    """SSH user for a host: its hosts.txt entry, else the default --username."""
+    return HOST_USERS.get(ip, USERNAME)
+
+def sudo_prefix(ip):
+    return "sudo " if ssh_user(ip) != "root" else ""
+
+@contextmanager
+def timed_step(ip, step):
+    """Time one deployment step for a host and stream it to the run log."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        seconds = round(time.monotonic() - started, 3)
+        with _steps_lock:
+            steps = _host_steps.setdefault(ip, {})
+            steps[step] = round(steps.get(step, 0) + seconds, 3)
+        if RUN_LOG:
+            RUN_LOG.event('step', ip=ip, step=step, seconds=seconds)
+
+class HostOutput:
+    """stdout proxy that buffers each deploy thread's output so hosts print as whole blocks."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.local.buffer = []
+
+    def finish(self):
+        """Print the calling thread's buffered output in one piece."""
+        text = ''.join(getattr(self.local, 'buffer', None) or [])
+        self.local.buffer = None
+        with self.lock:
+            self.stream.write(text)
+            self.stream.flush()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is not None:
+            buffer.append(text)
+            return len(text)
+        with self.lock:
+            return self.stream.write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
 def test_ssh_connection(ip, username='root'):
     """Test if SSH key authentication is working."""
     if ip in ('127.0.0.1', 'localhost'):
         return True  # Localhost doesn't need SSH
     
+    # Opening the pooled session authenticates once; later commands reuse it
+    if ssh_pool.ENABLED:
+        return ssh_pool.ensure_master(username, ip)
+    
     try:
         result = subprocess.run([
             'ssh',
@@ -40,59 +174,103 @@ def test_ssh_connection(ip, username='root'):
     except:
         return False
 
-def detect_proxmox_guest(ip):
+def load_facts_cache():
+    global _facts_cache
+    if _facts_cache is None:
+        try:
+            with open(FACTS_CACHE_FILE, 'r') as f:
+                _facts_cache = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _facts_cache = {}
+    return _facts_cache
+
+def save_facts_cache():
+    """Write the facts cache, dropping expired entries."""
+    with _facts_lock:
+        cache = load_facts_cache()
+        now = time.time()
+        fresh = {k: v for k, v in cache.items() if v.get('expires', 0) > now}
+        tmp = f"{FACTS_CACHE_FILE}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(fresh, f, indent=2)
+            os.replace(tmp, FACTS_CACHE_FILE)
+        except OSError as e:
+            print(f"⚠️  Could not save host facts cache: {e}")
+
+def gather_facts(ip, refresh=False):
+    """OS, arch, virtualization, PVE version, listening ports and services in one SSH round trip.
+
+    The static facts (OS, arch, virtualization) are cached per user@host for
+    FACTS_TTL seconds; ports and services are probed every time. Returns {} if
+    the probe failed.
+    """
+    key = f"{ssh_user(ip)}@{ip}"
+    with _facts_lock:
+        entry = load_facts_cache().get(key)
+    static = entry['facts'] if entry and not refresh and entry.get('expires', 0) > time.time() else None
+
+    script = FACTS_ESC + (FACTS_STATIC_SCRIPT if static is None else '') + FACTS_DYNAMIC_SCRIPT
+    output = ssh_command(ip, script, check=False) or ''
+    try:
+        lines = output.strip().splitlines()
+        facts = json.loads(lines[-1])
+        if static is None:
+            static = json.loads(lines[-2])
+    except (IndexError, ValueError):
+        print(f"[{ip}] Could not gather host facts")
+        return {}
+    if not static.get('arch'):
+        print(f"[{ip}] Host facts are incomplete (no architecture)")
+        return {}
+
+    with _facts_lock:
+        if not entry or entry['facts'] is not static:
+            load_facts_cache()[key] = {'facts': static, 'expires': time.time() + FACTS_TTL}
+    return {**static, **facts}
+
+def detect_proxmox_guest(ip, facts=None):
     """Detect if the host is a Proxmox LXC or VM."""
     if ip in ('127.0.0.1', 'localhost'):
         return {'is_proxmox_guest': False, 'guest_type': None, 'vmid': None}
 
+    facts = gather_facts(ip) if facts is None else facts
     guest_info = {
         'is_proxmox_guest': False,
         'guest_type': None,  # 'lxc' or 'qemu'
         'vmid': None
     }
 
-    # Check if running inside LXC
-    lxc_check = ssh_command(ip, "test -f /proc/1/environ && grep -q 'container=lxc' /proc/1/environ && echo 'lxc' || echo 'not_lxc'", check=False)
-    if lxc_check and 'lxc' in lxc_check.strip():
+    # Running inside LXC
+    if facts.get('virt') == 'lxc':
         guest_info['is_proxmox_guest'] = True
         guest_info['guest_type'] = 'lxc'
-
-        # Try to get VMID from hostname or systemd
-        vmid_check = ssh_command(ip, "cat /etc/hostname 2>/dev/null || hostname", check=False)
-        if vmid_check:
-            guest_info['vmid'] = vmid_check.strip()
-
+        guest_info['vmid'] = facts.get('hostname') or None
         print(f"   📦 LXC Container detected (ID: {guest_info['vmid']})")
         return guest_info
 
-    # Check if running inside QEMU/KVM (VM)
-    qemu_check = ssh_command(ip, "systemd-detect-virt 2>/dev/null", check=False)
-    if qemu_check and 'kvm' in qemu_check.lower():
+    # Running inside QEMU/KVM (VM)
+    if 'kvm' in facts.get('virt', '').lower():
         guest_info['is_proxmox_guest'] = True
         guest_info['guest_type'] = 'qemu'
-
-        hostname_check = ssh_command(ip, "hostname", check=False)
-        if hostname_check:
-            guest_info['vmid'] = hostname_check.strip()
-
+        guest_info['vmid'] = facts.get('hostname') or None
         print(f"   🖥️  QEMU/KVM VM detected (Name: {guest_info['vmid']})")
         return guest_info
 
-    # Check if it's the Proxmox host itself
-    pve_check = ssh_command(ip, "test -f /etc/pve/.version && cat /etc/pve/.version 2>/dev/null", check=False)
-    if pve_check:
-        print(f"   🏢 Proxmox VE Host detected (Version: {pve_check.strip()})")
-        guest_info['is_proxmox_guest'] = False
+    # The Proxmox host itself
+    if facts.get('pve_version'):
+        print(f"   🏢 Proxmox VE Host detected (Version: {facts['pve_version']})")
         guest_info['guest_type'] = 'proxmox_host'
         return guest_info
 
     return guest_info
 
-def detect_services(ip):
+def detect_services(ip, facts=None):
     """Detect what services are running on the target host."""
     if ip in ('127.0.0.1', 'localhost'):
         return {'docker': False, 'mysql': False, 'postgresql': False}
 
+    facts = gather_facts(ip) if facts is None else facts
     services = {
         'docker': False,
         'mysql': False,
@@ -101,30 +279,19 @@ def detect_services(ip):
 
     print(f"🔍 Detecting services on {ip}...")
     
-    # Check for Docker
-    docker_check = ssh_command(ip, "docker --version 2>/dev/null", check=True)
-    if docker_check and "Docker version" in docker_check:
+    # Docker
+    if "Docker version" in facts.get('docker', ''):
         services['docker'] = True
         print(f"   ✓ Docker detected")
     
-    # Check for MySQL/MariaDB (Systemd, Docker, or Port 3306)
-    mysql_check = ssh_command(ip, "systemctl is-active mysql 2>/dev/null || systemctl is-active mariadb 2>/dev/null", check=True)
-    mysql_docker_check = ""
-    if services['docker']:
-        mysql_docker_check = ssh_command(ip, "docker ps --format '{{.Image}} {{.Names}}' | grep -E 'mysql|mariadb' || true", check=True)
-    
-    # Also check TCP port 3306 (more reliable for custom Docker containers)
-    mysql_port_check = ssh_command(ip, "netstat -tuln | grep :3306 || ss -tuln | grep :3306 || true", check=True)
-
-    if (mysql_check and mysql_check.strip() == "active") or \
-       (mysql_docker_check and mysql_docker_check.strip()) or \
-       (mysql_port_check and "3306" in mysql_port_check):
+    # MySQL/MariaDB (Systemd, Docker, or Port 3306 - more reliable for custom Docker containers)
+    if ('active' in facts.get('mysql', '').split() or facts.get('docker_mysql')
+            or 3306 in facts.get('ports', [])):
         services['mysql'] = True
         print(f"   ✓ MySQL/MariaDB detected")
     
-    # Check for PostgreSQL
-    postgres_check = ssh_command(ip, "systemctl is-active postgresql 2>/dev/null", check=True)
-    if postgres_check and "active" in postgres_check:
+    # PostgreSQL
+    if 'active' in facts.get('postgres', '').split():
         services['postgresql'] = True
         print(f"   ✓ PostgreSQL detected")
     
@@ -151,18 +318,10 @@ def load_hosts():
     return hosts
 
 def load_targets():
-    if not os.path.exists(TARGETS_FILE):
-        return []
-    try:
-        with open(TARGETS_FILE, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+    return target_files.read_targets(TARGETS_FILE)
 
 def save_targets(targets):
-    os.makedirs(os.path.dirname(TARGETS_FILE), exist_ok=True)
-    with open(TARGETS_FILE, 'w') as f:
-        json.dump(targets, f, indent=2)
+    return target_files.write_targets(TARGETS_FILE, targets)
 
 def is_target_configured(ip, targets):
     target_str = f"{ip}:9100"
@@ -191,89 +350,37 @@ def add_target(ip, targets):
         })
     return targets
 
-def add_docker_target(ip):
-    """Add cAdvisor target for Docker monitoring."""
-    docker_targets_file = os.path.join(BASE_DIR, 'prometheus', 'docker_targets.json')
-    
-    # Load existing targets
-    if os.path.exists(docker_targets_file):
-        with open(docker_targets_file, 'r') as f:
-            try:
-                targets = json.load(f)
-            except json.JSONDecodeError:
-                targets = []
-    else:
-        targets = []
-    
-    target_str = f"{ip}:{CADVISOR_PORT}"
-    
-    # Check if target already exists
-    found = False
-    for t in targets:
-        if target_str in t.get('targets', []):
-            return
-        if t.get('labels', {}).get('job') == 'remote_docker':
-            if target_str not in t['targets']:
+def add_exporter_target(targets_file, target_str, job):
+    """Add an exporter target to a file_sd file; returns False if it was already there."""
+    def update(targets):
+        for t in targets:
+            if target_str in t.get('targets', []):
+                return
+            if t.get('labels', {}).get('job') == job:
                 t['targets'].append(target_str)
-            found = True
-            break
-    
-    if not found:
+                return
         targets.append({
             "targets": [target_str],
             "labels": {
                 "env": "internal"
             }
         })
-    
-    # Save targets
-    os.makedirs(os.path.dirname(docker_targets_file), exist_ok=True)
-    with open(docker_targets_file, 'w') as f:
-        json.dump(targets, f, indent=2)
-    
-    print(f"✅ Added Docker target: {target_str}")
+
+    return target_files.update_targets(targets_file, update)
+
+def add_docker_target(ip):
+    """Add cAdvisor target for Docker monitoring."""
+    docker_targets_file = os.path.join(BASE_DIR, 'prometheus', 'docker_targets.json')
+    target_str = f"{ip}:{CADVISOR_PORT}"
+    if add_exporter_target(docker_targets_file, target_str, 'remote_docker'):
+        print(f"✅ Added Docker target: {target_str}")
 
 def add_mysql_target(ip):
     """Add MySQL exporter target for database monitoring."""
     mysql_targets_file = os.path.join(BASE_DIR, 'prometheus', 'mysql_targets.json')
-    
-    # Load existing targets
-    if os.path.exists(mysql_targets_file):
-        with open(mysql_targets_file, 'r') as f:
-            try:
-                targets = json.load(f)
-            except json.JSONDecodeError:
-                targets = []
-    else:
-        targets = []
-    
     target_str = f"{ip}:9104"
-    
-    # Check if target already exists
-    found = False
-    for t in targets:
-        if target_str in t.get('targets', []):
-            return
-        if t.get('labels', {}).get('job') == 'remote_mysql':
-            if target_str not in t['targets']:
-                t['targets'].append(target_str)
-            found = True
-            break
-    
-    if not found:
-        targets.append({
-            "targets": [target_str],
-            "labels": {
-                "env": "internal"
-            }
-        })
-    
-    # Save targets
-    os.makedirs(os.path.dirname(mysql_targets_file), exist_ok=True)
-    with open(mysql_targets_file, 'w') as f:
-        json.dump(targets, f, indent=2)
-    
-    print(f"✅ Added MySQL target: {target_str}")
+    if add_exporter_target(mysql_targets_file, target_str, 'remote_mysql'):
+        print(f"✅ Added MySQL target: {target_str}")
 
 def ssh_command(ip, cmd, check=False):
     """Execute command locally or via SSH"""
@@ -298,11 +405,10 @@ def ssh_command(ip, cmd, check=False):
             print(f"[{ip}] Exception: {e}")
             return None
     else:
-        # Executar remotamente via SSH
-        ssh_cmd = ["ssh", "-o", "StrictHostKeyChecking=no", "-o", "ConnectTimeout=5", f"{USERNAME}@{ip}", cmd]
+        # Executar remotamente via SSH (reusing the host's pooled session)
         # If on Windows, we might need to ensure ssh is available, but usually it is in modern Win10/11
         try:
-            result = subprocess.run(ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            result = ssh_pool.run(ssh_user(ip), ip, cmd)
             if check and result.returncode != 0:
                 # Only show error if not a check command
                 if not cmd.startswith('ls ') and not cmd.startswith('systemctl is-active'):
@@ -315,88 +421,49 @@ def ssh_command(ip, cmd, check=False):
                 print(f"[{ip}] TIP: Ensure SSH is enabled and authorized_keys is configured for root.")
             return None
 
-def install_node_exporter(ip, arch="amd64"):
-    """Install Node Exporter on the given IP"""
-    print(f"🔧 Installing Node Exporter on {ip}...")
-    
-    # Skip localhost - it's already monitored by the node-exporter container
-    if ip in ('127.0.0.1', 'localhost'):
-        print(f"⏭️  Skipping {ip} - already monitored by node-exporter service")
-        return True
-    
-    # Check if Node Exporter is already installed and running
-    # check=False because is-active returns non-zero if not active, we want to handle that string
-    check_cmd = "systemctl is-active node_exporter"
-    status = ssh_command(ip, check_cmd, check=False)
-    
-    if status and status.strip() == "active":
-        print(f"✓ Node Exporter already running on {ip}")
-        return True
-    
-    should_reinstall = False
-    
-    if status and ("failed" in status or "activating" in status):
-        print(f"⚠️  Node Exporter service is in state: {status.strip()}. Scheduling clean reinstall...")
-        should_reinstall = True
-    elif status and "inactive" in status:
-        print(f"ℹ️  Node Exporter service exists but is inactive. Attempting to start...")
-        ssh_command(ip, "systemctl start node_exporter", check=True)
-        time.sleep(2)
-        # Check again
-        new_status = ssh_command(ip, check_cmd, check=False)
-        if new_status and new_status.strip() == "active":
-             print(f"✓ Node Exporter started successfully")
-             return True
-        else:
-             print(f"⚠️  Failed to start existing service (Status: {new_status.strip() if new_status else 'Unknown'}). Scheduling clean reinstall...")
-             should_reinstall = True
-             
-    if should_reinstall:
-        # Force stop and cleanup to allow fresh install
-        print(f"   🧹 Removing old service and binary...")
-        ssh_command(ip, "systemctl stop node_exporter", check=False)
-        ssh_command(ip, "systemctl disable node_exporter", check=False)
-        ssh_command(ip, "rm -f /etc/systemd/system/node_exporter.service", check=False)
-        ssh_command(ip, "rm -f /usr/local/bin/node_exporter", check=False)
-        # Proceed to installation logic below...
+def artifact_cache():
+    global _artifact_cache
+    if _artifact_cache is None:
+        _artifact_cache = ArtifactCache()
+    return _artifact_cache
+
+def local_address(ip):
+    """Address of this machine on the route to ip (what a host uses to reach the artifact server)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((ip, 9))
+        return s.getsockname()[0]
+
+def deliver_binary(ip, name, version, arch, dest):
+    """Install an exporter binary on a host from the local artifact cache."""
+    try:
+        # Downloaded and verified once per fleet; later hosts reuse the cached copy
+        path, digest = artifact_cache().get(name, version, arch)
+    except Exception as e:
+        print(f"[{ip}] Could not fetch {name} {version} ({arch}): {e}")
+        return False
+
+    sudo = sudo_prefix(ip)
+    # The host re-checks the hash before the binary replaces the installed one
+    tmp = f"tmp=/tmp/.{name}.$$; "
+    install = (f"echo \"{digest}  $tmp\" | sha256sum -c --status && {sudo}install -m 0755 \"$tmp\" {dest}; "
+               f"rc=$?; rm -f \"$tmp\"; exit $rc")
+    if ARTIFACT_MODE == 'http':
+        url = f"http://{local_address(ip)}:{ARTIFACT_PORT}/sha256/{digest}"
+        print(f"[{ip}] Fetching {name} from {url}...")
+        cmd = f"{tmp}(wget -qO \"$tmp\" {url} || curl -fsSo \"$tmp\" {url}) && {install}"
+        result = ssh_pool.run(ssh_user(ip), ip, cmd, timeout=300)
     else:
-        # Check if binary exists but service isn't running (and wasn't just checked above)
-        check_bin_cmd = "ls /usr/local/bin/node_exporter"
-        res_bin = ssh_command(ip, check_bin_cmd, check=False)
-        
-        if res_bin and "/usr/local/bin/node_exporter" in res_bin:
-            print(f"[{ip}] Node Exporter binary found, but service not active/configured. Starting/Enabling...")
-            sudo = "sudo " if USERNAME != "root" else ""
-            res = ssh_command(ip, f"{sudo}systemctl daemon-reload && {sudo}systemctl start node_exporter && {sudo}systemctl enable node_exporter", check=False)
-            
-            # Verify if it actually started
-            time.sleep(2)
-            final_status = ssh_command(ip, check_cmd, check=False)
-            if final_status and final_status.strip() == "active":
-                return True
-            else:
-                print(f"⚠️  Failed to start existing binary. It might be corrupted. Proceeding with reinstall...")
-                # Cleanup
-                ssh_command(ip, "rm -f /usr/local/bin/node_exporter", check=False)
+        print(f"[{ip}] Pushing {name} {version} ({arch}, {os.path.getsize(path) // 1024} KiB)...")
+        result = ssh_pool.push(ssh_user(ip), ip, path, f"{tmp}cat > \"$tmp\" && {install}", timeout=300)
 
+    if result.returncode != 0:
+        print(f"[{ip}] Failed to install {name} binary: {result.stderr.strip() or 'checksum mismatch'}")
+        return False
+    return True
 
-    print(f"[{ip}] Installing Node Exporter v{NODE_EXPORTER_VERSION} ({arch})...")
-    
-    # Check for wget if running locally and installation is needed
-    if ip in ("127.0.0.1", "localhost"):
-        res_wget = ssh_command(ip, "wget --version")
-        if not res_wget:
-            print(f"[{ip}] Warning: 'wget' is not installed. If Node Exporter download is needed, this will fail.")
-    
-    # Installation commands
-    sudo = "sudo " if USERNAME != "root" else ""
-    commands = [
-        f"cd /tmp && wget -q https://github.com/prometheus/node_exporter/releases/download/v{NODE_EXPORTER_VERSION}/node_exporter-{NODE_EXPORTER_VERSION}.linux-{arch}.tar.gz",
-        f"cd /tmp && tar xvfz node_exporter-{NODE_EXPORTER_VERSION}.linux-{arch}.tar.gz",
-        f"{sudo}mv /tmp/node_exporter-{NODE_EXPORTER_VERSION}.linux-{arch}/node_exporter /usr/local/bin/",
-        "rm -rf /tmp/node_exporter-*",
-        f"{sudo}useradd -rs /bin/false node_exporter 2>/dev/null || true",
-        f"""echo '[Unit]
+# Desired state of every exporter deploy_monitor manages; reconcile_host compares it
+# with what a host actually has and applies only the difference
+NODE_EXPORTER_UNIT = """[Unit]
 Description=Node Exporter
 After=network.target
 
@@ -407,42 +474,10 @@ Type=simple
 ExecStart=/usr/local/bin/node_exporter
 
 [Install]
-WantedBy=multi-user.target' | {sudo}tee /etc/systemd/system/node_exporter.service > /dev/null""",
-        f"{sudo}systemctl daemon-reload",
-        f"{sudo}systemctl start node_exporter",
-        f"{sudo}systemctl enable node_exporter"
-    ]
-    
-    for i, cmd in enumerate(commands):
-        print(f"[{ip}] Step {i+1}/{len(commands)}: Running...")
-        result = ssh_command(ip, cmd, check=True)
-        if result is None:
-            print(f"[{ip}] Installation failed at step {i+1}")
-            return False
-            
-    print(f"[{ip}] Installation successful.")
-    return True
+WantedBy=multi-user.target
+"""
 
-def install_cadvisor(ip):
-    """Install cAdvisor for Docker container monitoring."""
-    print(f"🐳 Installing cAdvisor on {ip}...")
-    
-    # Check if already running
-    check_cmd = "systemctl is-active cadvisor"
-    if ssh_command(ip, check_cmd, check=True) and ssh_command(ip, check_cmd, check=True).strip() == "active":
-        print(f"✓ cAdvisor already running on {ip}")
-        return True
-    
-    # cAdvisor version
-    cadvisor_version = "v0.47.0"
-    
-    # Installation commands
-    sudo = "sudo " if USERNAME != "root" else ""
-    commands = [
-        f"cd /tmp && wget -q https://github.com/google/cadvisor/releases/download/{cadvisor_version}/cadvisor-{cadvisor_version}-linux-amd64",
-        f"chmod +x /tmp/cadvisor-{cadvisor_version}-linux-amd64",
-        f"{sudo}mv /tmp/cadvisor-{cadvisor_version}-linux-amd64 /usr/local/bin/cadvisor",
-        f"""echo '[Unit]
+CADVISOR_UNIT = f"""[Unit]
 Description=cAdvisor
 After=network.target
 
@@ -452,61 +487,10 @@ ExecStart=/usr/local/bin/cadvisor -port={CADVISOR_PORT}
 Restart=always
 
 [Install]
-WantedBy=multi-user.target' | {sudo}tee /etc/systemd/system/cadvisor.service > /dev/null""",
-        f"{sudo}systemctl daemon-reload",
-        f"{sudo}systemctl start cadvisor",
-        f"{sudo}systemctl enable cadvisor"
-    ]
-    
-    for i, cmd in enumerate(commands):
-        print(f"[{ip}] Step {i+1}/{len(commands)}: Running...")
-        result = ssh_command(ip, cmd, check=True)
-        if result is None:
-            print(f"[{ip}] cAdvisor installation failed at step {i+1}")
-            return False
-            
-    print(f"[{ip}] cAdvisor installation successful.")
-    return True
+WantedBy=multi-user.target
+"""
 
-def install_mysqld_exporter(ip):
-    """Install MySQL/MariaDB exporter for database monitoring."""
-    print(f"🗄️  Installing MySQL Exporter on {ip}...")
-    
-    # Check if already running
-    check_cmd = "systemctl is-active mysqld_exporter"
-    if ssh_command(ip, check_cmd, check=True) and ssh_command(ip, check_cmd, check=True).strip() == "active":
-        print(f"✓ MySQL Exporter already running on {ip}")
-        return True
-    
-    # MySQL Exporter version
-    exporter_version = "0.15.1"
-    
-    # Create MySQL monitoring user
-    print(f"[{ip}] Creating MySQL monitoring user...")
-    sudo = "sudo " if USERNAME != "root" else ""
-    mysql_user_cmd = f"""{sudo}mysql -e "CREATE USER IF NOT EXISTS 'exporter'@'localhost' IDENTIFIED BY 'exporterpass' WITH MAX_USER_CONNECTIONS 3;
-GRANT PROCESS, REPLICATION CLIENT, SELECT ON *.* TO 'exporter'@'localhost';
-FLUSH PRIVILEGES;" 2>/dev/null || \
-{sudo}mariadb -e "CREATE USER IF NOT EXISTS 'exporter'@'localhost' IDENTIFIED BY 'exporterpass' WITH MAX_USER_CONNECTIONS 3;
-GRANT PROCESS, REPLICATION CLIENT, SELECT ON *.* TO 'exporter'@'localhost';
-FLUSH PRIVILEGES;" 2>/dev/null"""
-    
-    result = ssh_command(ip, mysql_user_cmd, check=True)
-    if result is None:
-        print(f"⚠️  Could not create MySQL user. Continuing anyway (may already exist)...")
-    
-    # Installation commands
-    sudo = "sudo " if USERNAME != "root" else ""
-    commands = [
-        f"cd /tmp && wget -q https://github.com/prometheus/mysqld_exporter/releases/download/v{exporter_version}/mysqld_exporter-{exporter_version}.linux-amd64.tar.gz",
-        f"cd /tmp && tar xzf mysqld_exporter-{exporter_version}.linux-amd64.tar.gz",
-        f"{sudo}mv /tmp/mysqld_exporter-{exporter_version}.linux-amd64/mysqld_exporter /usr/local/bin/",
-        "rm -rf /tmp/mysqld_exporter-*",
-        f"{sudo}useradd -rs /bin/false mysqld_exporter 2>/dev/null || true",
-        f"{sudo}mkdir -p /etc/mysqld_exporter",
-        f"""echo 'DATA_SOURCE_NAME="exporter:exporterpass@(localhost:3306)/"' | {sudo}tee /etc/mysqld_exporter/mysqld_exporter.env > /dev/null""",
-        f"{sudo}chmod 600 /etc/mysqld_exporter/mysqld_exporter.env",
-        f"""echo '[Unit]
+MYSQLD_EXPORTER_UNIT = """[Unit]
 Description=MySQL Exporter
 After=network.target
 
@@ -518,22 +502,254 @@ ExecStart=/usr/local/bin/mysqld_exporter --web.listen-address=:9104
 Restart=always
 
 [Install]
-WantedBy=multi-user.target' | {sudo}tee /etc/systemd/system/mysqld_exporter.service > /dev/null""",
-        f"{sudo}systemctl daemon-reload",
-        f"{sudo}systemctl start mysqld_exporter",
-        f"{sudo}systemctl enable mysqld_exporter"
+WantedBy=multi-user.target
+"""
+
+MYSQL_USER_SQL = """CREATE USER IF NOT EXISTS 'exporter'@'localhost' IDENTIFIED BY 'exporterpass' WITH MAX_USER_CONNECTIONS 3;
+GRANT PROCESS, REPLICATION CLIENT, SELECT ON *.* TO 'exporter'@'localhost';
+FLUSH PRIVILEGES;"""
+# 1 once the exporter user exists with its grants
+MYSQL_USER_CHECK_SQL = "SELECT COUNT(*) FROM mysql.user WHERE User='exporter' AND Host='localhost' AND Process_priv='Y'"
+
+EXPORTERS = {
+    'node_exporter': {
+        'label': 'Node Exporter',
+        'version': NODE_EXPORTER_VERSION,
+        'port': 9100,
+        'user': 'node_exporter',
+        'files': [('/etc/systemd/system/node_exporter.service', NODE_EXPORTER_UNIT, '644')],
+    },
+    'cadvisor': {
+        'label': 'cAdvisor',
+        'version': CADVISOR_VERSION,
+        'port': int(CADVISOR_PORT),
+        'user': None,
+        'files': [('/etc/systemd/system/cadvisor.service', CADVISOR_UNIT, '644')],
+    },
+    'mysqld_exporter': {
+        'label': 'MySQL Exporter',
+        'version': MYSQLD_EXPORTER_VERSION,
+        'port': 9104,
+        'user': 'mysqld_exporter',
+        'files': [
+            ('/etc/mysqld_exporter/mysqld_exporter.env',
+             'DATA_SOURCE_NAME="exporter:exporterpass@(localhost:3306)/"\n', '600'),
+            ('/etc/systemd/system/mysqld_exporter.service', MYSQLD_EXPORTER_UNIT, '644'),
+        ],
+        # Idempotent; planned whenever setup_check fails, so a failed attempt is retried next run
+        'setup': f'mysql -e "{MYSQL_USER_SQL}" 2>/dev/null || {{sudo}}mariadb -e "{MYSQL_USER_SQL}" 2>/dev/null',
+        'setup_check': (f'{{{{ {{sudo}}mysql -N -e "{MYSQL_USER_CHECK_SQL}" 2>/dev/null'
+                        f' || {{sudo}}mariadb -N -e "{MYSQL_USER_CHECK_SQL}" 2>/dev/null; }}}} | grep -qx 1'),
+    },
+}
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def state_probe(names, sudo):
+    """One remote script reporting binary/file hashes, service, port and firewall state as key=value lines."""
+    lines = [
+        "fw=none",
+        f"if {sudo}ufw status 2>/dev/null | grep -q '^Status: active'; then fw=ufw",
+        f"elif {sudo}firewall-cmd --state >/dev/null 2>&1; then fw=firewalld; fi",
+        'echo "firewall=$fw"',
+        "echo \"ports=$( (ss -tlnH 2>/dev/null || netstat -tln 2>/dev/null | tail -n +3) | awk '{print $4}' | sed 's/.*://' | sort -un | tr '\\n' ',')\"",
     ]
-    
-    for i, cmd in enumerate(commands):
-        print(f"[{ip}] Step {i+1}/{len(commands)}: Running...")
-        result = ssh_command(ip, cmd, check=True)
-        if result is None:
-            print(f"[{ip}] MySQL Exporter installation failed at step {i+1}")
+    for name in names:
+        spec = EXPORTERS[name]
+        port = spec['port']
+        lines.append(f"echo \"{name}.binary=$({sudo}sha256sum /usr/local/bin/{name} 2>/dev/null | awk '{{print $1}}')\"")
+        for path, _, _ in spec['files']:
+            lines.append(f"echo \"{name}.file:{path}=$({sudo}sha256sum {path} 2>/dev/null | awk '{{print $1}}')\"")
+        lines.append(f'echo "{name}.active=$(systemctl is-active {name} 2>/dev/null)"')
+        lines.append(f'echo "{name}.enabled=$(systemctl is-enabled {name} 2>/dev/null)"')
+        if spec['user']:
+            lines.append(f'if id -u {spec["user"]} >/dev/null 2>&1; then echo "{name}.user=yes"; fi')
+        if spec.get('setup_check'):
+            lines.append(f'if {spec["setup_check"].format(sudo=sudo)}; then echo "{name}.setup=yes"; fi')
+        # if/then rather than &&: a failed check must not become the script's exit status
+        lines.append(
+            f"case $fw in "
+            f"ufw) if {sudo}ufw status 2>/dev/null | grep -qE '^{port}(/tcp)?[[:space:]].*ALLOW'; then echo \"{name}.firewall=open\"; fi ;; "
+            f"firewalld) if {sudo}firewall-cmd --query-port={port}/tcp >/dev/null 2>&1; then echo \"{name}.firewall=open\"; fi ;; "
+            f"*) echo \"{name}.firewall=open\" ;; esac")
+    lines.append("exit 0")
+    return "\n".join(lines)
+
+def read_state(ip, names):
+    """Actual state of the given exporters on a host, in one SSH round trip."""
+    output = ssh_command(ip, state_probe(names, sudo_prefix(ip)), check=True)
+    if output is None:
+        return None
+    state = {'firewall': 'none', 'ports': set()}
+    for name in names:
+        state[name] = {'files': {}}
+    for line in output.splitlines():
+        key, _, value = line.strip().partition('=')
+        if key == 'firewall':
+            state['firewall'] = value
+        elif key == 'ports':
+            state['ports'] = {int(p) for p in value.split(',') if p.isdigit()}
+        elif '.' in key:
+            name, _, field = key.partition('.')
+            if name not in state:
+                continue
+            if field.startswith('file:'):
+                state[name]['files'][field[5:]] = value
+            else:
+                state[name][field] = value
+    return state
+
+def desired_binary_hash(ip, name, arch):
+    """SHA-256 the host's binary should have (None if it cannot be known locally)."""
+    version = EXPORTERS[name]['version']
+    if ARTIFACT_MODE == 'download':
+        return artifact_cache().known_digest(name, version, arch)
+    try:
+        return artifact_cache().get(name, version, arch)[1]
+    except Exception as e:
+        print(f"[{ip}] Could not fetch {name} {version} ({arch}), not checking its binary: {e}")
+        return None
+
+def plan_exporter(ip, name, arch, state):
+    """Actions needed to bring one exporter from its actual to its desired state."""
+    spec = EXPORTERS[name]
+    actual = state[name]
+    actions = []
+
+    desired = desired_binary_hash(ip, name, arch)
+    binary = actual.get('binary')
+    if not binary or (desired and binary != desired):
+        actions.append('binary')
+    if spec['user'] and actual.get('user') != 'yes':
+        actions.append('user')
+    changed_files = [path for path, content, _ in spec['files']
+                     if actual['files'].get(path) != sha256_text(content)]
+    if spec.get('setup') and actual.get('setup') != 'yes':
+        actions.append('setup')
+    actions += [f"file:{path}" for path in changed_files]
+    if any(path.endswith('.service') for path in changed_files):
+        actions.append('daemon-reload')
+    # Enabling or opening the firewall alone doesn't need a restart
+    if (actions or actual.get('active') != 'active'
+            or spec['port'] not in state['ports']):
+        actions.append('restart')
+    if actual.get('enabled') != 'enabled':
+        actions.append('enable')
+    if state['firewall'] != 'none' and actual.get('firewall') != 'open':
+        actions.append('firewall')
+    return actions
+
+def describe_action(name, action, state):
+    spec = EXPORTERS[name]
+    if action == 'binary':
+        return f"install {name} {spec['version']} binary"
+    if action == 'user':
+        return f"create system user {spec['user']}"
+    if action == 'setup':
+        return "create MySQL monitoring user"
+    if action.startswith('file:'):
+        path = action[5:]
+        return f"{'update' if state[name]['files'].get(path) else 'write'} {path}"
+    if action == 'restart':
+        return f"restart {name}" if state[name].get('active') == 'active' else f"start {name}"
+    if action == 'firewall':
+        return f"open port {spec['port']}/tcp in {state['firewall']}"
+    return f"{action} {name}" if action == 'enable' else action
+
+def apply_actions(ip, name, arch, actions, state):
+    """Apply a planned change set; returns True if every step succeeded."""
+    spec = EXPORTERS[name]
+    sudo = sudo_prefix(ip)
+
+    if 'binary' in actions:
+        dest = f"/usr/local/bin/{name}"
+        # Keep the binary being replaced so a failed rollout stage can be rolled back
+        if state[name].get('binary') and ssh_command(ip, f"{sudo}cp -p {dest} {dest}.previous", check=True) is None:
             return False
-            
-    print(f"[{ip}] MySQL Exporter installation successful.")
+        if ARTIFACT_MODE == 'download':
+            print(f"[{ip}] Downloading {name} {spec['version']} ({arch}) from GitHub...")
+            if ssh_command(ip, download_command(name, spec['version'], arch, dest, sudo), check=True) is None:
+                return False
+        elif not deliver_binary(ip, name, spec['version'], arch, dest):
+            return False
+
+    if 'setup' in actions:
+        if ssh_command(ip, sudo + spec['setup'].format(sudo=sudo), check=True) is None:
+            print(f"[{ip}] Could not create the MySQL monitoring user")
+            return False
+
+    # Everything else goes to the host as a single script
+    script = ["set -e"]
+    for action in actions:
+        if action == 'user':
+            script.append(f"{sudo}useradd -rs /bin/false {spec['user']} 2>/dev/null || id -u {spec['user']} >/dev/null")
+        elif action.startswith('file:'):
+            path = action[5:]
+            content, mode = next((c, m) for p, c, m in spec['files'] if p == path)
+            script.append(f"{sudo}mkdir -p {os.path.dirname(path)}")
+            script.append(f"{sudo}tee {path} > /dev/null <<'MONITORING_EOF'\n{content}MONITORING_EOF")
+            script.append(f"{sudo}chmod {mode} {path}")
+        elif action == 'daemon-reload':
+            script.append(f"{sudo}systemctl daemon-reload")
+        elif action == 'restart':
+            script.append(f"{sudo}systemctl restart {name}")
+        elif action == 'enable':
+            script.append(f"{sudo}systemctl enable {name} 2>/dev/null")
+        elif action == 'firewall':
+            if state['firewall'] == 'ufw':
+                script.append(f"{sudo}ufw allow {spec['port']}/tcp >/dev/null")
+            else:
+                script.append(f"{sudo}firewall-cmd --permanent --add-port={spec['port']}/tcp >/dev/null && {sudo}firewall-cmd --reload >/dev/null")
+    if len(script) > 1 and ssh_command(ip, "\n".join(script), check=True) is None:
+        return False
     return True
 
+def reconcile_host(ip, names, arch, apply=True):
+    """Bring the given exporters on a host to their desired state.
+
+    Returns {name: {'ok': bool, 'actions': [...], 'previous': hash}}; 'ok' means
+    the service is (or, without apply, already was) running as desired, and
+    'previous' is the hash of a binary that was replaced (None otherwise).
+    """
+    with timed_step(ip, 'probe'):
+        state = read_state(ip, names)
+    if state is None:
+        print(f"[{ip}] Could not read exporter state")
+        return {name: {'ok': False, 'actions': [], 'previous': None} for name in names}
+
+    results = {}
+    for name in names:
+        actions = plan_exporter(ip, name, arch, state)
+        results[name] = {'ok': not actions, 'actions': actions,
+                         'previous': state[name].get('binary') if apply and 'binary' in actions else None}
+        label = EXPORTERS[name]['label']
+        if not actions:
+            print(f"✓ {label} up to date on {ip}")
+            continue
+        print(f"📝 {label} on {ip}: {len(actions)} change(s)")
+        for action in actions:
+            print(f"   - {describe_action(name, action, state)}")
+        if apply:
+            with timed_step(ip, f"apply {name}"):
+                results[name]['ok'] = apply_actions(ip, name, arch, actions, state)
+            if not results[name]['ok']:
+                print(f"[{ip}] {label} changes failed")
+
+    # One check for every service that was (re)started
+    restarted = [name for name in names if apply and results[name]['ok'] and 'restart' in results[name]['actions']]
+    if restarted:
+        with timed_step(ip, 'restart check'):
+            time.sleep(2)
+            status = ssh_command(ip, f"systemctl is-active {' '.join(restarted)}", check=False) or ''
+        for name, line in zip(restarted, status.split() + [''] * len(restarted)):
+            if line != 'active':
+                print(f"⚠️  {EXPORTERS[name]['label']} did not start on {ip} (status: {line or 'unknown'})")
+                results[name]['ok'] = False
+            else:
+                print(f"[{ip}] {EXPORTERS[name]['label']} is running.")
+    return results
+
 def verify_cadvisor_running(ip):
     """Verify that cAdvisor is running and accessible."""
     print(f"🔍 Verifying cAdvisor on {ip}...")
@@ -557,97 +773,283 @@ def verify_cadvisor_running(ip):
     if docker_socket_check:
         print(f"   ✓ Docker socket accessible: {docker_socket_check.strip()}")
 
-    # Try to fetch metrics from cAdvisor
-    metrics_check = ssh_command(ip, f"curl -s http://localhost:{CADVISOR_PORT}/metrics | head -5", check=False)
-    if not metrics_check or "container_" not in metrics_check:
-        print(f"   ✗ cAdvisor metrics endpoint not responding correctly")
+    # Fetch and parse metrics from here, the way Prometheus will, up to the series budget
+    scan = ExpositionParser(max_series=SERIES_LIMIT)
+    metrics_check = http_probe.probe(ip, CADVISOR_PORT, timeout=10, parser=scan)
+    if not metrics_check['ok'] or not scan.has_family('container_'):
+        print(f"   ✗ cAdvisor metrics endpoint not responding correctly: {metrics_check['error'] or 'no container_* metrics'}")
         return False
-    print(f"   ✓ cAdvisor metrics endpoint responding")
+    print(f"   ✓ cAdvisor metrics endpoint responding ({metrics_check['latency'] * 1000:.0f} ms, "
+          f"{metrics_check['series']} series in {metrics_check['families']} families)")
+    if scan.error_count:
+        print(f"   ⚠️  {scan.error_count} malformed line(s) in cAdvisor output, e.g. {scan.errors[0]}")
+    for warning in scan.cardinality_warnings()[:5]:
+        print(f"   ⚠️  High cardinality: {warning}")
 
     return True
 
+def target_health():
+    global _target_health
+    if _target_health is None:
+        _target_health = TargetHealth()
+    return _target_health
+
 def verify_target_health(ip, timeout=30):
     """Verify that Prometheus can scrape the target."""
-    import requests
-    import time
-
     target_endpoint = f"{ip}:9100"
     if ip in ('127.0.0.1', 'localhost'):
         return True  # Skip localhost verification
 
     print(f"🔍 Verifying target health for {target_endpoint}...")
 
-    prometheus_url = "http://localhost:9990/api/v1/targets"
-    start_time = time.time()
-
-    while time.time() - start_time < timeout:
-        try:
-            response = requests.get(prometheus_url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                for target in data.get('data', {}).get('activeTargets', []):
-                    if target_endpoint in target.get('scrapeUrl', ''):
-                        health = target.get('health')
-                        if health == 'up':
-                            print(f"✓ Target {target_endpoint} is UP and healthy")
-                            return True
-                        else:
-                            print(f"⚠️  Target {target_endpoint} status: {health}")
-        except requests.exceptions.ConnectionError:
-            print(f"[{ip}] Prometheus not reachable at {prometheus_url}. Retrying...")
-        except Exception as e:
-            print(f"[{ip}] Error verifying target health: {e}")
-
-        time.sleep(2)
+    # Resolved from the target list snapshot shared by every host being deployed
+    status = target_health().wait(target_endpoint, timeout)
+    if status['resolved']:
+        print(f"✓ Target {target_endpoint} is UP and healthy")
+        return True
+    if status['error']:
+        print(f"[{ip}] Prometheus not reachable at {PROMETHEUS_URL}: {status['error']}")
+    elif status['found']:
+        print(f"⚠️  Target {target_endpoint} status: {status['health']}")
 
     print(f"⚠️  Could not verify target health within {timeout}s")
     return False
 
 def verify_prometheus_scraping(ip, port, job_name, timeout=30):
     """Verify that Prometheus can scrape a specific target endpoint."""
-    import requests
-    import time
-
     if ip in ('127.0.0.1', 'localhost'):
         return True
 
     target_endpoint = f"{ip}:{port}"
     print(f"🔍 Verifying Prometheus can scrape {target_endpoint} (job: {job_name})...")
 
-    prometheus_url = "http://localhost:9990/api/v1/targets"
-    start_time = time.time()
-
-    while time.time() - start_time < timeout:
-        try:
-            response = requests.get(prometheus_url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                for target in data.get('data', {}).get('activeTargets', []):
-                    scrape_url = target.get('scrapeUrl', '')
-                    if target_endpoint in scrape_url:
-                        health = target.get('health')
-                        last_error = target.get('lastError', '')
-
-                        if health == 'up':
-                            print(f"   ✓ Prometheus scraping {target_endpoint} successfully")
-                            return True
-                        else:
-                            print(f"   ✗ Prometheus scrape status: {health}")
-                            if last_error:
-                                print(f"   Error: {last_error}")
-                            return False
-        except requests.exceptions.ConnectionError:
-            pass  # Prometheus not ready yet
-        except Exception as e:
-            print(f"   ⚠️  Error checking Prometheus: {e}")
-
-        time.sleep(2)
+    status = target_health().wait(target_endpoint, timeout, want_up=False)
+    if status['health'] == 'up':
+        print(f"   ✓ Prometheus scraping {target_endpoint} successfully")
+        return True
+    if status['health'] == 'down':
+        print(f"   ✗ Prometheus scrape status: {status['health']}")
+        if status['last_error']:
+            print(f"   Error: {status['last_error']}")
+        return False
 
     print(f"   ⚠️  Could not verify Prometheus scraping within {timeout}s")
     print(f"   💡 Tip: Check if Prometheus container is running and {target_endpoint} is reachable from Prometheus")
     return False
 
+def rollback_host(ip, previous):
+    """Restore the binaries a rollout replaced (kept as <binary>.previous) and restart them."""
+    sudo = sudo_prefix(ip)
+    names = sorted(previous)
+    print(f"↩️  Rolling back {', '.join(names)} on {ip}...")
+    script = [f"{sudo}install -m 0755 /usr/local/bin/{name}.previous /usr/local/bin/{name} && "
+              f"{sudo}systemctl restart {name}" for name in names]
+    if ssh_command(ip, " && ".join(script), check=True) is None:
+        print(f"   ✗ Rollback failed on {ip}")
+        return False
+    return True
+
+def rollout_stages(hosts, canary=1, growth=2.0):
+    """Split hosts into a canary stage followed by batches that grow by `growth`."""
+    stages = []
+    size = max(1, canary)
+    position = 0
+    while position < len(hosts):
+        stages.append(hosts[position:position + size])
+        position += size
+        size = max(size + 1, int(size * growth))
+    return stages
+
+def prometheus_query(expr):
+    """Instant query; returns {instance: value}."""
+    return {sample.labels.get('instance'): sample.value for sample in default_client().query(expr)}
+
+def scrape_durations(ips, window):
+    """Average Node Exporter scrape duration per host over the given window (e.g. '10m')."""
+    if not ips:
+        return {}
+    pattern = '|'.join(re.escape(f"{ip}:9100") for ip in ips).replace('\\', '\\\\')
+    try:
+        durations = prometheus_query(f'avg_over_time(scrape_duration_seconds{{instance=~"{pattern}"}}[{window}])')
+    except Exception as e:
+        print(f"⚠️  Could not query scrape durations: {e}")
+        return {}
+    return {instance.rsplit(':', 1)[0]: value for instance, value in durations.items() if instance}
+
+def gate_stage(stage_results, outcomes, baseline, args):
+    """Problems that should halt a rollout after a stage (empty list if it may continue)."""
+    problems = [f"{ip}: {status.replace('_', ' ')}" for ip, status in stage_results
+                if status in ('failed', 'unhealthy')]
+
+    # Only hosts whose Node Exporter binary changed are compared with their old scrape times
+    upgraded = [ip for ip, _ in stage_results if 'node_exporter' in outcomes[ip]['previous'] and ip in baseline]
+    if upgraded and not problems:
+        print(f"⏳ Soaking for {args.soak}s before comparing scrape durations...")
+        time.sleep(args.soak)
+        current = scrape_durations(upgraded, f"{args.soak}s")
+        for ip in upgraded:
+            before, after = baseline[ip], current.get(ip)
+            if after is None:
+                problems.append(f"{ip}: no scrape duration samples after upgrade")
+            # Ignore sub-50ms jitter on fast hosts
+            elif after > before * args.max_scrape_regression and after - before > 0.05:
+                problems.append(f"{ip}: scrape duration {before * 1000:.0f}ms -> {after * 1000:.0f}ms")
+    return problems
+
+def deploy_host(ip, specific_user, args):
+    """Deploy exporters to one host and report its status and per-service state."""
+    # Determine which user to use for this host
+    current_username = specific_user if specific_user else USERNAME
+    if specific_user:
+        HOST_USERS[ip] = specific_user
+    outcome = {'ip': ip, 'status': 'failed', 'services': None, 'node_target': False, 'changes': {}, 'previous': {}}
+    
+    print(f"\n{'='*50}")
+    print(f"Processing: {current_username}@{ip}")
+    print(f"{'='*50}\n")
+    
+    # Skip localhost - already monitored
+    if ip in ('127.0.0.1', 'localhost'):
+        print(f"⏭️  Skipping {ip} - already monitored by node-exporter service\n")
+        outcome['status'] = 'skipped'
+        return outcome
+    
+    # Check SSH connectivity
+    with timed_step(ip, 'ssh'):
+        connected = test_ssh_connection(ip, current_username)
+    if not connected:
+        print(f"✗ SSH key authentication failed for {current_username}@{ip}")
+        print(f"   Please run: python3 scripts/setup_ssh_key.py {ip} --username {current_username}")
+        print(f"   Or run with --setup-keys flag\n")
+        outcome['status'] = 'ssh_failed'
+        return outcome
+
+    
+    
+    # Everything below is decided from one facts probe (static facts cached for FACTS_TTL)
+    with timed_step(ip, 'facts'):
+        facts = gather_facts(ip, refresh=args.refresh_facts)
+    if not facts:
+        # Guessing the architecture or services would install the wrong binaries
+        print(f"❌ Cannot deploy to {ip} without host facts\n")
+        return outcome
+
+    # Validate OS and Architecture
+    os_name = facts.get('os') or "Unknown Linux"
+    print(f"   💻 OS: {os_name}")
+    
+    arch = facts.get('arch', '')
+    go_arch = "amd64"
+    if "aarch64" in arch or "armv8" in arch:
+        go_arch = "arm64"
+    elif "armv7" in arch:
+        go_arch = "armv7"
+    print(f"   cpu: {arch} (binary: {go_arch})")
+    
+    # Check port availability (firewall or other services)
+    print(f"   🔍 Checking ports...")
+    for port, name in [(9100, "Node Exporter"), (9991, "cAdvisor"), (9104, "MySQL Exporter")]:
+        state = "LISTENING" if port in facts.get('ports', []) else "FREE"
+        print(f"      - Port {port} ({name}) is {state}")
+
+    # Detect Proxmox guest type
+    proxmox_info = detect_proxmox_guest(ip, facts)
+
+    # Detect services on the host
+    detected_services = detect_services(ip, facts)
+    print()  # Blank line for readability
+
+    # Initialize service status for this host
+    service_status = outcome['services'] = {
+        'node_exporter': {'installed': False, 'healthy': False},
+        'cadvisor': {'installed': False, 'healthy': False, 'prometheus_scrape': False},
+        'mysql_exporter': {'installed': False, 'healthy': False},
+        'proxmox_type': proxmox_info.get('guest_type'),
+        'proxmox_id': proxmox_info.get('vmid')
+    }
+
+    # Reconcile every exporter this host should run in one pass
+    wanted = ['node_exporter']
+    if detected_services.get('docker'):
+        wanted.append('cadvisor')
+    if detected_services.get('mysql'):
+        wanted.append('mysqld_exporter')
+    reconciled = reconcile_host(ip, wanted, go_arch, apply=not args.plan)
+    outcome['changes'] = {name: result['actions'] for name, result in reconciled.items() if result['actions']}
+    outcome['previous'] = {name: result['previous'] for name, result in reconciled.items() if result['previous']}
+
+    if args.plan:
+        outcome['status'] = 'changes_planned' if outcome['changes'] else 'converged'
+        outcome['services'] = None
+        return outcome
+
+    node_exporter_success = reconciled['node_exporter']['ok']
+    service_status['node_exporter']['installed'] = node_exporter_success
+
+    if node_exporter_success:
+        # Added to targets.json once all hosts are done
+        outcome['node_target'] = True
+
+        # cAdvisor if Docker is detected
+        if 'cadvisor' in reconciled:
+            cadvisor_installed = reconciled['cadvisor']['ok']
+            service_status['cadvisor']['installed'] = cadvisor_installed
+
+            if cadvisor_installed:
+                add_docker_target(ip)
+                print(f"✅ Docker monitoring configured for {ip}")
+
+                # An unchanged, running cAdvisor was already verified by the state probe
+                if reconciled['cadvisor']['actions']:
+                    with timed_step(ip, 'verify cadvisor'):
+                        cadvisor_healthy = verify_cadvisor_running(ip)
+                else:
+                    cadvisor_healthy = True
+                service_status['cadvisor']['healthy'] = cadvisor_healthy
+
+                if cadvisor_healthy:
+                    print(f"✅ cAdvisor verified and working on {ip}")
+
+                    # Check if Prometheus can scrape it
+                    if not args.skip_health_check:
+                        with timed_step(ip, 'scrape check remote_docker'):
+                            prometheus_scrape = verify_prometheus_scraping(ip, CADVISOR_PORT, 'remote_docker', timeout=15)
+                        service_status['cadvisor']['prometheus_scrape'] = prometheus_scrape
+                else:
+                    print(f"⚠️  cAdvisor installed but not responding correctly on {ip}")
+                    print(f"   💡 Tip: Run 'python3 scripts/diagnose_monitoring.py {ip}' for detailed diagnostics")
+            else:
+                print(f"⚠️  Failed to install cAdvisor on {ip}")
+
+        # MySQL Exporter if MySQL is detected
+        if 'mysqld_exporter' in reconciled:
+            mysql_installed = reconciled['mysqld_exporter']['ok']
+            service_status['mysql_exporter']['installed'] = mysql_installed
+
+            if mysql_installed:
+                add_mysql_target(ip)
+                print(f"✅ MySQL monitoring configured for {ip}")
+
+                # Verify MySQL Exporter health
+                if not args.skip_health_check:
+                    with timed_step(ip, 'scrape check remote_mysql'):
+                        mysql_scrape = verify_prometheus_scraping(ip, '9104', 'remote_mysql', timeout=15)
+                    service_status['mysql_exporter']['prometheus_scrape'] = mysql_scrape
+            else:
+                print(f"⚠️  Failed to install MySQL Exporter on {ip}")
+
+        print(f"✅ Host {ip} processed successfully")
+
+        # Node health is checked for all hosts at once, after targets.json is written
+        outcome['status'] = 'skipped_health' if args.skip_health_check else 'pending_health'
+    else:
+        print(f"❌ Failed to ensure Node Exporter on {ip}")
+        outcome['status'] = 'failed'
+
+    return outcome
+
 def main():
+    global USERNAME, FACTS_TTL, ARTIFACT_MODE, ARTIFACT_PORT, RUN_LOG
     parser = argparse.ArgumentParser(
         description='Deploy Node Exporter to monitoring targets',
         epilog='Example: python3 deploy_monitor.py --setup-keys'
@@ -658,10 +1060,40 @@ def main():
                        help='Skip health verification after deployment')
     parser.add_argument('--username', '-u', default='root',
                        help='SSH username (default: root)')
+    parser.add_argument('--facts-ttl', type=int, default=FACTS_TTL,
+                       help=f'Seconds to reuse cached host facts (default: {FACTS_TTL})')
+    parser.add_argument('--refresh-facts', action='store_true',
+                       help='Ignore cached host facts and probe every host again')
+    parser.add_argument('--parallel', '-j', type=int, default=DEFAULT_PARALLEL,
+                       help=f'Hosts to deploy at once (default: {DEFAULT_PARALLEL})')
+    parser.add_argument('--plan', action='store_true',
+                       help='Show the changes each host needs without applying them')
+    parser.add_argument('--rollout', action='store_true',
+                       help='Deploy in stages (canary first, then growing batches), halting and '
+                            'rolling back a stage whose targets are down or scrape slower')
+    parser.add_argument('--canary', type=int, default=1,
+                       help='Hosts in the first --rollout stage (default: 1)')
+    parser.add_argument('--growth', type=float, default=2.0,
+                       help='Factor each --rollout stage grows by (default: 2)')
+    parser.add_argument('--soak', type=int, default=ROLLOUT_SOAK,
+                       help=f'Seconds each stage runs before its scrape durations are compared (default: {ROLLOUT_SOAK})')
+    parser.add_argument('--max-scrape-regression', type=float, default=ROLLOUT_MAX_REGRESSION,
+                       help=f'Halt if a host scrapes this many times slower than before (default: {ROLLOUT_MAX_REGRESSION})')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_LOG',
+                       help='Skip hosts that already finished in a previous run (default: the latest run log)')
+    parser.add_argument('--artifacts', choices=['push', 'http', 'download'], default=ARTIFACT_MODE,
+                       help=f'How exporter binaries reach hosts: push over SSH, http from this machine, '
+                            f'or download from GitHub on each host (default: {ARTIFACT_MODE})')
+    parser.add_argument('--artifact-port', type=int, default=ARTIFACT_PORT,
+                       help=f'Port for --artifacts http (default: {ARTIFACT_PORT})')
     args = parser.parse_args()
+    if args.rollout and (args.skip_health_check or args.plan):
+        parser.error('--rollout needs health checks and cannot be combined with --skip-health-check or --plan')
     
-    global USERNAME
     USERNAME = args.username
+    FACTS_TTL = args.facts_ttl
+    ARTIFACT_MODE = args.artifacts
+    ARTIFACT_PORT = args.artifact_port
     
     print("🚀 Node Exporter Deployment Script")
     print("=" * 50)
@@ -683,162 +1115,151 @@ def main():
         print("⚠️  No hosts found in hosts.txt")
         return
     
-    print(f"📋 Found {len(hosts)} host(s) to process\n")
+    # Resuming appends to the earlier run's log, so one file covers the whole rollout
+    log_path = None
+    if args.resume:
+        log_path = latest_log() if args.resume == 'latest' else args.resume
+        if not log_path or not os.path.exists(log_path):
+            print(f"⚠️  No run log to resume from ({log_path or 'none found'})")
+            sys.exit(1)
+        done = completed_hosts(log_path)
+        remaining = [(ip, user) for ip, user in hosts if ip not in done]
+        print(f"⏭️  Resuming {log_path}: {len(hosts) - len(remaining)} host(s) already done")
+        hosts = remaining
+        if not hosts:
+            print("✅ Nothing left to deploy")
+            return
+
+    RUN_LOG = RunLog(log_path)
+    RUN_LOG.event('run_start', hosts=[ip for ip, _ in hosts], resumed=bool(args.resume), plan=args.plan,
+                  options={k: v for k, v in vars(args).items() if k != 'setup_keys'},
+                  versions={name: spec['version'] for name, spec in EXPORTERS.items()})
+    print(f"📋 Found {len(hosts)} host(s) to process")
+    print(f"📝 Run log: {RUN_LOG.path}\n")
+
+    artifact_server = None
+    if ARTIFACT_MODE == 'http':
+        artifact_server = artifact_cache().serve(ARTIFACT_PORT)
+        print(f"📦 Serving exporter binaries on port {ARTIFACT_PORT}\n")
     
     targets = load_targets()
-    changes_made = False
     results = []
     service_status = {}  # Track detailed service status per host
-
-    for ip, specific_user in hosts:
-        # Determine which user to use for this host
-        current_username = specific_user if specific_user else USERNAME
-        
-        print(f"\n{'='*50}")
-        print(f"Processing: {current_username}@{ip}")
-        print(f"{'='*50}\n")
-        
-        # Skip localhost - already monitored
-        if ip in ('127.0.0.1', 'localhost'):
-            print(f"⏭️  Skipping {ip} - already monitored by node-exporter service\n")
-            results.append((ip, 'skipped'))
-            continue
-        
-        # Check SSH connectivity
-        # IMPORTANT: We must temporarily update the global USERNAME so helper functions use it
-        # This is a hack because helper functions rely on global USERNAME
-        original_global_username = USERNAME
-        USERNAME = current_username
-        
-        if not test_ssh_connection(ip, current_username):
-            print(f"✗ SSH key authentication failed for {current_username}@{ip}")
-            print(f"   Please run: python3 scripts/setup_ssh_key.py {ip} --username {current_username}")
-            print(f"   Or run with --setup-keys flag\n")
-            results.append((ip, 'ssh_failed'))
-            # Restore global username before continuing
-            USERNAME = original_global_username
-            continue
-
-        
-        
-        # Validate OS and Architecture
-        os_info = ssh_command(ip, "cat /etc/os-release | grep PRETTY_NAME", check=False) or "Unknown Linux"
-        os_name = os_info.replace('PRETTY_NAME=', '').strip().strip('"')
-        print(f"   💻 OS: {os_name}")
-        
-        arch = ssh_command(ip, "uname -m", check=True).strip()
-        go_arch = "amd64"
-        if "aarch64" in arch or "armv8" in arch:
-            go_arch = "arm64"
-        elif "armv7" in arch:
-            go_arch = "armv7"
-        print(f"   cpu: {arch} (binary: {go_arch})")
-        
-        # Check port availability (firewall or other services)
-        print(f"   🔍 Checking ports...")
-        for port, name in [(9100, "Node Exporter"), (9991, "cAdvisor"), (9104, "MySQL Exporter")]:
-            # Check if port is listening
-            listening = ssh_command(ip, f"netstat -tuln | grep :{port} || ss -tuln | grep :{port}", check=False)
-            if listening:
-               # Check if it's our service
-               proc = ssh_command(ip, f"lsof -i :{port} || netstat -tulpn | grep :{port}", check=False)
-               print(f"      - Port {port} ({name}) is LISTENING")
-            else:
-               # Validate if we can bind (not blocked by firewall logic, but verifies if free)
-               print(f"      - Port {port} ({name}) is FREE")
-
-        # Detect Proxmox guest type
-        proxmox_info = detect_proxmox_guest(ip)
-
-        # Detect services on the host
-        detected_services = detect_services(ip)
-        print()  # Blank line for readability
-
-        # Initialize service status for this host
-        service_status[ip] = {
-            'node_exporter': {'installed': False, 'healthy': False},
-            'cadvisor': {'installed': False, 'healthy': False, 'prometheus_scrape': False},
-            'mysql_exporter': {'installed': False, 'healthy': False},
-            'proxmox_type': proxmox_info.get('guest_type'),
-            'proxmox_id': proxmox_info.get('vmid')
-        }
-
-        # Always ensure Node Exporter is installed and running
-        node_exporter_success = install_node_exporter(ip, go_arch)
-        service_status[ip]['node_exporter']['installed'] = node_exporter_success
-
-        if node_exporter_success:
-            # Add to targets if not already present
-            if not is_target_configured(ip, targets):
+    changed_hosts = converged_hosts = 0
+    halted = None
+
+    # Without health checks nothing needs Prometheus to see a new target mid-run,
+    # so batch the Docker/MySQL target files and write each once after the loop
+    target_batch = ExitStack()
+    if args.skip_health_check:
+        target_batch.enter_context(target_files.batch())
+
+    # Hosts run concurrently; each one's output is buffered and printed when it finishes
+    started = time.time()
+    parallel = max(1, min(args.parallel, len(hosts)))
+    output = HostOutput(sys.stdout) if parallel > 1 else None
+    if output:
+        print(f"⚡ Deploying to {len(hosts)} host(s), {parallel} at a time\n")
+
+    def run(ip, specific_user):
+        if output:
+            output.start()
+        host_started = time.monotonic()
+        try:
+            outcome = deploy_host(ip, specific_user, args)
+        except Exception as e:
+            print(f"❌ Unexpected error on {ip}: {e}")
+            outcome = {'ip': ip, 'status': 'failed', 'services': None, 'node_target': False, 'changes': {}, 'previous': {},
+                       'error': str(e)}
+        finally:
+            if output:
+                output.finish()
+        # Streamed as soon as the host finishes, so a crash later in the run keeps it
+        RUN_LOG.event('host', seconds=round(time.monotonic() - host_started, 3),
+                      steps=_host_steps.get(ip, {}), **outcome)
+        return outcome
+
+    stages = rollout_stages(hosts, args.canary, args.growth) if args.rollout else [hosts]
+    for number, stage in enumerate(stages, 1):
+        if args.rollout:
+            label = 'canary' if number == 1 else f"{len(stage)} host(s)"
+            print(f"\n🚦 Stage {number}/{len(stages)} ({label}): {', '.join(ip for ip, _ in stage)}")
+            baseline = scrape_durations([ip for ip, _ in stage], '10m')
+
+        outcomes = {}
+        if output:
+            sys.stdout = output
+        try:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                futures = {executor.submit(run, ip, user): ip for ip, user in stage}
+                for future in as_completed(futures):
+                    outcomes[futures[future]] = future.result()
+        finally:
+            if output:
+                sys.stdout = output.stream
+
+        # Aggregate in hosts.txt order
+        changes_made = False
+        stage_start = len(results)
+        for ip, _ in stage:
+            outcome = outcomes[ip]
+            results.append((ip, outcome['status']))
+            if outcome['changes']:
+                changed_hosts += 1
+            elif outcome['services'] is not None or outcome['status'] == 'converged':
+                converged_hosts += 1
+            if outcome['services'] is not None:
+                service_status[ip] = outcome['services']
+            if outcome['node_target'] and not is_target_configured(ip, targets):
                 targets = add_target(ip, targets)
                 changes_made = True
 
-            # Install cAdvisor if Docker is detected
-            if detected_services.get('docker'):
-                cadvisor_installed = install_cadvisor(ip)
-                service_status[ip]['cadvisor']['installed'] = cadvisor_installed
-
-                if cadvisor_installed:
-                    add_docker_target(ip)
-                    print(f"✅ Docker monitoring configured for {ip}")
-
-                    # Verify cAdvisor is actually working
-                    cadvisor_healthy = verify_cadvisor_running(ip)
-                    service_status[ip]['cadvisor']['healthy'] = cadvisor_healthy
-
-                    if cadvisor_healthy:
-                        print(f"✅ cAdvisor verified and working on {ip}")
-
-                        # Check if Prometheus can scrape it
-                        if not args.skip_health_check:
-                            prometheus_scrape = verify_prometheus_scraping(ip, CADVISOR_PORT, 'remote_docker', timeout=15)
-                            service_status[ip]['cadvisor']['prometheus_scrape'] = prometheus_scrape
-                    else:
-                        print(f"⚠️  cAdvisor installed but not responding correctly on {ip}")
-                        print(f"   💡 Tip: Run 'python3 scripts/diagnose_monitoring.py {ip}' for detailed diagnostics")
-                else:
-                    print(f"⚠️  Failed to install cAdvisor on {ip}")
-
-            # Install MySQL Exporter if MySQL is detected
-            if detected_services.get('mysql'):
-                mysql_installed = install_mysqld_exporter(ip)
-                service_status[ip]['mysql_exporter']['installed'] = mysql_installed
-
-                if mysql_installed:
-                    add_mysql_target(ip)
-                    print(f"✅ MySQL monitoring configured for {ip}")
-
-                    # Verify MySQL Exporter health
-                    if not args.skip_health_check:
-                        mysql_scrape = verify_prometheus_scraping(ip, '9104', 'remote_mysql', timeout=15)
-                        service_status[ip]['mysql_exporter']['prometheus_scrape'] = mysql_scrape
-                else:
-                    print(f"⚠️  Failed to install MySQL Exporter on {ip}")
-
-            print(f"✅ Host {ip} processed successfully")
-
-            if not args.skip_health_check:
-                node_health = verify_target_health(ip)
+        # Save targets if there were changes
+        if changes_made and save_targets(targets):
+            print(f"\n✅ Updated {TARGETS_FILE}")
+            print("📊 Prometheus should pick up changes automatically")
+
+        # Every host waits on the same target list snapshots, so this costs one poll loop per stage
+        pending = [ip for ip, status in results[stage_start:] if status == 'pending_health']
+        if pending:
+            print(f"\n🔍 Verifying target health for {len(pending)} host(s)...")
+            for ip in pending:
+                target_health().watch(f"{ip}:9100")
+            for i in range(stage_start, len(results)):
+                ip, status = results[i]
+                if status != 'pending_health':
+                    continue
+                with timed_step(ip, 'health'):
+                    node_health = verify_target_health(ip)
                 service_status[ip]['node_exporter']['healthy'] = node_health
-
-                if node_health:
-                    results.append((ip, 'healthy'))
-                else:
-                    results.append((ip, 'unhealthy'))
-            else:
-                results.append((ip, 'skipped_health'))
-        else:
-            print(f"❌ Failed to ensure Node Exporter on {ip}")
-            results.append((ip, 'failed'))
-        
-        # Restore global username for next iteration
-        USERNAME = original_global_username
-
-    # Save targets if there were changes
-    if changes_made:
-        save_targets(targets)
-        print(f"\n✅ Updated {TARGETS_FILE}")
-        print("📊 Prometheus should pick up changes automatically")
+                results[i] = (ip, 'healthy' if node_health else 'unhealthy')
+                RUN_LOG.event('status', ip=ip, status=results[i][1])
+
+        if args.rollout:
+            problems = gate_stage(results[stage_start:], outcomes, baseline, args)
+            RUN_LOG.event('stage', number=number, hosts=[ip for ip, _ in stage], passed=not problems,
+                          problems=problems)
+            if problems:
+                halted = number
+                print(f"\n🛑 Stage {number} failed its gate, halting rollout:")
+                for problem in problems:
+                    print(f"   - {problem}")
+                for i in range(stage_start, len(results)):
+                    ip, status = results[i]
+                    if outcomes[ip]['previous'] and rollback_host(ip, outcomes[ip]['previous']):
+                        results[i] = (ip, 'rolled_back')
+                        RUN_LOG.event('status', ip=ip, status='rolled_back')
+                results += [(ip, 'not_deployed') for later in stages[number:] for ip, _ in later]
+                break
+            print(f"✅ Stage {number} passed")
+
+    target_batch.close()
+    save_facts_cache()
+    RUN_LOG.event('run_end', seconds=round(time.time() - started, 3), halted=halted,
+                  statuses={status: sum(1 for _, s in results if s == status) for status in {s for _, s in results}})
+    RUN_LOG.close()
+    if artifact_server:
+        artifact_server.shutdown()
 
     # Always ensure dashboards are correctly configured
     # print("\n🔧 Checking Grafana dashboards...")
@@ -846,8 +1267,10 @@ def main():
 
     # Display summary
     print("\n" + "="*50)
-    print("📊 Deployment Summary:")
+    print(f"📊 Deployment Summary ({len(hosts)} host(s) in {time.time() - started:.0f}s):")
     print("="*50)
+    verb = 'need changes' if args.plan else 'changed'
+    print(f"🔧 {changed_hosts} host(s) {verb}, {converged_hosts} already converged")
     for ip, status in results:
         status_icons = {
             'skipped': '⏭️',
@@ -862,7 +1285,12 @@ def main():
             'new_failed': '✗',
             'healthy': '✓',
             'unhealthy': '⚠️',
-            'failed': '✗'
+            'failed': '✗',
+            'skipped_health': '⏭️',
+            'converged': '✓',
+            'changes_planned': '📝',
+            'rolled_back': '↩️',
+            'not_deployed': '⏸️'
         }
         icon = status_icons.get(status, '?')
         status_text = status.replace('_', ' ').title()
@@ -960,6 +1388,10 @@ def main():
         print("   - Run: docker-compose ps prometheus")
         print("   - Check Prometheus targets: http://localhost:9990/targets")
 
+    if halted:
+        print(f"\n🛑 Rollout halted at stage {halted}; fix the hosts above and run again to continue.")
+        sys.exit(1)
+
     print("\n✅ Deployment complete!")
     print("\n📊 Next steps:")
     print("   1. Check Prometheus targets: http://localhost:9990/targets")
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Device Inventory
+SQLite store for discovered and manually listed network devices.
+
+Replaces network_devices_discovered.json: devices are upserted one row at a
+time (WAL journal, indexes on IP, MAC and last_seen), so a discovery pass only
+touches the devices it saw and other scripts can query single devices without
+loading the whole inventory. The manual section of network_devices.txt is
+parsed once per file change and cached here as well.
+
+Sighting history is kept per MAC as run-length intervals: one row per
+continuous stretch a MAC was seen at one IP, extended in place on every pass.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+AUTO_MARKER = '# AUTO-DISCOVERED'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    ip TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT 'unknown',
+    confidence TEXT NOT NULL DEFAULT 'none',
+    mac TEXT NOT NULL DEFAULT '',
+    vendor TEXT NOT NULL DEFAULT '',
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    ports TEXT NOT NULL DEFAULT '[]',
+    auto_discovered INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS devices_mac ON devices (mac);
+CREATE INDEX IF NOT EXISTS devices_last_seen ON devices (last_seen);
+
+CREATE TABLE IF NOT EXISTS manual_devices (
+    ip TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    position INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sightings (
+    id INTEGER PRIMARY KEY,
+    mac TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS sightings_mac ON sightings (mac, last_seen);
+CREATE INDEX IF NOT EXISTS sightings_ip ON sightings (ip, last_seen);
+CREATE INDEX IF NOT EXISTS sightings_last_seen ON sightings (last_seen);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+DEVICE_COLUMNS = ('ip', 'name', 'type', 'confidence', 'mac', 'vendor',
+                  'first_seen', 'last_seen', 'ports', 'auto_discovered')
+
+
+def parse_devices_file(path: Path) -> Tuple[List[str], List[Tuple[str, Optional[str], Optional[str]]],
+                                             List[Tuple[str, str, str]]]:
+    """Split network_devices.txt into raw manual lines, manual entries and auto-discovered entries"""
+    manual_lines, manual, auto = [], [], []
+    in_auto_section = False
+    if not path.exists():
+        return manual_lines, manual, auto
+    with open(path, 'r') as f:
+        for line in f:
+            stripped = line.strip()
+            if AUTO_MARKER in stripped:
+                in_auto_section = True
+                continue
+            if not in_auto_section:
+                manual_lines.append(line)
+            if not stripped or stripped.startswith('#'):
+                continue
+            parts = [p.strip() for p in stripped.split(',')]
+            if in_auto_section:
+                if len(parts) == 3:
+                    auto.append((parts[0], parts[1], parts[2]))
+            elif len(parts) == 3:
+                manual.append((parts[0], parts[1], parts[2]))
+            else:
+                manual.append((parts[0], None, None))
+    return manual_lines, manual, auto
+
+
+class DeviceInventory:
+    """Indexed on-disk device inventory"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Group writes into one transaction (one fsync per pass instead of per device)"""
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        device = dict(row)
+        device['ports'] = json.loads(device['ports'])
+        device['auto_discovered'] = bool(device['auto_discovered'])
+        return device
+
+    # Metadata
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self.conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                              'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, str(value)))
+
+    # Discovered devices
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM devices').fetchone()[0]
+
+    def get(self, ip: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute('SELECT * FROM devices WHERE ip = ?', (ip,)).fetchone()
+        return self._row(row) if row else None
+
+    def get_many(self, ips: Iterable[str]) -> Dict[str, Dict]:
+        """Look up several IPs at once, returning only the known ones"""
+        ips = list(ips)
+        found = {}
+        with self._lock:
+            for i in range(0, len(ips), 500):
+                chunk = ips[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for row in self.conn.execute(f'SELECT * FROM devices WHERE ip IN ({placeholders})', chunk):
+                    found[row['ip']] = self._row(row)
+        return found
+
+    def by_mac(self, mac: str) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute('SELECT * FROM devices WHERE mac = ?', (mac.upper(),)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def seen_since(self, cutoff: str) -> List[Tuple[str, str]]:
+        """(ip, last_seen) of devices seen at or after cutoff (ISO timestamp), most recent first"""
+        with self._lock:
+            rows = self.conn.execute('SELECT ip, last_seen FROM devices WHERE last_seen >= ? '
+                                     'ORDER BY last_seen DESC', (cutoff,)).fetchall()
+        return [(row['ip'], row['last_seen']) for row in rows]
+
+    def devices(self, auto_only: bool = False) -> Iterator[Dict]:
+        """All devices ordered by IP string (the order network_devices.txt lists them in)"""
+        query = 'SELECT * FROM devices'
+        if auto_only:
+            query += ' WHERE auto_discovered = 1'
+        with self._lock:
+            rows = self.conn.execute(query + ' ORDER BY ip').fetchall()
+        for row in rows:
+            yield self._row(row)
+
+    def upsert(self, device: Dict):
+        """Insert a device or update every field except first_seen"""
+        values = dict(device)
+        values['ports'] = json.dumps(values.get('ports', []))
+        values['auto_discovered'] = int(values.get('auto_discovered', True))
+        for column, default in (('confidence', 'none'), ('mac', ''), ('vendor', ''), ('type', 'unknown')):
+            if values.get(column) is None:
+                values[column] = default
+        values.setdefault('last_seen', values['first_seen'])
+        updates = ', '.join(f"{c} = excluded.{c}" for c in DEVICE_COLUMNS if c not in ('ip', 'first_seen'))
+        with self._lock:
+            self.conn.execute(
+                f"INSERT INTO devices ({', '.join(DEVICE_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + c for c in DEVICE_COLUMNS)}) "
+                f"ON CONFLICT(ip) DO UPDATE SET {updates}",
+                {c: values.get(c) for c in DEVICE_COLUMNS})
+
+    def touch(self, ip: str, last_seen: str, ports: List[int]):
+        """Record a sighting of a known device"""
+        with self._lock:
+            self.conn.execute('UPDATE devices SET last_seen = ?, ports = ? WHERE ip = ?',
+                              (last_seen, json.dumps(ports), ip))
+
+    def remove(self, ip: str) -> bool:
+        with self._lock:
+            return self.conn.execute('DELETE FROM devices WHERE ip = ?', (ip,)).rowcount > 0
+
+    def prune(self, cutoff: str) -> int:
+        """Delete devices not seen since cutoff (ISO timestamp)"""
+        with self._lock:
+            return self.conn.execute('DELETE FROM devices WHERE last_seen < ?', (cutoff,)).rowcount
+
+    # Manual devices (network_devices.txt above the AUTO-DISCOVERED marker)
+
+    def sync_manual(self, devices_file: Path) -> bool:
+        """Re-parse the manual section when the file changed since the last sync"""
+        mtime = str(devices_file.stat().st_mtime) if devices_file.exists() else '0'
+        if self.get_meta('devices_mtime') == mtime:
+            return False
+        manual_lines, manual, _ = parse_devices_file(devices_file)
+        with self.transaction():
+            self.conn.execute('DELETE FROM manual_devices')
+            for position, (ip, name, device_type) in enumerate(manual):
+                # Keep the first complete entry for an IP, as the targets file always has
+                self.conn.execute(
+                    'INSERT INTO manual_devices (ip, name, type, position) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(ip) DO UPDATE SET name = excluded.name, type = excluded.type, '
+                    'position = excluded.position '
+                    'WHERE manual_devices.name IS NULL AND excluded.name IS NOT NULL',
+                    (ip, name, device_type, position))
+            self.set_meta('manual_section', ''.join(manual_lines))
+            self.set_meta('devices_mtime', mtime)
+        return True
+
+    def mark_devices_file_written(self, devices_file: Path):
+        """Record our own rewrite of network_devices.txt so it is not re-parsed"""
+        self.set_meta('devices_mtime', str(devices_file.stat().st_mtime))
+
+    def manual_ips(self) -> set:
+        with self._lock:
+            return {row['ip'] for row in self.conn.execute('SELECT ip FROM manual_devices')}
+
+    def manual_devices(self) -> List[Dict]:
+        """Complete manual entries (IP, name and type) in file order"""
+        with self._lock:
+            rows = self.conn.execute('SELECT ip, name, type FROM manual_devices WHERE name IS NOT NULL '
+                                     'ORDER BY position').fetchall()
+        return [dict(row) for row in rows]
+
+    def manual_section(self) -> str:
+        return self.get_meta('manual_section', '')
+
+    # Sighting history (per MAC, run-length intervals)
+
+    def record_sightings(self, sightings: Iterable[Tuple[str, str]], when: float, gap: float) -> int:
+        """Extend each MAC's open interval, or start a new one after an IP change or a gap
+
+        Returns the number of new intervals (new devices, IP moves and reappearances).
+        """
+        opened = 0
+        with self.transaction():
+            for mac, ip in sightings:
+                mac = mac.upper()
+                row = self.conn.execute('SELECT id, ip, last_seen FROM sightings WHERE mac = ? '
+                                        'ORDER BY last_seen DESC LIMIT 1', (mac,)).fetchone()
+                if row and row['ip'] == ip and when - row['last_seen'] <= gap:
+                    self.conn.execute('UPDATE sightings SET last_seen = ?, count = count + 1 WHERE id = ?',
+                                      (max(when, row['last_seen']), row['id']))
+                else:
+                    self.conn.execute('INSERT INTO sightings (mac, ip, first_seen, last_seen) VALUES (?, ?, ?, ?)',
+                                      (mac, ip, when, when))
+                    opened += 1
+        return opened
+
+    def history(self, mac: str) -> List[Dict]:
+        """Presence intervals of one MAC, oldest first"""
+        with self._lock:
+            rows = self.conn.execute('SELECT ip, first_seen, last_seen, count FROM sightings WHERE mac = ? '
+                                     'ORDER BY first_seen', (mac.upper(),)).fetchall()
+        return [dict(row) for row in rows]
+
+    def macs_seen_since(self, cutoff: float) -> List[Dict]:
+        """MACs seen at or after cutoff (epoch) with their latest IP, most recent first"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT mac, ip, MAX(last_seen) AS last_seen FROM sightings WHERE last_seen >= ? '
+                'GROUP BY mac ORDER BY last_seen DESC', (cutoff,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def reassigned_ips(self, cutoff: float) -> List[Dict]:
+        """IPs used by more than one MAC in intervals active at or after cutoff"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT ip, COUNT(DISTINCT mac) AS macs, GROUP_CONCAT(DISTINCT mac) AS mac_list '
+                'FROM sightings WHERE last_seen >= ? GROUP BY ip HAVING macs > 1 ORDER BY ip',
+                (cutoff,)).fetchall()
+        return [{'ip': row['ip'], 'macs': row['mac_list'].split(',')} for row in rows]
+
+    def churn(self, cutoff: float, min_intervals: int = 3) -> Dict[str, List[Dict]]:
+        """Split MACs active since cutoff into new ones and flapping ones
+
+        A MAC is new when its first interval started after cutoff, and flapping
+        when it has at least min_intervals intervals since cutoff (dropped off
+        and came back, or hopped between IPs).
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT s.mac, COUNT(*) AS intervals, COUNT(DISTINCT s.ip) AS ips, '
+                '(SELECT MIN(first_seen) FROM sightings f WHERE f.mac = s.mac) AS first_seen '
+                'FROM sightings s WHERE s.last_seen >= ? GROUP BY s.mac', (cutoff,)).fetchall()
+        new = [dict(row) for row in rows if row['first_seen'] >= cutoff]
+        flapping = [dict(row) for row in rows if row['intervals'] >= min_intervals]
+        return {'new': new, 'flapping': flapping}
+
+    def compact_history(self, retention: float, merge_gap: float, now: float) -> Dict[str, int]:
+        """Drop intervals older than retention seconds and merge same-IP intervals closer than merge_gap"""
+        merged = 0
+        with self.transaction():
+            dropped = self.conn.execute('DELETE FROM sightings WHERE last_seen < ?',
+                                        (now - retention,)).rowcount
+            previous = None
+            for row in self.conn.execute('SELECT id, mac, ip, first_seen, last_seen, count FROM sightings '
+                                         'ORDER BY mac, first_seen').fetchall():
+                if (previous and row['mac'] == previous['mac'] and row['ip'] == previous['ip']
+                        and row['first_seen'] - previous['last_seen'] <= merge_gap):
+                    previous['last_seen'] = max(previous['last_seen'], row['last_seen'])
+                    previous['count'] += row['count']
+                    self.conn.execute('UPDATE sightings SET last_seen = ?, count = ? WHERE id = ?',
+                                      (previous['last_seen'], previous['count'], previous['id']))
+                    self.conn.execute('DELETE FROM sightings WHERE id = ?', (row['id'],))
+                    merged += 1
+                else:
+                    previous = dict(row)
+            self.set_meta('history_compacted_at', now)
+        return {'dropped': dropped, 'merged': merged}
+
+    # Migration
+
+    def migrate(self, json_path: Path, devices_file: Path) -> int:
+        """One-time import of network_devices_discovered.json (or, failing that, the txt auto section)"""
+        if self.get_meta('migrated') or self.count():
+            return 0
+        imported = 0
+        with self.transaction():
+            if json_path.exists():
+                with open(json_path, 'r') as f:
+                    legacy = json.load(f) or {}
+                for ip, info in legacy.items():
+                    first_seen = info.get('first_seen') or info.get('last_seen') or ''
+                    # Types may have been curated by hand; like the txt fallback, only a
+                    # medium or high confidence match may change them later
+                    confidence = info.get('confidence') if info.get('confidence') in ('medium', 'high') else 'low'
+                    self.upsert({**info, 'ip': ip, 'confidence': confidence, 'first_seen': first_seen,
+                                 'last_seen': info.get('last_seen') or first_seen})
+                    imported += 1
+            if not imported:
+                _, _, auto = parse_devices_file(devices_file)
+                now = datetime.now().isoformat()
+                for ip, name, device_type in auto:
+                    self.upsert({'ip': ip, 'name': name, 'type': device_type, 'confidence': 'low',
+                                 'first_seen': now, 'last_seen': now})
+                    imported += 1
+            self.set_meta('migrated', str(json_path if json_path.exists() else devices_file))
+        return imported
+
+
+def main():
+    import argparse
+    import os
+    import time
+    from datetime import timedelta
+
+    script_dir = Path(__file__).parent
+    project_root = Path(os.environ.get('PROJECT_ROOT', script_dir.parent))
+    discovered_db = Path(os.environ.get('DISCOVERED_DB', project_root / "network_devices_discovered.json"))
+    default_db = Path(os.environ.get('INVENTORY_DB', discovered_db.parent / "network_devices.db"))
+
+    parser = argparse.ArgumentParser(description='Query the device inventory')
+    parser.add_argument('--db', default=str(default_db), help='Inventory database path')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help='List devices')
+    show = sub.add_parser('show', help='Show one device by IP or MAC')
+    show.add_argument('key')
+    sub.add_parser('export', help='Dump the inventory as JSON (old network_devices_discovered.json layout)')
+    remove = sub.add_parser('remove', help='Delete a device')
+    remove.add_argument('ip')
+    prune = sub.add_parser('prune', help='Delete devices not seen for N days')
+    prune.add_argument('days', type=float)
+    history = sub.add_parser('history', help='Presence intervals of one MAC')
+    history.add_argument('mac')
+    seen = sub.add_parser('seen', help='MACs seen in the last N hours')
+    seen.add_argument('hours', type=float)
+    reassigned = sub.add_parser('reassigned', help='IPs used by more than one MAC in the last N days')
+    reassigned.add_argument('days', type=float, nargs='?', default=7)
+    churn = sub.add_parser('churn', help='New and flapping MACs in the last N days')
+    churn.add_argument('days', type=float, nargs='?', default=7)
+    churn.add_argument('--min-intervals', type=int, default=3, help='Intervals that count as flapping')
+    compact = sub.add_parser('compact', help='Apply history retention and merge close intervals')
+    compact.add_argument('--retention-days', type=float, default=90)
+    compact.add_argument('--merge-gap', type=float, default=3600, help='Seconds (default: 3600)')
+    args = parser.parse_args()
+
+    def stamp(epoch):
+        return datetime.fromtimestamp(epoch).isoformat(timespec='seconds')
+
+    inventory = DeviceInventory(Path(args.db))
+    if args.command == 'list':
+        for device in inventory.devices():
+            print(f"{device['ip']:15} {device['name']:25} {device['type']:12} "
+                  f"{device['mac']:17} {device['last_seen']}")
+    elif args.command == 'show':
+        devices = inventory.by_mac(args.key) if ':' in args.key else [inventory.get(args.key)]
+        devices = [d for d in devices if d]
+        if not devices:
+            print(f"❌ {args.key} not found")
+            raise SystemExit(1)
+        print(json.dumps(devices, indent=2))
+    elif args.command == 'export':
+        print(json.dumps({d.pop('ip'): d for d in inventory.devices()}, indent=2))
+    elif args.command == 'remove':
+        print(f"✅ Removed {args.ip}" if inventory.remove(args.ip) else f"⚠️  {args.ip} not found")
+    elif args.command == 'prune':
+        cutoff = (datetime.now() - timedelta(days=args.days)).isoformat()
+        print(f"✅ Removed {inventory.prune(cutoff)} device(s) not seen since {cutoff}")
+    elif args.command == 'history':
+        for interval in inventory.history(args.mac):
+            print(f"{stamp(interval['first_seen'])} → {stamp(interval['last_seen'])}  "
+                  f"{interval['ip']:15} ({interval['count']} sightings)")
+    elif args.command == 'seen':
+        for row in inventory.macs_seen_since(time.time() - args.hours * 3600):
+            print(f"{row['mac']:17} {row['ip']:15} {stamp(row['last_seen'])}")
+    elif args.command == 'reassigned':
+        for row in inventory.reassigned_ips(time.time() - args.days * 86400):
+            print(f"{row['ip']:15} {', '.join(row['macs'])}")
+    elif args.command == 'churn':
+        result = inventory.churn(time.time() - args.days * 86400, args.min_intervals)
+        print(f"New ({len(result['new'])}):")
+        for row in result['new']:
+            print(f"  {row['mac']:17} first seen {stamp(row['first_seen'])}")
+        print(f"Flapping ({len(result['flapping'])}):")
+        for row in result['flapping']:
+            print(f"  {row['mac']:17} {row['intervals']} intervals across {row['ips']} IP(s)")
+    elif args.command == 'compact':
+        result = inventory.compact_history(args.retention_days * 86400, args.merge_gap, time.time())
+        print(f"✅ Dropped {result['dropped']} expired interval(s), merged {result['merged']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,28 @@ Diagnostic and fix script for monitoring targets
 Checks firewall, SELinux, service status and fixes common issues
 """
 
+import argparse
+import contextlib
+import json
 import subprocess
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_probe
+import ssh_pool
+from exposition import SERIES_LIMIT, ExpositionParser
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 HOSTS_FILE = os.path.join(BASE_DIR, 'hosts.txt')
 
+# Hosts diagnosed at once, and the most any single remote check may take
+DEFAULT_PARALLEL = 16
+CHECK_TIMEOUT = 20
+
+NUMBER_ICONS = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🔟']
+
 def load_hosts():
     """Load hosts from hosts.txt"""
     if not os.path.exists(HOSTS_FILE):
@@ -30,141 +45,197 @@ def load_hosts():
 
 def ssh_exec(ip, user, cmd):
     """Execute command via SSH"""
-    if ip in ('127.0.0.1', 'localhost'):
-        result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-    else:
-        ssh_cmd = ['ssh', '-o', 'StrictHostKeyChecking=no', '-o', 'ConnectTimeout=5', 
-                   f'{user}@{ip}', cmd]
-        result = subprocess.run(ssh_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    try:
+        if ip in ('127.0.0.1', 'localhost'):
+            result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True, timeout=CHECK_TIMEOUT)
+        else:
+            # All commands for a host share one pooled SSH session
+            result = ssh_pool.run(user, ip, cmd, timeout=CHECK_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return 124, '', f"timed out after {CHECK_TIMEOUT}s"
     return result.returncode, result.stdout, result.stderr
 
-def diagnose_host(ip, user):
-    """Run comprehensive diagnostics on a host"""
-    print(f"\n{'='*70}")
-    print(f"🔍 DIAGNOSTICS FOR {user}@{ip}")
-    print(f"{'='*70}\n")
-    
-    issues = []
-    fixes = []
-    
-    # 1. Check if node_exporter service exists and its status
-    print("1️⃣  Checking Node Exporter service...")
+def check(title):
+    """Decorator turning a check into one that returns {'title', 'lines', 'issues', 'warnings', 'fixes'}
+
+    Issues make a host unhealthy; warnings are reported but don't.
+    """
+    def wrap(func):
+        def run(ip, user):
+            result = {'check': func.__name__[6:], 'title': title, 'lines': [], 'issues': [], 'warnings': [], 'fixes': []}
+            try:
+                func(ip, user, result)
+            except Exception as e:
+                result['lines'].append(f"   ❌ Check failed: {e}")
+                result['issues'].append(f"{title} check failed")
+            result['status'] = 'fail' if result['issues'] else ('warn' if result['warnings'] else 'ok')
+            return result
+        run.title = title
+        return run
+    return wrap
+
+@check("Checking Node Exporter service...")
+def check_service(ip, user, r):
     rc, out, err = ssh_exec(ip, user, "systemctl status node_exporter")
     if rc != 0:
-        print(f"   ❌ Service not found or not running")
-        print(f"      Error: {err.strip()}")
-        issues.append("Service not running")
+        r['lines'] += ["   ❌ Service not found or not running", f"      Error: {err.strip()}"]
+        r['issues'].append("Service not running")
     else:
-        print(f"   ✅ Service status:")
-        for line in out.split('\n')[:5]:
-            print(f"      {line}")
-    
-    # 2. Check if binary exists
-    print("\n2️⃣  Checking Node Exporter binary...")
+        r['lines'].append("   ✅ Service status:")
+        r['lines'] += [f"      {line}" for line in out.split('\n')[:5]]
+
+@check("Checking Node Exporter binary...")
+def check_binary(ip, user, r):
     rc, out, err = ssh_exec(ip, user, "ls -lh /usr/local/bin/node_exporter")
     if rc != 0:
-        print(f"   ❌ Binary not found")
-        issues.append("Binary missing")
+        r['lines'].append("   ❌ Binary not found")
+        r['issues'].append("Binary missing")
     else:
-        print(f"   ✅ Binary exists: {out.strip()}")
-    
-    # 3. Check if port 9100 is listening
-    print("\n3️⃣  Checking port 9100...")
+        r['lines'].append(f"   ✅ Binary exists: {out.strip()}")
+
+@check("Checking port 9100...")
+def check_port(ip, user, r):
     rc, out, err = ssh_exec(ip, user, "ss -tlnp | grep :9100 || netstat -tlnp | grep :9100")
     if rc != 0 or not out.strip():
-        print(f"   ❌ Port 9100 is NOT listening")
-        issues.append("Port not listening")
+        r['lines'].append("   ❌ Port 9100 is NOT listening")
+        r['issues'].append("Port not listening")
     else:
-        print(f"   ✅ Port 9100 is listening:")
-        print(f"      {out.strip()}")
-    
-    # 4. Check firewall status
-    print("\n4️⃣  Checking firewall...")
+        r['lines'] += ["   ✅ Port 9100 is listening:", f"      {out.strip()}"]
+
+@check("Checking firewall...")
+def check_firewall(ip, user, r):
     rc, out, err = ssh_exec(ip, user, "firewall-cmd --list-ports 2>/dev/null || iptables -L -n | grep 9100")
     if "9100" not in out:
-        print(f"   ⚠️  Port 9100 may not be open in firewall")
-        issues.append("Firewall blocking")
-        fixes.append("firewall")
+        r['lines'].append("   ⚠️  Port 9100 may not be open in firewall")
+        r['issues'].append("Firewall blocking")
+        r['fixes'].append("firewall")
     else:
-        print(f"   ✅ Firewall seems configured")
-    
-    # 5. Check SELinux
-    print("\n5️⃣  Checking SELinux...")
+        r['lines'].append("   ✅ Firewall seems configured")
+
+@check("Checking SELinux...")
+def check_selinux(ip, user, r):
     rc, out, err = ssh_exec(ip, user, "getenforce 2>/dev/null")
     if out.strip() == "Enforcing":
-        print(f"   ⚠️  SELinux is in Enforcing mode")
-        issues.append("SELinux may be blocking")
-        fixes.append("selinux")
+        r['lines'].append("   ⚠️  SELinux is in Enforcing mode")
+        r['issues'].append("SELinux may be blocking")
+        r['fixes'].append("selinux")
     elif out.strip() == "Permissive":
-        print(f"   ✅ SELinux is in Permissive mode")
+        r['lines'].append("   ✅ SELinux is in Permissive mode")
     else:
-        print(f"   ✅ SELinux is disabled or not present")
-    
-    # 6. Test connectivity from Prometheus server
-    print("\n6️⃣  Testing connectivity from localhost...")
-    result = subprocess.run(['curl', '-s', '-m', '5', f'http://{ip}:9100/metrics'], 
-                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-    if result.returncode == 0 and 'node_' in result.stdout:
-        print(f"   ✅ Can reach Node Exporter metrics")
-        print(f"      Sample: {result.stdout.split()[0][:100]}...")
+        r['lines'].append("   ✅ SELinux is disabled or not present")
+
+@check("Testing connectivity from localhost...")
+def check_connectivity(ip, user, r):
+    result = http_probe.probe(ip, 9100, prefixes=('node_',))
+    if result['ok']:
+        r['lines'] += [f"   ✅ Can reach Node Exporter metrics ({result['latency'] * 1000:.0f} ms)",
+                       f"      Sample: {result['sample'][:100]}..."]
     else:
-        print(f"   ❌ Cannot reach Node Exporter metrics")
-        print(f"      Error: {result.stderr}")
-        issues.append("Node Exporter unreachable")
-
-    # 7. Check cAdvisor (if Docker is present)
-    print("\n7️⃣  Checking cAdvisor (Docker monitoring)...")
-    # Check if docker is running
-    rc, out, err = ssh_exec(ip, user, "command -v docker && systemctl is-active docker")
-    if rc == 0 and out.strip() == "active":
-        print(f"   🐳 Docker is running. Checking cAdvisor...")
-        
-        # Check cAdvisor service
-        rc, out, err = ssh_exec(ip, user, "systemctl is-active cadvisor")
-        if rc != 0:
-            print(f"   ❌ cAdvisor service not running or missing")
-            issues.append("cAdvisor not running")
-        else:
-            print(f"   ✅ cAdvisor service is active")
-            
-            # Check port 9991
-            rc, out, err = ssh_exec(ip, user, "ss -tlnp | grep :9991 || netstat -tlnp | grep :9991")
-            if rc != 0 or not out.strip():
-                print(f"   ❌ Port 9991 (cAdvisor) is NOT listening")
-                issues.append("cAdvisor port not listening")
-            else:
-                print(f"   ✅ Port 9991 is listening")
-
-            # Check firewall for 9991
-            rc, out, err = ssh_exec(ip, user, "firewall-cmd --list-ports 2>/dev/null || iptables -L -n | grep 9991")
-            if "9991" not in out:
-                print(f"   ⚠️  Port 9991 may be blocked by firewall")
-                issues.append("cAdvisor firewall blocking")
-                fixes.append("firewall_cadvisor")
-            else:
-                print(f"   ✅ Firewall allows 9991")
-
-            # Check connectivity
-            print(f"   🔄 Testing cAdvisor connectivity...")
-            result = subprocess.run(['curl', '-s', '-m', '5', f'http://{ip}:9991/metrics'], 
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            if result.returncode == 0 and 'container_' in result.stdout:
-                print(f"   ✅ Can reach cAdvisor metrics")
-            else:
-                print(f"   ❌ Cannot reach cAdvisor metrics")
-                issues.append("cAdvisor unreachable")
+        r['lines'] += ["   ❌ Cannot reach Node Exporter metrics", f"      Error: {result['error']}"]
+        r['issues'].append("Node Exporter unreachable")
+
+@check("Checking cAdvisor (Docker monitoring)...")
+def check_cadvisor(ip, user, r):
+    rc, out, err = ssh_exec(ip, user, "command -v docker >/dev/null && systemctl is-active docker")
+    if rc != 0 or out.strip() != "active":
+        r['lines'].append("   ℹ️  Docker not detected or not active. Skipping cAdvisor checks.")
+        return
+    r['lines'].append("   🐳 Docker is running. Checking cAdvisor...")
+
+    rc, out, err = ssh_exec(ip, user, "systemctl is-active cadvisor")
+    if rc != 0:
+        r['lines'].append("   ❌ cAdvisor service not running or missing")
+        r['issues'].append("cAdvisor not running")
+        return
+    r['lines'].append("   ✅ cAdvisor service is active")
+
+    # Port, firewall and scrape checks don't depend on each other
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        port = pool.submit(ssh_exec, ip, user, "ss -tlnp | grep :9991 || netstat -tlnp | grep :9991")
+        firewall = pool.submit(ssh_exec, ip, user, "firewall-cmd --list-ports 2>/dev/null || iptables -L -n | grep 9991")
+        # Scan the whole payload (up to the series budget) to catch cardinality blowups
+        scan = ExpositionParser(max_series=SERIES_LIMIT)
+        metrics = pool.submit(http_probe.probe, ip, 9991, timeout=15, parser=scan)
+
+    rc, out, err = port.result()
+    if rc != 0 or not out.strip():
+        r['lines'].append("   ❌ Port 9991 (cAdvisor) is NOT listening")
+        r['issues'].append("cAdvisor port not listening")
     else:
-        print(f"   ℹ️  Docker not detected or not active. Skipping cAdvisor checks.")
-    
-    # 8. Check journal for errors
-    print("\n8️⃣  Checking recent logs...")
+        r['lines'].append("   ✅ Port 9991 is listening")
+
+    rc, out, err = firewall.result()
+    if "9991" not in out:
+        r['lines'].append("   ⚠️  Port 9991 may be blocked by firewall")
+        r['issues'].append("cAdvisor firewall blocking")
+        r['fixes'].append("firewall_cadvisor")
+    else:
+        r['lines'].append("   ✅ Firewall allows 9991")
+
+    result = metrics.result()
+    if not result['ok'] or not scan.has_family('container_'):
+        r['lines'].append(f"   ❌ Cannot reach cAdvisor metrics: {result['error'] or 'no container_* metrics'}")
+        r['issues'].append("cAdvisor unreachable")
+        return
+    r['lines'].append(f"   ✅ Can reach cAdvisor metrics ({result['latency'] * 1000:.0f} ms, "
+                      f"{result['series']} series in {result['families']} families, {result['bytes'] // 1024} KiB)")
+    if result['errors']:
+        r['lines'].append(f"   ⚠️  {result['errors']} malformed line(s), e.g. {scan.errors[0]}")
+        r['warnings'].append("cAdvisor metrics malformed")
+    warnings = scan.cardinality_warnings()
+    if warnings:
+        r['lines'] += ["   ⚠️  High cardinality:"] + [f"      {warning}" for warning in warnings[:5]]
+        r['warnings'].append("cAdvisor cardinality high")
+
+@check("Checking recent logs...")
+def check_logs(ip, user, r):
     rc, out, err = ssh_exec(ip, user, "journalctl -u node_exporter -n 20 --no-pager 2>/dev/null")
     if rc == 0 and out:
-        print(f"   📋 Recent logs:")
-        for line in out.split('\n')[-10:]:
-            if line.strip():
-                print(f"      {line}")
-    
+        r['lines'].append("   📋 Recent logs:")
+        r['lines'] += [f"      {line}" for line in out.split('\n')[-10:] if line.strip()]
+
+CHECKS = [check_service, check_binary, check_port, check_firewall, check_selinux,
+          check_connectivity, check_cadvisor, check_logs]
+LOCAL_CHECKS = {check_connectivity}
+
+def collect_diagnostics(ip, user):
+    """Run every check on a host concurrently and return a machine-readable report"""
+    started = time.time()
+    remote = ip not in ('127.0.0.1', 'localhost')
+    # One connection attempt decides reachability, instead of every check timing out on its own
+    reachable = not remote or not ssh_pool.ENABLED or ssh_pool.ensure_master(user, ip)
+    checks = CHECKS if reachable else [c for c in CHECKS if c in LOCAL_CHECKS]
+
+    with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+        results = list(pool.map(lambda c: c(ip, user), checks))
+
+    if not reachable:
+        results.insert(0, {'check': 'ssh', 'title': "Connecting over SSH...", 'status': 'fail',
+                           'lines': [f"   ❌ Cannot open an SSH session to {user}@{ip}"],
+                           'issues': ["SSH unreachable"], 'warnings': [], 'fixes': []})
+
+    issues = [issue for result in results for issue in result['issues']]
+    warnings = [warning for result in results for warning in result['warnings']]
+    fixes = [fix for result in results for fix in result['fixes']]
+    return {'host': ip, 'user': user, 'reachable': reachable, 'healthy': not issues,
+            'issues': issues, 'warnings': warnings, 'fixes': fixes, 'checks': results,
+            'seconds': round(time.time() - started, 2)}
+
+def print_report(report):
+    """Human-readable report for one host"""
+    ip, user = report['host'], report['user']
+    issues, fixes = report['issues'], report['fixes']
+    print(f"\n{'='*70}")
+    print(f"🔍 DIAGNOSTICS FOR {user}@{ip}")
+    print(f"{'='*70}")
+
+    for number, result in enumerate(report['checks'], 1):
+        icon = NUMBER_ICONS[number - 1] if number <= len(NUMBER_ICONS) else f"{number}."
+        print(f"\n{icon}  {result['title']}")
+        for line in result['lines']:
+            print(line)
+
     # Summary
     print(f"\n{'='*70}")
     if not issues:
@@ -193,140 +264,163 @@ def diagnose_host(ip, user):
                 print(f"      # Option 2: Set to permissive (less secure)")
                 print(f"      setenforce 0")
                 print(f"      sed -i 's/SELINUX=enforcing/SELINUX=permissive/' /etc/selinux/config")
+
+    if report['warnings']:
+        print(f"\n⚠️  {len(report['warnings'])} WARNING(S) (not counted as issues):")
+        for warning in report['warnings']:
+            print(f"   - {warning}")
     
+    print(f"(checked in {report['seconds']:.1f}s)")
     print(f"{'='*70}\n")
-    return issues, fixes
+
+def diagnose_fleet(hosts, parallel=DEFAULT_PARALLEL):
+    """Diagnose many hosts at once; reports come back in the order of `hosts`"""
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(hosts)))) as pool:
+        return list(pool.map(lambda host: collect_diagnostics(*host), hosts))
 
 def auto_fix_host(ip, user):
-    """Attempt to automatically fix common issues"""
-    print(f"\n🔧 ATTEMPTING AUTO-FIX FOR {ip}...")
-    
+    """Attempt to automatically fix common issues; returns {'host', 'user', 'lines', 'fixes'}"""
+    lines = [f"\n🔧 ATTEMPTING AUTO-FIX FOR {ip}..."]
     fixes_applied = []
     
     # Fix 1: Restart service
-    print("\n1️⃣  Restarting Node Exporter service...")
+    lines.append("\n1️⃣  Restarting Node Exporter service...")
     rc, out, err = ssh_exec(ip, user, "systemctl restart node_exporter && systemctl enable node_exporter")
     if rc == 0:
-        print("   ✅ Service restarted")
+        lines.append("   ✅ Service restarted")
         fixes_applied.append("service_restart")
     else:
-        print(f"   ❌ Failed to restart: {err}")
+        lines.append(f"   ❌ Failed to restart: {err}")
     
     # Fix 2: Open firewall port
-    print("\n2️⃣  Opening firewall port 9100...")
+    lines.append("\n2️⃣  Opening firewall port 9100...")
     # Try firewalld first
     rc, out, err = ssh_exec(ip, user, "firewall-cmd --permanent --add-port=9100/tcp && firewall-cmd --reload 2>/dev/null")
     if rc == 0:
-        print("   ✅ Firewall port opened (firewalld)")
+        lines.append("   ✅ Firewall port opened (firewalld)")
         fixes_applied.append("firewall_firewalld")
     else:
         # Try iptables
         rc, out, err = ssh_exec(ip, user, "iptables -C INPUT -p tcp --dport 9100 -j ACCEPT 2>/dev/null || iptables -I INPUT -p tcp --dport 9100 -j ACCEPT")
         if rc == 0:
-            print("   ✅ Firewall port opened (iptables)")
+            lines.append("   ✅ Firewall port opened (iptables)")
             ssh_exec(ip, user, "service iptables save 2>/dev/null")
             fixes_applied.append("firewall_iptables")
         else:
-            print("   ⚠️  Could not configure firewall (may not be needed)")
+            lines.append("   ⚠️  Could not configure firewall (may not be needed)")
     
     # Fix 3: SELinux - allow port
-    print("\n3️⃣  Configuring SELinux...")
+    lines.append("\n3️⃣  Configuring SELinux...")
     rc, out, err = ssh_exec(ip, user, "semanage port -a -t http_port_t -p tcp 9100 2>/dev/null || semanage port -m -t http_port_t -p tcp 9100 2>/dev/null")
     if rc == 0:
-        print("   ✅ SELinux port policy updated")
+        lines.append("   ✅ SELinux port policy updated")
         fixes_applied.append("selinux")
     else:
-    else:
-        print("   ℹ️  SELinux not configured (may not be needed)")
+        lines.append("   ℹ️  SELinux not configured (may not be needed)")
 
     # Fix 4: Firewall for cAdvisor (if needed)
-    print("\n4️⃣  Checking cAdvisor firewall (9991)...")
+    lines.append("\n4️⃣  Checking cAdvisor firewall (9991)...")
     # Only if port 9991 is not open
     rc, out, err = ssh_exec(ip, user, "firewall-cmd --list-ports 2>/dev/null")
     if rc == 0 and "9991" not in out:
-        print("   Configuring firewall for cAdvisor...")
+        lines.append("   Configuring firewall for cAdvisor...")
         ssh_exec(ip, user, "firewall-cmd --permanent --add-port=9991/tcp && firewall-cmd --reload 2>/dev/null")
         fixes_applied.append("firewall_cadvisor")
     else:
-         print("   ℹ️  Port 9991 seems OK or firewalld not active")
+         lines.append("   ℹ️  Port 9991 seems OK or firewalld not active")
     
     # Fix 5: Verify service is actually running
-    print("\n5️⃣  Verifying service status...")
-    import time
+    lines.append("\n5️⃣  Verifying service status...")
     time.sleep(3)
     rc, out, err = ssh_exec(ip, user, "systemctl is-active node_exporter")
     if out.strip() == "active":
-        print("   ✅ Service is active")
+        lines.append("   ✅ Service is active")
         fixes_applied.append("service_active")
     else:
-        print(f"   ❌ Service still not active: {out.strip()}")
+        lines.append(f"   ❌ Service still not active: {out.strip()}")
     
-    print(f"\n✅ Applied {len(fixes_applied)} fix(es): {', '.join(fixes_applied)}")
-    return fixes_applied
+    lines.append(f"\n✅ Applied {len(fixes_applied)} fix(es): {', '.join(fixes_applied)}")
+    return {'host': ip, 'user': user, 'lines': lines, 'fixes': fixes_applied}
+
+def fix_fleet(hosts, parallel=DEFAULT_PARALLEL):
+    """Auto-fix many hosts at once, so their settle waits overlap; results keep the order of `hosts`"""
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(hosts)))) as pool:
+        return list(pool.map(lambda host: auto_fix_host(*host), hosts))
+
+def print_fix(result):
+    for line in result['lines']:
+        print(line)
+
+def print_summary(reports):
+    """One line per host, then the unhealthy ones"""
+    print(f"\n{'='*70}")
+    print(f"📊 FLEET SUMMARY ({len(reports)} host(s))")
+    print(f"{'='*70}")
+    for report in reports:
+        icon = '✅' if report['healthy'] else ('🔌' if not report['reachable'] else '❌')
+        detail = ', '.join(report['issues']) or ', '.join(['healthy'] + report['warnings'])
+        target = f"{report['user']}@{report['host']}"
+        print(f"   {icon} {target:28s} {detail}")
 
 def main():
-    if len(sys.argv) > 1:
-        # Diagnostic specific host
-        if sys.argv[1] == '--fix':
-            # Auto-fix all hosts
-            hosts = load_hosts()
-            for ip, user in hosts:
-                if ip in ('127.0.0.1', 'localhost'):
-                    continue
-                auto_fix_host(ip, user)
-                print("\n⏳ Waiting 5 seconds before testing...")
-                import time
-                time.sleep(5)
-                diagnose_host(ip, user)
-        else:
-            # Diagnose specific IP
-            target_ip = sys.argv[1]
-            user = sys.argv[2] if len(sys.argv) > 2 else 'root'
-            diagnose_host(target_ip, user)
-            
-            print("\n❓ Do you want to attempt auto-fix? (y/n): ", end='')
-            if input().lower() == 'y':
-                auto_fix_host(target_ip, user)
-                print("\n⏳ Waiting 5 seconds before re-testing...")
-                import time
-                time.sleep(5)
-                diagnose_host(target_ip, user)
+    parser = argparse.ArgumentParser(description='Diagnose (and optionally fix) monitoring targets')
+    parser.add_argument('ip', nargs='?', help='Diagnose one host instead of every host in hosts.txt')
+    parser.add_argument('user', nargs='?', default='root', help='SSH user for ip (default: root)')
+    parser.add_argument('--fix', action='store_true', help='Auto-fix every host, then diagnose it again')
+    parser.add_argument('--json', action='store_true', help='Print reports as JSON (no prompts)')
+    parser.add_argument('--parallel', '-j', type=int, default=DEFAULT_PARALLEL,
+                        help=f'Hosts to diagnose at once (default: {DEFAULT_PARALLEL})')
+    args = parser.parse_args()
+
+    if args.ip:
+        hosts = [(args.ip, args.user)]
     else:
-        # Diagnose all hosts
-        hosts = load_hosts()
-        print(f"📋 Found {len(hosts)} host(s) to diagnose\n")
-        
-        unhealthy = []
-        for ip, user in hosts:
-            if ip in ('127.0.0.1', 'localhost'):
-                continue
-            issues, _ = diagnose_host(ip, user)
-            if issues:
-                unhealthy.append((ip, user))
-        
-        if unhealthy:
-            print(f"\n{'='*70}")
-            print(f"⚠️  SUMMARY: {len(unhealthy)} unhealthy host(s)")
-            print(f"{'='*70}")
-            for ip, user in unhealthy:
-                print(f"   ❌ {user}@{ip}")
-            
-            print("\n❓ Do you want to attempt auto-fix on all unhealthy hosts? (y/n): ", end='')
-            if input().lower() == 'y':
-                for ip, user in unhealthy:
-                    auto_fix_host(ip, user)
-                
-                print("\n⏳ Waiting 10 seconds before re-testing all...")
-                import time
-                time.sleep(10)
-                
-                print("\n" + "="*70)
-                print("🔄 RE-TESTING ALL HOSTS")
-                print("="*70)
-                for ip, user in unhealthy:
-                    diagnose_host(ip, user)
-        else:
+        hosts = [(ip, user) for ip, user in load_hosts() if ip not in ('127.0.0.1', 'localhost')]
+
+    if args.fix:
+        # Keep fix progress out of the JSON document
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            for result in fix_fleet(hosts, args.parallel):
+                print_fix(result)
+            print("\n⏳ Waiting 5 seconds before testing...")
+        time.sleep(5)
+
+    if not args.json:
+        print(f"📋 Diagnosing {len(hosts)} host(s), {max(1, min(args.parallel, len(hosts)))} at a time\n")
+    started = time.time()
+    reports = diagnose_fleet(hosts, args.parallel)
+    unhealthy = [(r['host'], r['user']) for r in reports if not r['healthy']]
+
+    if args.json:
+        print(json.dumps({'seconds': round(time.time() - started, 2), 'unhealthy': len(unhealthy),
+                          'hosts': reports}, indent=2))
+        sys.exit(1 if unhealthy else 0)
+
+    for report in reports:
+        print_report(report)
+    if len(reports) > 1:
+        print_summary(reports)
+    print(f"\n⏱️  Diagnosed {len(reports)} host(s) in {time.time() - started:.1f}s")
+
+    if not unhealthy or args.fix:
+        if not unhealthy and len(reports) > 1:
             print("\n✅ ALL HOSTS ARE HEALTHY!")
+        return
+
+    prompt = "this host" if args.ip else "all unhealthy hosts"
+    print(f"\n❓ Do you want to attempt auto-fix on {prompt}? (y/n): ", end='')
+    if input().lower() == 'y':
+        for result in fix_fleet(unhealthy, args.parallel):
+            print_fix(result)
+
+        print("\n⏳ Waiting 10 seconds before re-testing...")
+        time.sleep(10)
+
+        print("\n" + "="*70)
+        print("🔄 RE-TESTING")
+        print("="*70)
+        for report in diagnose_fleet(unhealthy, args.parallel):
+            print_report(report)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Exporter Artifact Cache
+Used by deploy_monitor.py to distribute exporter binaries.
+
+Release binaries are downloaded once per fleet into a local content-addressed
+cache (blobs stored by SHA-256, indexed by name/version/arch). Upstream
+checksums are verified where the project publishes them, and cached blobs are
+re-hashed before use. Hosts then get the binary pushed over SSH or fetch it
+from the monitoring server over HTTP, instead of each one downloading it from
+GitHub.
+"""
+
+import hashlib
+import io
+import json
+import os
+import posixpath
+import tarfile
+import tempfile
+import threading
+import urllib.request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from urllib.parse import quote, unquote
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get('EXPORTER_CACHE_DIR', os.path.join(BASE_DIR, '.artifacts'))
+
+# Where each exporter's release lives; {version} and {arch} are filled in per request
+ARTIFACTS = {
+    'node_exporter': {
+        'url': 'https://github.com/prometheus/node_exporter/releases/download/v{version}/'
+               'node_exporter-{version}.linux-{arch}.tar.gz',
+        'member': 'node_exporter-{version}.linux-{arch}/node_exporter',
+        'checksums': 'https://github.com/prometheus/node_exporter/releases/download/v{version}/sha256sums.txt',
+    },
+    'mysqld_exporter': {
+        'url': 'https://github.com/prometheus/mysqld_exporter/releases/download/v{version}/'
+               'mysqld_exporter-{version}.linux-{arch}.tar.gz',
+        'member': 'mysqld_exporter-{version}.linux-{arch}/mysqld_exporter',
+        'checksums': 'https://github.com/prometheus/mysqld_exporter/releases/download/v{version}/sha256sums.txt',
+    },
+    'cadvisor': {
+        # Plain binary, no published checksum list: the first download's hash is pinned in the index
+        'url': 'https://github.com/google/cadvisor/releases/download/{version}/cadvisor-{version}-linux-{arch}',
+        'arch_names': {'armv7': 'arm'},
+    },
+}
+
+
+def release_url(name, version, arch):
+    """Upstream download URL and, for archives, the binary's path inside it"""
+    spec = ARTIFACTS[name]
+    release_arch = spec.get('arch_names', {}).get(arch, arch)
+    url = spec['url'].format(version=version, arch=release_arch)
+    member = spec['member'].format(version=version, arch=release_arch) if spec.get('member') else None
+    return url, member
+
+
+def download_command(name, version, arch, dest, sudo=''):
+    """Shell command that downloads a release straight from GitHub on the host itself"""
+    url, member = release_url(name, version, arch)
+    tmp = f"/tmp/{name}-download"
+    if member:
+        fetch = f"wget -qO {tmp}.tar.gz {url} && tar xzf {tmp}.tar.gz -C {tmp} {member} && src={tmp}/{member}"
+    else:
+        fetch = f"wget -qO {tmp}/{name} {url} && src={tmp}/{name}"
+    return (f"rm -rf {tmp} {tmp}.tar.gz && mkdir -p {tmp} && {fetch} && {sudo}install -m 0755 \"$src\" {dest}; "
+            f"rc=$?; rm -rf {tmp} {tmp}.tar.gz; exit $rc")
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed store of exporter binaries"""
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'sha256')
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._verified = set()
+        self.downloads = 0
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, index):
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest)
+
+    def known_digest(self, name, version, arch):
+        """SHA-256 recorded for an artifact, without downloading it (None if never fetched)"""
+        entry = self._load_index().get(f"{name}/{version}/{arch}")
+        return entry['sha256'] if entry else None
+
+    def get(self, name, version, arch):
+        """Return (path, sha256) of the binary, downloading and verifying it on first use"""
+        key = f"{name}/{version}/{arch}"
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent deploys of the same artifact wait for one download
+        with key_lock:
+            entry = self._load_index().get(key)
+            if entry:
+                path = self.blob_path(entry['sha256'])
+                if key in self._verified:
+                    return path, entry['sha256']
+                if os.path.exists(path) and sha256_file(path) == entry['sha256']:
+                    self._verified.add(key)
+                    return path, entry['sha256']
+
+            path, digest, source = self._download(name, version, arch)
+            if entry and entry['sha256'] != digest:
+                os.unlink(path)
+                raise ValueError(f"{key}: downloaded binary hash {digest} does not match pinned {entry['sha256']}")
+            with self._lock:
+                index = self._load_index()
+                index[key] = {'sha256': digest, 'source': source}
+                self._save_index(index)
+            self._verified.add(key)
+            return path, digest
+
+    def _download(self, name, version, arch):
+        spec = ARTIFACTS[name]
+        url, member = release_url(name, version, arch)
+        with urllib.request.urlopen(url, timeout=120) as response:
+            payload = response.read()
+        self.downloads += 1
+
+        if spec.get('checksums'):
+            expected = self._upstream_checksum(spec['checksums'].format(version=version), url.rsplit('/', 1)[1])
+            actual = hashlib.sha256(payload).hexdigest()
+            if expected != actual:
+                raise ValueError(f"Checksum mismatch for {url}: expected {expected}, got {actual}")
+
+        if member:
+            with tarfile.open(fileobj=io.BytesIO(payload), mode='r:gz') as archive:
+                payload = archive.extractfile(member).read()
+
+        digest = hashlib.sha256(payload).hexdigest()
+        fd, tmp = tempfile.mkstemp(dir=self.blob_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, self.blob_path(digest))
+        return self.blob_path(digest), digest, url
+
+    @staticmethod
+    def _upstream_checksum(checksums_url, filename):
+        with urllib.request.urlopen(checksums_url, timeout=60) as response:
+            for line in response.read().decode().splitlines():
+                parts = line.split()
+                if len(parts) == 2 and parts[1].lstrip('*') == filename:
+                    return parts[0]
+        raise ValueError(f"{filename} not listed in {checksums_url}")
+
+    def serve(self, port, bind=''):
+        """Serve blobs at /sha256/<digest> on a background thread"""
+        handler = partial(_BlobHandler, directory=self.root)
+        server = ThreadingHTTPServer((bind, port), handler)
+        threading.Thread(target=server.serve_forever, name='artifacts', daemon=True).start()
+        return server
+
+
+class _BlobHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        # Resolve '..' and %-escapes first, or /sha256/../ reaches the rest of the cache
+        path = posixpath.normpath(unquote(self.path.split('?', 1)[0].split('#', 1)[0]))
+        if not path.startswith('/sha256/'):
+            self.send_error(404)
+            return
+        self.path = quote(path)  # translate_path unquotes again
+        super().do_GET()
+
+    def list_directory(self, path):
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Pre-fetch exporter binaries into the local artifact cache')
+    parser.add_argument('name', choices=sorted(ARTIFACTS))
+    parser.add_argument('version')
+    parser.add_argument('--arch', action='append', help='Architectures (default: amd64)')
+    args = parser.parse_args()
+
+    cache = ArtifactCache()
+    for arch in args.arch or ['amd64']:
+        path, digest = cache.get(args.name, args.version, arch)
+        print(f"✅ {args.name} {args.version} {arch}: {digest} ({os.path.getsize(path) // 1024} KiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Prometheus Exposition Parser
+Shared by http_probe.py, diagnose_monitoring.py and deploy_monitor.py to validate exporter output.
+
+Parses the text exposition format one line at a time, so a /metrics body is
+never held in memory and reading can stop as soon as the caller has what it
+needs (a metric prefix, a series or byte budget). Along the way it counts
+families, series and bytes per metric family and the distinct values of every
+label, which is what shows a cardinality blowup before Prometheus ingests it.
+"""
+
+import re
+
+# Distinct values remembered per label; beyond this only "at least" is known
+LABEL_VALUE_CAP = 1000
+MAX_ERRORS = 20
+
+# Cardinality budgets for one exporter scrape and for any single family in it
+SERIES_LIMIT = 50000
+FAMILY_SERIES_LIMIT = 10000
+
+_NAME = re.compile(r'[a-zA-Z_:][a-zA-Z0-9_:]*')
+_LABEL = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"\s*(,|\})')
+_SUFFIXES = {
+    'counter': ('_total', '_created'),
+    'histogram': ('_bucket', '_sum', '_count', '_created'),
+    'gaugehistogram': ('_bucket', '_gsum', '_gcount'),
+    'summary': ('_sum', '_count', '_created'),
+}
+
+
+class ParseError(ValueError):
+    pass
+
+
+def parse_sample(line):
+    """Split a sample line into (name, {label: value}, value); raises ParseError"""
+    match = _NAME.match(line)
+    if not match:
+        raise ParseError("invalid metric name")
+    name = match.group()
+    pos = match.end()
+    labels = {}
+    if pos < len(line) and line[pos] == '{':
+        pos += 1
+        if line[pos:].lstrip().startswith('}'):
+            pos = line.index('}', pos) + 1
+        else:
+            while True:
+                label = _LABEL.match(line, pos)
+                if not label:
+                    raise ParseError(f"malformed labels in {name}")
+                if label.group(1) in labels:
+                    raise ParseError(f"duplicate label {label.group(1)} in {name}")
+                labels[label.group(1)] = label.group(2)
+                pos = label.end()
+                if label.group(3) == '}':
+                    break
+                # A trailing comma before the closing brace is allowed
+                if line[pos:].lstrip().startswith('}'):
+                    pos = line.index('}', pos) + 1
+                    break
+    fields = line[pos:].split()
+    if not fields or len(fields) > 2:
+        raise ParseError(f"expected value [timestamp] after {name}")
+    try:
+        value = float(fields[0])
+        if len(fields) == 2:
+            int(fields[1])
+    except ValueError:
+        raise ParseError(f"invalid value or timestamp for {name}")
+    return name, labels, value
+
+
+class _Family:
+    __slots__ = ('name', 'type', 'help', 'series', 'bytes', 'labels', 'overflow')
+
+    def __init__(self, name, type_='untyped'):
+        self.name = name
+        self.type = type_
+        self.help = None
+        self.series = 0
+        self.bytes = 0
+        self.labels = {}       # label -> set of values (capped)
+        self.overflow = set()  # labels whose value set hit the cap
+
+    def add(self, labels, size):
+        self.series += 1
+        self.bytes += size
+        for label, value in labels.items():
+            values = self.labels.setdefault(label, set())
+            if len(values) < LABEL_VALUE_CAP:
+                values.add(value)
+            elif value not in values:
+                self.overflow.add(label)
+
+    def cardinality(self):
+        """{label: distinct values}, as a string like '1000+' once the cap was hit"""
+        return {label: f"{len(values)}+" if label in self.overflow else len(values)
+                for label, values in sorted(self.labels.items(), key=lambda item: -len(item[1]))}
+
+
+class ExpositionParser:
+    """Incremental parser for the Prometheus text format
+
+    feed() one line at a time; it returns False once a stop condition is met:
+    a metric family starting with one of stop_prefixes was seen, or the
+    series/byte budget was exceeded. on_sample(name, family, labels), if
+    given, is called for every sample for statistics of the caller's own.
+    """
+
+    def __init__(self, stop_prefixes=(), max_series=None, max_bytes=None, on_sample=None):
+        self.stop_prefixes = tuple(stop_prefixes)
+        self.max_series = max_series
+        self.max_bytes = max_bytes
+        self.on_sample = on_sample
+        self.families = {}
+        self.lines = 0
+        self.series = 0
+        self.bytes = 0
+        self.errors = []
+        self.error_count = 0
+        self.matched = None
+        self.matched_line = None
+        self.stopped = None
+        self._current = None
+        self._finished = set()
+
+    def _error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f"line {self.lines}: {message}")
+
+    def _family(self, name):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = _Family(name)
+        if self._current is not family:
+            if name in self._finished:
+                self._error(f"samples of {name} are not grouped together")
+            if self._current is not None:
+                self._finished.add(self._current.name)
+            self._current = family
+        return family
+
+    def _family_of(self, name):
+        """Family a sample belongs to, allowing for _total/_bucket/... suffixes"""
+        current = self._current
+        if current is not None:
+            if name == current.name:
+                return current
+            for suffix in _SUFFIXES.get(current.type, ()):
+                if name == current.name + suffix:
+                    return current
+        return self._family(name)
+
+    def _check_stop(self, name, line, sample=True):
+        if sample and self.stop_prefixes and name.startswith(self.stop_prefixes):
+            self.matched = name
+            self.matched_line = line
+            self.stopped = 'matched'
+        elif self.max_series is not None and self.series > self.max_series:
+            self.stopped = 'max_series'
+        elif self.max_bytes is not None and self.bytes > self.max_bytes:
+            self.stopped = 'max_bytes'
+        return self.stopped is None
+
+    def feed(self, line):
+        """Parse one line (str or bytes); returns False when the caller can stop reading"""
+        if self.stopped:
+            return False
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        size = len(line)
+        line = line.strip()
+        self.lines += 1
+        self.bytes += size
+        if not line:
+            return True
+
+        if line.startswith('#'):
+            parts = line.split(None, 3)
+            if len(parts) < 3 or parts[1] not in ('HELP', 'TYPE'):
+                return True  # plain comment
+            name = parts[2]
+            if not _NAME.fullmatch(name):
+                self._error(f"invalid metric name {name!r} in {parts[1]}")
+                return True
+            family = self._family(name)
+            family.bytes += size
+            if parts[1] == 'TYPE':
+                type_ = parts[3].strip() if len(parts) > 3 else ''
+                if type_ not in ('counter', 'gauge', 'histogram', 'gaugehistogram', 'summary', 'untyped', 'unknown', 'info', 'stateset'):
+                    self._error(f"unknown type {type_!r} for {name}")
+                elif family.series:
+                    self._error(f"TYPE for {name} after its samples")
+                else:
+                    family.type = type_
+            else:
+                family.help = parts[3] if len(parts) > 3 else ''
+            return self._check_stop(name, line, sample=False)
+
+        try:
+            name, labels, _ = parse_sample(line)
+        except ParseError as e:
+            self._error(str(e))
+            return True
+        family = self._family_of(name)
+        family.add(labels, size)
+        self.series += 1
+        if self.on_sample is not None:
+            self.on_sample(name, family.name, labels)
+        return self._check_stop(name, line)
+
+    def feed_lines(self, lines):
+        """Feed an iterable of lines; stops consuming it as soon as feed() says so"""
+        for line in lines:
+            if not self.feed(line):
+                break
+        return self
+
+    def top(self, count=10):
+        """Families with the most series"""
+        return sorted(self.families.values(), key=lambda f: -f.series)[:count]
+
+    def has_family(self, prefix):
+        return any(name.startswith(prefix) for name in self.families)
+
+    def cardinality_warnings(self, family_limit=FAMILY_SERIES_LIMIT):
+        """Human-readable warnings for a blown series budget or oversized families"""
+        warnings = []
+        if self.stopped == 'max_series':
+            warnings.append(f"more than {self.max_series} series in one scrape (stopped reading)")
+        for family in self.top(len(self.families)):
+            if family.series <= family_limit:
+                break
+            labels = ', '.join(f"{label}={count}" for label, count in list(family.cardinality().items())[:3])
+            warnings.append(f"{family.name}: {family.series} series ({labels})")
+        return warnings
+
+    def summary(self, top=10):
+        return {
+            'families': len(self.families),
+            'series': self.series,
+            'bytes': self.bytes,
+            'lines': self.lines,
+            'stopped': self.stopped,
+            'errors': self.error_count,
+            'error_samples': list(self.errors),
+            'top': [{'name': f.name, 'type': f.type, 'series': f.series, 'bytes': f.bytes,
+                     'labels': f.cardinality()} for f in self.top(top)],
+        }
+
+
+def main():
+    import argparse
+    import json
+    import sys
+
+    import http_probe
+
+    parser = argparse.ArgumentParser(description='Report families, series and label cardinality of an exporter')
+    parser.add_argument('source', help="host:port of an exporter, a file, or '-' for stdin")
+    parser.add_argument('--path', default='/metrics', help='HTTP path (default: /metrics)')
+    parser.add_argument('--top', type=int, default=10, help='Largest families to show (default: 10)')
+    parser.add_argument('--max-series', type=int, help='Stop and fail once the exporter exposes more series than this')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    exposition = ExpositionParser(max_series=args.max_series)
+    host, _, port = args.source.rpartition(':')
+    if args.source == '-':
+        exposition.feed_lines(sys.stdin)
+    elif host and port.isdigit():
+        result = http_probe.probe(host.strip('[]'), int(port), path=args.path, timeout=30, parser=exposition)
+        if result['status'] != 200:
+            print(f"❌ {result['url']}: {result['error']}")
+            raise SystemExit(1)
+    else:
+        with open(args.source, 'r', encoding='utf-8', errors='replace') as f:
+            exposition.feed_lines(f)
+
+    report = exposition.summary(args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"📊 {report['families']} families, {report['series']} series, {report['bytes'] / 1024:.1f} KiB")
+        if report['stopped'] == 'max_series':
+            print(f"🛑 Stopped after {args.max_series} series: cardinality is above the limit")
+        print(f"\n{'Family':48s} {'type':>9s} {'series':>8s} {'KiB':>8s}  labels (distinct values)")
+        for family in report['top']:
+            labels = ', '.join(f"{label}={count}" for label, count in family['labels'].items())
+            print(f"{family['name'][:48]:48s} {family['type']:>9s} {family['series']:8d} "
+                  f"{family['bytes'] / 1024:8.1f}  {labels}")
+        if report['errors']:
+            print(f"\n⚠️  {report['errors']} format error(s):")
+            for error in report['error_samples']:
+                print(f"   {error}")
+    raise SystemExit(1 if report['errors'] or report['stopped'] == 'max_series' else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Exporter HTTP Probe
+Shared by diagnose_monitoring.py and deploy_monitor.py to check that exporters answer.
+
+Checking an exporter used to mean forking curl and downloading the whole
+/metrics body to look for one metric prefix. The probe keeps a pool of
+keep-alive connections per exporter, feeds the exposition text line by line to
+the streaming parser in exposition.py and stops as soon as the parser has what
+it needs, and records how long the exporter took to answer.
+"""
+
+import http.client
+import socket
+import threading
+import time
+
+from exposition import ExpositionParser
+
+DEFAULT_TIMEOUT = 5
+# Idle connections kept per exporter
+MAX_IDLE = 4
+# Unread bodies up to this size are drained so the connection can be reused
+DRAIN_LIMIT = 64 * 1024
+MAX_LINE = 1024 * 1024
+
+# Errors meaning a pooled connection was closed by the other end while idle
+_STALE = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+class HttpProbe:
+    """Keep-alive HTTP client that reads /metrics only as far as it needs to"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_idle=MAX_IDLE):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = {}   # (host, port) -> [HTTPConnection]
+        self.connections = 0
+        self.probes = 0
+
+    def _checkout(self, host, port, timeout):
+        with self._lock:
+            idle = self._idle.get((host, port))
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            self.connections += 1
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _checkin(self, host, port, conn):
+        with self._lock:
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _request(self, host, port, path, timeout):
+        conn, reused = self._checkout(host, port, timeout)
+        try:
+            conn.request('GET', path, headers={'Accept': 'text/plain'})
+            return conn, conn.getresponse()
+        except _STALE:
+            conn.close()
+            if not reused:
+                raise
+        # The pooled connection had gone away; one retry on a fresh one
+        with self._lock:
+            self.connections += 1
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.request('GET', path, headers={'Accept': 'text/plain'})
+        return conn, conn.getresponse()
+
+    def probe(self, host, port, prefixes=(), path='/metrics', timeout=None, parser=None):
+        """Fetch path and stop at the first metric family starting with one of prefixes
+
+        Pass an ExpositionParser as parser to scan the body with its own stop
+        conditions instead; it holds the per-family statistics afterwards.
+
+        Returns a dict with 'ok' (answered 200 and, if prefixes were given, a
+        match was found), 'status', 'matched' (the metric family), 'sample'
+        (the matching line), 'latency' (seconds to the response headers),
+        'seconds' (total), 'bytes' read, 'families', 'series' and 'errors'
+        seen before stopping, and 'error'.
+        """
+        if parser is None and prefixes:
+            parser = ExpositionParser(stop_prefixes=prefixes)
+        timeout = self.timeout if timeout is None else timeout
+        result = {'url': f"http://{host}:{port}{path}", 'ok': False, 'status': None, 'matched': None,
+                  'sample': None, 'latency': None, 'seconds': None, 'bytes': 0,
+                  'families': 0, 'series': 0, 'errors': 0, 'error': None}
+        started = time.monotonic()
+        conn = None
+        try:
+            conn, response = self._request(host, port, path, timeout)
+            result['latency'] = round(time.monotonic() - started, 4)
+            result['status'] = response.status
+            if response.status != 200:
+                result['error'] = f"HTTP {response.status} {response.reason}"
+            elif parser is None:
+                result['ok'] = True
+            else:
+                while True:
+                    line = response.readline(MAX_LINE)
+                    if not line:
+                        break
+                    result['bytes'] += len(line)
+                    if not parser.feed(line):
+                        break
+                result.update(matched=parser.matched, sample=parser.matched_line, families=len(parser.families),
+                              series=parser.series, errors=parser.error_count)
+                if prefixes and not parser.matched:
+                    result['error'] = f"no {'/'.join(p + '*' for p in prefixes)} metrics"
+                else:
+                    result['ok'] = True
+
+            # Reuse the connection only if the rest of the body is cheap to skip
+            if not response.isclosed() and (response.length is None or response.length > DRAIN_LIMIT):
+                conn.close()
+            else:
+                response.read()
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._checkin(host, port, conn)
+            conn = None
+        except (OSError, http.client.HTTPException) as e:
+            result['error'] = 'timed out' if isinstance(e, socket.timeout) else (str(e) or type(e).__name__)
+        finally:
+            if conn is not None:
+                conn.close()
+            result['seconds'] = round(time.monotonic() - started, 4)
+            with self._lock:
+                self.probes += 1
+        return result
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_probe():
+    """Process-wide probe, so every caller shares one connection pool"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = HttpProbe()
+        return _default
+
+
+def probe(host, port, prefixes=(), path='/metrics', timeout=None, parser=None):
+    return default_probe().probe(host, port, prefixes, path, timeout, parser)
+
+
+def main():
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description='Check that exporters answer, reading only as much /metrics as needed')
+    parser.add_argument('endpoints', nargs='+', help='host:port of each exporter')
+    parser.add_argument('--prefix', action='append', help='Metric prefix to look for (repeatable, default: any 200)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help=f'Seconds per probe (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--parallel', '-j', type=int, default=32, help='Probes in flight (default: 32)')
+    args = parser.parse_args()
+
+    client = HttpProbe(timeout=args.timeout)
+    targets = []
+    for endpoint in args.endpoints:
+        host, _, port = endpoint.rpartition(':')
+        targets.append((host.strip('[]'), int(port)))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+        results = list(pool.map(lambda t: client.probe(t[0], t[1], tuple(args.prefix or ())), targets))
+
+    failed = 0
+    for (host, port), result in zip(targets, results):
+        if result['ok']:
+            found = f" {result['matched']}" if result['matched'] else ''
+            print(f"✓ {host}:{port} {result['latency'] * 1000:7.1f} ms, {result['bytes']} B read{found}")
+        else:
+            failed += 1
+            print(f"✗ {host}:{port} {result['error']}")
+    print(f"\n{len(results)} probe(s) in {time.monotonic() - started:.2f}s over {client.connections} connection(s)")
+    client.close()
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,18 +4,20 @@ Network Devices Management Script
 Reads network_devices.txt and generates Prometheus targets JSON
 """
 
-import json
 import os
 import sys
 import ipaddress
-import subprocess
 from pathlib import Path
 
+import prometheus_reload
+import target_files
+
 # Paths
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 DEVICES_FILE = PROJECT_ROOT / "network_devices.txt"
 TARGETS_FILE = PROJECT_ROOT / "prometheus" / "network_devices.json"
+PROMETHEUS_CONFIG = PROJECT_ROOT / "prometheus" / "prometheus.yml"
 
 # Configuration from environment
 PROMETHEUS_HOST = os.environ.get('PROMETHEUS_HOST', 'prometheus')
@@ -83,33 +85,28 @@ def generate_targets(devices):
     return targets
 
 def write_targets(targets):
-    """Write targets to JSON file"""
-    TARGETS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    
-    with open(TARGETS_FILE, 'w') as f:
-        json.dump(targets, f, indent=2)
-    
+    """Write targets to JSON file, returning False when it was already up to date"""
+    if not target_files.write_targets(TARGETS_FILE, targets):
+        print(f"✅ {TARGETS_FILE} already up to date ({len(targets)} targets)")
+        return False
+
     print(f"✅ Generated {len(targets)} targets in {TARGETS_FILE}")
+    return True
 
-def reload_prometheus():
-    """Reload Prometheus configuration"""
+def reload_prometheus(force=False):
+    """Reload Prometheus configuration if prometheus.yml or a rule file changed"""
     prometheus_url = f"http://{PROMETHEUS_HOST}:{PROMETHEUS_PORT}/-/reload"
     try:
-        # Try to reload via HTTP API
-        result = subprocess.run(
-            ['curl', '-s', '-X', 'POST', prometheus_url],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-
-        if result.returncode == 0:
-            print("✅ Prometheus configuration reloaded")
-        else:
-            print("⚠️  Could not reload Prometheus (may need manual restart)")
+        result = prometheus_reload.reload_if_needed(prometheus_url, PROMETHEUS_CONFIG, force=force)
     except Exception as e:
         print(f"⚠️  Could not reload Prometheus: {e}")
         print("   Restart manually: docker compose restart prometheus")
+        return
+
+    if result['reloaded']:
+        print(f"✅ Prometheus configuration reloaded ({result['latency'] * 1000:.0f}ms)")
+    else:
+        print(f"⏭️  Prometheus reload skipped: {result['reason']}")
 
 def main():
     print("=" * 50)
@@ -138,13 +135,13 @@ def main():
     print("📝 Generating Prometheus targets...")
     targets = generate_targets(devices)
     
-    # Write targets
+    # Write targets (file_sd picks them up without a reload)
     write_targets(targets)
     print()
     
-    # Reload Prometheus
-    print("🔄 Reloading Prometheus...")
-    reload_prometheus()
+    # Reload Prometheus only if its config changed
+    print("🔄 Checking Prometheus configuration...")
+    reload_prometheus(force='--reload' in sys.argv)
     print()
     
     print("=" * 50)
@@ -4,24 +4,60 @@ Automatic Network Discovery Script
 Scans configured subnets and automatically discovers network devices
 """
 
+import csv
 import json
+import mmap
 import os
 import yaml
 import subprocess
 import re
+import signal
 import ipaddress
 import logging
+import socket
+import struct
+import threading
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from datetime import datetime
-from typing import List, Dict, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from device_inventory import DeviceInventory
+from prometheus_reload import reload_if_needed
+from target_files import write_atomic, write_targets
 
 # Paths - configurable via environment
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = Path(os.environ.get('PROJECT_ROOT', SCRIPT_DIR.parent))
-CONFIG_FILE = Path(os.environ.get('CONFIG_FILE', PROJECT_ROOT / "network_discovery.yml"))
+CONFIG_FILE = Path(os.environ.get('CONFIG_FILE', PROJECT_ROOT / "network-discovery" / "network_discovery.yml"))
 DEVICES_FILE = Path(os.environ.get('DEVICES_FILE', PROJECT_ROOT / "network_devices.txt"))
 DISCOVERED_DB = Path(os.environ.get('DISCOVERED_DB', PROJECT_ROOT / "network_devices_discovered.json"))
+INVENTORY_DB = Path(os.environ.get('INVENTORY_DB', DISCOVERED_DB.parent / "network_devices.db"))
 TARGETS_FILE = Path(os.environ.get('TARGETS_FILE', PROJECT_ROOT / "prometheus" / "network_devices.json"))
+PROMETHEUS_CONFIG = Path(os.environ.get('PROMETHEUS_CONFIG', TARGETS_FILE.parent / "prometheus.yml"))
+# Caches and incremental-scan state live beside the inventory (a volume in the container)
+STATE_DIR = INVENTORY_DB.parent
+DNS_CACHE = Path(os.environ.get('DNS_CACHE', STATE_DIR / "network_devices_dns_cache.json"))
+PORT_CACHE = Path(os.environ.get('PORT_CACHE', STATE_DIR / "network_devices_port_cache.json"))
+SCAN_STATE = Path(os.environ.get('SCAN_STATE', STATE_DIR / "network_devices_scan_state.json"))
+OUI_INDEX = Path(os.environ.get('OUI_INDEX', STATE_DIR / "oui.idx"))
+
+# IEEE registry files looked for when building the OUI index (ieee-data and nmap packages)
+OUI_SOURCES = [
+    Path(p) for p in os.environ.get('OUI_SOURCE', '').split(os.pathsep) if p
+] + [
+    PROJECT_ROOT / "oui.csv",
+    Path("/usr/share/ieee-data/oui.csv"),
+    Path("/usr/share/ieee-data/oui.txt"),
+    Path("/usr/share/nmap/nmap-mac-prefixes"),
+]
+
+# Ports probed when the config does not list any
+DEFAULT_FINGERPRINT_PORTS = [22, 80, 443, 554, 3389, 445, 139, 8000, 8080]
 
 # Setup logging
 logging.basicConfig(
@@ -31,11 +67,440 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def wait_until(futures, deadline_at: float, stop: Optional[threading.Event] = None, poll: float = 0.5):
+    """wait() for futures until a monotonic deadline, returning early once stop is set"""
+    pending = set(futures)
+    done = set()
+    while pending and not (stop and stop.is_set()):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            break
+        finished, pending = wait(pending, timeout=min(poll, remaining) if stop else remaining)
+        done |= finished
+    return done, pending
+
+
+class TTLCache:
+    """Small JSON-backed key/value cache with per-entry expiry"""
+
+    def __init__(self, path: Path, label: str = 'cache'):
+        self.path = path
+        self.label = label
+        self.entries = self.load()
+        self._dirty = False
+
+    def load(self) -> dict:
+        """Load cached entries ({key: {'value': ..., 'expires': epoch}})"""
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logger.warning(f"Ignoring unreadable {self.label} {self.path}: {e}")
+        return {}
+
+    def save(self):
+        """Persist the cache, dropping expired entries (only when something changed)"""
+        if not self._dirty:
+            return
+        now = time.time()
+        self.entries = {k: e for k, e in self.entries.items() if e.get('expires', 0) > now}
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(self.entries, f)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Could not save {self.label} {self.path}: {e}")
+
+    def get(self, key: str):
+        """Return the cached value, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry and entry.get('expires', 0) > time.time():
+            return entry.get('value')
+        return None
+
+    def put(self, key: str, value, ttl: float):
+        """Store a value for ttl seconds"""
+        self.entries[key] = {'value': value, 'expires': time.time() + ttl}
+        self._dirty = True
+
+
+class HostnameResolver:
+    """Concurrent in-process reverse DNS with a persistent TTL and negative cache"""
+
+    def __init__(self, cache_path: Path, ttl: float = 86400, negative_ttl: float = 3600,
+                 workers: int = 32, timeout: float = 10):
+        self.cache = TTLCache(cache_path, 'DNS cache')
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.timeout = timeout
+
+    def save_cache(self):
+        """Persist cached lookups"""
+        self.cache.save()
+
+    def cached(self, ip: str) -> Optional[str]:
+        """Return the cached hostname ('' for a cached miss), or None if not cached/expired"""
+        return self.cache.get(ip)
+
+    def remember(self, ip: str, hostname: str):
+        """Store a lookup result; empty hostnames go to the negative cache"""
+        self.cache.put(ip, hostname, self.ttl if hostname else self.negative_ttl)
+
+    @staticmethod
+    def lookup(ip: str) -> Optional[str]:
+        """Single PTR lookup; returns '' when the address has no name, None when DNS failed"""
+        try:
+            return socket.gethostbyaddr(ip)[0].rstrip('.')
+        except socket.herror as e:
+            # TRY_AGAIN is a resolver failure, not an answer
+            return None if e.errno == 2 else ''
+        except (socket.gaierror, OSError):
+            return None
+
+    def resolve_many(self, ips: List[str], stop: Optional[threading.Event] = None) -> Dict[str, str]:
+        """Resolve many IPs, serving cache hits and looking up the rest concurrently"""
+        results = {}
+        misses = []
+        for ip in dict.fromkeys(ips):
+            hostname = self.cached(ip)
+            if hostname is None:
+                misses.append(ip)
+            else:
+                results[ip] = hostname
+
+        if misses:
+            started = time.monotonic()
+            executor = ThreadPoolExecutor(max_workers=min(self.workers, len(misses)),
+                                          thread_name_prefix='dns')
+            futures = {executor.submit(self.lookup, ip): ip for ip in misses}
+            done, pending = wait_until(futures, started + self.timeout, stop)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+            failed = 0
+            for future in done:
+                ip = futures[future]
+                hostname = future.result()
+                if hostname is None:
+                    failed += 1
+                    hostname = ''
+                else:
+                    self.remember(ip, hostname)
+                results[ip] = hostname
+            # Timed-out and failed lookups are not negative-cached, they are retried next pass
+            for future in pending:
+                results[futures[future]] = ''
+
+            logger.info(f"Reverse DNS: {len(ips) - len(misses)} cached, {len(done) - failed} resolved, "
+                        f"{failed} failed, {len(pending)} timed out in {time.monotonic() - started:.1f}s")
+
+        return results
+
+
+class OUIIndex:
+    """Memory-mapped MAC prefix (OUI) -> vendor index
+
+    The index is an open-addressing hash table of 24-bit OUIs built from an
+    IEEE registry file (oui.csv, oui.txt or nmap-mac-prefixes). Lookups probe
+    the mapped table directly and return interned vendor strings, so repeated
+    lookups do not build new objects. The table is written in native byte
+    order, so build it on the machine (or image) that uses it.
+    """
+
+    MAGIC = b'OUI1'
+    HEADER = struct.Struct('<4sIII')  # magic, slot count, name count, names offset
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._mmap = None
+        self._slots = None
+        self._offsets = None
+        self._mask = 0
+        self._names = []
+        if path.exists():
+            try:
+                self._open()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable OUI index {path}: {e}")
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, slot_count, name_count, names_offset = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError('bad magic')
+        view = memoryview(self._mmap)
+        slots_end = self.HEADER.size + slot_count * 8
+        self._slots = view[self.HEADER.size:slots_end].cast('I')
+        self._offsets = view[slots_end:slots_end + (name_count + 1) * 4].cast('I')
+        self._names_offset = names_offset
+        self._mask = slot_count - 1
+        self._names = [None] * name_count
+
+    @property
+    def loaded(self) -> bool:
+        return self._slots is not None
+
+    @staticmethod
+    def oui_key(mac: str) -> int:
+        """First three bytes of a MAC as an int ('AA:BB:CC:..', 'AA-BB-CC-..' or 'AABBCC..'), -1 if invalid"""
+        try:
+            if len(mac) >= 8 and mac[2] in ':-':
+                return int(mac[0:2], 16) << 16 | int(mac[3:5], 16) << 8 | int(mac[6:8], 16)
+            return int(mac[:6], 16) if len(mac) >= 6 else -1
+        except ValueError:
+            return -1
+
+    @staticmethod
+    def _slot(key: int, mask: int) -> int:
+        return (key * 2654435761) & mask
+
+    def _name(self, name_id: int) -> str:
+        name = self._names[name_id]
+        if name is None:
+            start, end = self._offsets[name_id], self._offsets[name_id + 1]
+            name = self._mmap[self._names_offset + start:self._names_offset + end].decode('utf-8')
+            self._names[name_id] = name
+        return name
+
+    def lookup(self, mac: str) -> str:
+        """Vendor for a MAC address, '' if unknown or no index is loaded"""
+        if self._slots is None:
+            return ''
+        key = self.oui_key(mac)
+        if key < 0:
+            return ''
+        slots, mask = self._slots, self._mask
+        i = self._slot(key, mask)
+        while True:
+            stored = slots[2 * i]
+            if stored == 0:
+                return ''
+            if stored == key + 1:
+                return self._name(slots[2 * i + 1])
+            i = (i + 1) & mask
+
+    @staticmethod
+    def iter_registry(path: Path) -> Iterator[Tuple[int, str]]:
+        """Yield (oui, vendor) from IEEE oui.csv, IEEE oui.txt or nmap-mac-prefixes"""
+        if path.suffix == '.csv':
+            with open(path, newline='', encoding='utf-8', errors='replace') as f:
+                for row in csv.reader(f):
+                    if len(row) >= 3 and len(row[1]) == 6:
+                        try:
+                            yield int(row[1], 16), row[2].strip()
+                        except ValueError:
+                            continue  # Header row
+            return
+
+        txt_line = re.compile(r'^\s*([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})\s+\(hex\)\s+(.+)$')
+        nmap_line = re.compile(r'^([0-9A-Fa-f]{6})\s+(.+)$')
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                match = txt_line.match(line)
+                if match:
+                    yield int(''.join(match.group(1, 2, 3)), 16), match.group(4).strip()
+                    continue
+                match = nmap_line.match(line)
+                if match:
+                    yield int(match.group(1), 16), match.group(2).strip()
+
+    @classmethod
+    def build(cls, source: Path, path: Path) -> int:
+        """Build an index file from a registry file, returning the number of OUIs"""
+        entries = {}
+        for key, vendor in cls.iter_registry(source):
+            entries.setdefault(key, vendor)
+        if not entries:
+            raise ValueError(f"no OUI entries found in {source}")
+
+        slot_count = 1
+        while slot_count < len(entries) * 2:
+            slot_count <<= 1
+        mask = slot_count - 1
+
+        name_ids = {}
+        slots = array('I', bytes(slot_count * 8))
+        for key, vendor in entries.items():
+            name_id = name_ids.setdefault(vendor, len(name_ids))
+            i = cls._slot(key, mask)
+            while slots[2 * i]:
+                i = (i + 1) & mask
+            slots[2 * i] = key + 1
+            slots[2 * i + 1] = name_id
+
+        blob = bytearray()
+        offsets = array('I', [0])
+        for vendor in name_ids:
+            blob += vendor.encode('utf-8')
+            offsets.append(len(blob))
+
+        names_offset = cls.HEADER.size + len(slots) * 4 + len(offsets) * 4
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, slot_count, len(name_ids), names_offset))
+            f.write(slots.tobytes())
+            f.write(offsets.tobytes())
+            f.write(blob)
+        os.replace(tmp, path)
+        return len(entries)
+
+
+# Confidence levels in increasing order
+CONFIDENCE_RANK = {'none': 0, 'low': 1, 'medium': 2, 'high': 3}
+
+
+class DeviceClassifier:
+    """Classification rules compiled once per config load
+
+    Rule precedence matches the config: port rules, then hostname rules, then
+    MAC vendor rules, each in the order they are listed.
+    """
+
+    def __init__(self, rules: dict):
+        port_rules = rules.get('port_rules') or []
+        hostname_rules = rules.get('hostname_rules') or []
+        vendor_rules = rules.get('mac_vendor_rules') or []
+
+        # Port -> bitmap of the port rules that list it; lowest set bit wins
+        self.port_results = [(r['type'], r.get('confidence', 'medium')) for r in port_rules]
+        self.port_bitmap = {}
+        for index, rule in enumerate(port_rules):
+            for port in rule['ports']:
+                self.port_bitmap[int(port)] = self.port_bitmap.get(int(port), 0) | (1 << index)
+
+        self.hostname_results = [(r['type'], r.get('confidence', 'medium')) for r in hostname_rules]
+        self.hostname_regex = self._compile_hostname_rules([r['pattern'] for r in hostname_rules])
+        self.hostname_fallback = None
+        if self.hostname_regex is None:
+            self.hostname_fallback = [re.compile(r['pattern']) for r in hostname_rules]
+
+        self.vendor_needles = [(r['vendor'].lower(), r['type'], r.get('confidence', 'low'))
+                               for r in vendor_rules]
+        # Vendor string -> result; a network has few distinct vendors, so this stays small
+        self.vendor_memo = {}
+
+    @staticmethod
+    def _compile_hostname_rules(patterns: List[str]) -> Optional['re.Pattern']:
+        """Combine hostname patterns into one alternation that keeps rule order
+
+        Each rule becomes a named lookahead tried at position 0, so the first
+        rule (not the leftmost match) wins, exactly like checking them in turn.
+        """
+        if not patterns:
+            return None
+        branches = []
+        for index, pattern in enumerate(patterns):
+            # Leading global flags such as (?i) must become scoped flags inside the alternation
+            flags = re.match(r'^\(\?([aiLmsux]+)\)', pattern)
+            if flags:
+                pattern = f"(?{flags.group(1)}:{pattern[flags.end():]})"
+            branches.append(f"(?P<r{index}>(?=.*?(?:{pattern})))")
+        try:
+            return re.compile('|'.join(branches), re.DOTALL)
+        except re.error as e:
+            # Patterns with backreferences or group names cannot be merged safely
+            logger.warning(f"Could not combine hostname rules ({e}), matching them one by one")
+            return None
+
+    def classify(self, device: Dict) -> Tuple[str, str]:
+        """Return (device_type, confidence) for a device"""
+        ports = device.get('ports')
+        if ports:
+            mask = 0
+            for port in ports:
+                mask |= self.port_bitmap.get(port, 0)
+            if mask:
+                return self.port_results[(mask & -mask).bit_length() - 1]
+
+        hostname = device.get('hostname')
+        if hostname:
+            if self.hostname_regex is not None:
+                match = self.hostname_regex.match(hostname)
+                if match:
+                    return self.hostname_results[int(match.lastgroup[1:])]
+            elif self.hostname_fallback:
+                for index, regex in enumerate(self.hostname_fallback):
+                    if regex.search(hostname):
+                        return self.hostname_results[index]
+
+        vendor = device.get('vendor')
+        if vendor:
+            result = self.vendor_memo.get(vendor)
+            if result is None:
+                lowered = vendor.lower()
+                result = next(((t, c) for needle, t, c in self.vendor_needles if needle in lowered),
+                              ('unknown', 'none'))
+                self.vendor_memo[vendor] = result
+            return result
+
+        return ('unknown', 'none')
+
+
+def benchmark_classifier(config: dict, count: int = 10000) -> dict:
+    """Time DeviceClassifier on synthetic devices drawn from the config's own rules"""
+    rules = config['device_classification']
+    vendors = [r['vendor'] + ' Inc.' for r in rules.get('mac_vendor_rules', [])] + ['Unknown Vendor', '']
+    hostnames = ['iPhone-de-Ana', 'DESKTOP-4F2K1', 'printer-2nd-floor', 'camera-gate', '', 'esp32-a1b2']
+    port_sets = [[], [22], [554, 80], [3389], [9100], [445, 139]]
+    devices = [
+        {
+            'ip': f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            'hostname': hostnames[i % len(hostnames)],
+            'vendor': vendors[i % len(vendors)],
+            'ports': port_sets[i % len(port_sets)],
+        }
+        for i in range(count)
+    ]
+
+    started = time.perf_counter()
+    classifier = DeviceClassifier(rules)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for device in devices:
+        classifier.classify(device)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'devices': count,
+        'build_ms': build * 1000,
+        'total_ms': elapsed * 1000,
+        'per_device_us': elapsed / count * 1e6,
+    }
+
+
 class NetworkDiscovery:
     def __init__(self, config_path: Path):
+        self.config_path = config_path
         self.config = self.load_config(config_path)
-        self.discovered_devices = self.load_discovered_db()
+        self.config_mtime = config_path.stat().st_mtime
+        self.inventory = self.load_inventory()
         self.manual_devices = self.load_manual_devices()
+        self.resolver = HostnameResolver(DNS_CACHE)
+        self.oui = self.load_oui_index()
+        self.apply_config()
+        self.stats = {
+            'passes': {},
+            'pass_failures': 0,
+            'new_devices': 0,
+            'devices_found': 0,
+            'last_pass_timestamp': 0.0,
+            'last_pass_duration': 0.0,
+            'reloads': {'success': 0, 'failure': 0},
+            'last_reload_duration': 0.0,
+            'prometheus_reloads': {'reloaded': 0, 'skipped': 0, 'failure': 0},
+            'last_prometheus_reload_latency': 0.0,
+        }
+        self.port_cache = TTLCache(PORT_CACHE, 'port cache')
+        self.scan_state = self.load_scan_state()
+        self.last_scan_jobs = []
+        self.scan_metrics = {}
+        self.last_scan_duration = 0.0
+        self._metrics_lock = threading.Lock()
+        # Set by the daemon's signal handler; running scans are killed and the pass abandoned
+        self.stop = threading.Event()
         
     def load_config(self, config_path: Path) -> dict:
         """Load configuration from YAML file"""
@@ -46,34 +511,318 @@ class NetworkDiscovery:
         with open(config_path, 'r') as f:
             return yaml.safe_load(f)
     
-    def load_discovered_db(self) -> dict:
-        """Load discovered devices database"""
-        if DISCOVERED_DB.exists():
-            with open(DISCOVERED_DB, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def save_discovered_db(self):
-        """Save discovered devices database"""
-        with open(DISCOVERED_DB, 'w') as f:
-            json.dump(self.discovered_devices, f, indent=2)
+    def apply_config(self):
+        """Compile classification rules and apply DNS settings (resolver cache is kept)"""
+        self.classifier = DeviceClassifier(self.config['device_classification'])
+        self.excluded_ouis, self.excluded_prefixes = self._compile_mac_prefixes(
+            self.config['exclude'].get('mac_prefixes') or [])
+        dns = self.config.get('dns') or {}
+        self.resolver.ttl = float(dns.get('ttl', 86400))
+        self.resolver.negative_ttl = float(dns.get('negative_ttl', 3600))
+        self.resolver.workers = int(dns.get('workers', 32))
+        self.resolver.timeout = float(dns.get('timeout', 10))
+
+    def reload_config(self) -> bool:
+        """Reload the YAML config in place, keeping the old one if the new one is invalid"""
+        started = time.monotonic()
+        try:
+            config = self.load_config(self.config_path)
+            for key in ('subnets', 'device_classification', 'exclude'):
+                if key not in config:
+                    raise ValueError(f"missing '{key}' section")
+        except Exception as e:
+            self.stats['reloads']['failure'] += 1
+            logger.error(f"Config reload failed, keeping previous config: {e}")
+            return False
+
+        self.config = config
+        self.apply_config()
+        self.stats['reloads']['success'] += 1
+        self.stats['last_reload_duration'] = time.monotonic() - started
+        logger.info(f"Reloaded {self.config_path} in {self.stats['last_reload_duration'] * 1000:.1f}ms")
+        return True
+
+    def load_oui_index(self) -> OUIIndex:
+        """Open the OUI index, (re)building it when a registry file is newer"""
+        source = next((p for p in OUI_SOURCES if p.exists()), None)
+        if source and (not OUI_INDEX.exists() or OUI_INDEX.stat().st_mtime < source.stat().st_mtime):
+            try:
+                count = OUIIndex.build(source, OUI_INDEX)
+                logger.info(f"Built OUI index with {count} prefixes from {source}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not build OUI index from {source}: {e}")
+        index = OUIIndex(OUI_INDEX)
+        if not index.loaded:
+            logger.info("No OUI index available, vendors come from nmap only")
+        return index
+
+    @staticmethod
+    def _compile_mac_prefixes(prefixes: List[str]) -> Tuple[set, List[str]]:
+        """Split exclude.mac_prefixes into OUI ints (checked in O(1)) and other-length prefixes"""
+        ouis = set()
+        others = []
+        for prefix in prefixes:
+            hexdigits = re.sub(r'[^0-9A-Fa-f]', '', str(prefix)).upper()
+            if len(hexdigits) == 6:
+                ouis.add(int(hexdigits, 16))
+            elif hexdigits:
+                others.append(hexdigits)
+        return ouis, others
+
+    def load_inventory(self) -> DeviceInventory:
+        """Open the device inventory, importing the legacy JSON database on first use"""
+        inventory = DeviceInventory(INVENTORY_DB)
+        try:
+            imported = inventory.migrate(DISCOVERED_DB, DEVICES_FILE)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not migrate {DISCOVERED_DB} into {INVENTORY_DB}: {e}")
+            imported = 0
+        if imported:
+            logger.info(f"Migrated {imported} device(s) into {INVENTORY_DB}")
+        return inventory
     
+    def load_scan_state(self) -> dict:
+        """Load incremental scan state (cycle counter, churned chunks, hosts alive last pass)"""
+        if SCAN_STATE.exists():
+            try:
+                with open(SCAN_STATE, 'r') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logger.warning(f"Ignoring unreadable scan state {SCAN_STATE}: {e}")
+        return {'cycle': 0, 'churn': [], 'alive': []}
+
+    def save_scan_state(self):
+        """Save incremental scan state"""
+        try:
+            with open(SCAN_STATE, 'w') as f:
+                json.dump(self.scan_state, f)
+        except OSError as e:
+            logger.warning(f"Could not save scan state {SCAN_STATE}: {e}")
+
     def load_manual_devices(self) -> set:
-        """Load manually added devices (IPs)"""
-        manual_ips = set()
-        if DEVICES_FILE.exists():
-            with open(DEVICES_FILE, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        parts = line.split(',')
-                        if len(parts) >= 1:
-                            manual_ips.add(parts[0].strip())
-        return manual_ips
+        """Load manually added devices (IPs), re-parsing network_devices.txt only when it changed"""
+        self.inventory.sync_manual(DEVICES_FILE)
+        return self.inventory.manual_ips()
     
-    def scan_subnet(self, subnet: str) -> List[Dict]:
+    def _scan_settings(self) -> dict:
+        """Return scan tuning options with defaults applied"""
+        scan = self.config.get('scan') or {}
+        return {
+            'workers': max(1, int(scan.get('workers', 4))),
+            'chunk_prefix': int(scan.get('chunk_prefix', 24)),
+            'subnet_timeout': float(scan.get('subnet_timeout', 120)),
+            'deadline': float(scan.get('deadline', self.config.get('scan_interval', 300))),
+        }
+
+    def split_subnets(self, subnets: List[str], chunk_prefix: int) -> List[str]:
+        """Split subnets larger than chunk_prefix into chunks (e.g. a /22 into four /24s)"""
+        chunks = []
+        seen = set()
+        for subnet in subnets:
+            try:
+                network = ipaddress.ip_network(subnet, strict=False)
+            except ValueError:
+                logger.warning(f"Invalid subnet in config: {subnet}")
+                continue
+
+            if network.prefixlen < chunk_prefix <= network.max_prefixlen:
+                parts = [str(n) for n in network.subnets(new_prefix=chunk_prefix)]
+            else:
+                parts = [str(network)]
+
+            for part in parts:
+                if part not in seen:
+                    seen.add(part)
+                    chunks.append(part)
+        return chunks
+
+    def _record_scan_metric(self, subnet: str, started: float, devices: int, status: str):
+        """Record timing and result of a single subnet scan"""
+        with self._metrics_lock:
+            self.scan_metrics[subnet] = {
+                'duration': round(time.monotonic() - started, 3),
+                'devices': devices,
+                'status': status
+            }
+
+    def _incremental_settings(self) -> dict:
+        """Return incremental discovery options with defaults applied"""
+        incremental = self.config.get('incremental') or {}
+        return {
+            'enabled': bool(incremental.get('enabled', True)),
+            'full_sweep_every': max(1, int(incremental.get('full_sweep_every', 6))),
+            'max_age_hours': float(incremental.get('max_age_hours', 168)),
+            'batch_size': max(1, int(incremental.get('batch_size', 256))),
+        }
+
+    def _history_settings(self) -> dict:
+        """Return sighting history options with defaults applied"""
+        history = self.config.get('history') or {}
+        interval = float(self.config.get('scan_interval', 300))
+        return {
+            'enabled': bool(history.get('enabled', True)),
+            'gap': float(history.get('gap', 3 * interval)),
+            'retention_days': float(history.get('retention_days', 90)),
+            'merge_gap': float(history.get('merge_gap', 3600)),
+        }
+
+    def record_history(self, devices: List[Dict]):
+        """Log this pass's MAC sightings and compact the history once a day"""
+        settings = self._history_settings()
+        if not settings['enabled']:
+            return
+        now = time.time()
+        sightings = [(d['mac'], d['ip']) for d in devices if d.get('mac') and not self.should_exclude(d)]
+        opened = self.inventory.record_sightings(sightings, now, settings['gap'])
+        logger.info(f"History: {len(sightings)} sighting(s), {opened} new interval(s)")
+
+        if now - float(self.inventory.get_meta('history_compacted_at', 0)) >= 86400:
+            result = self.inventory.compact_history(settings['retention_days'] * 86400,
+                                                    settings['merge_gap'], now)
+            logger.info(f"History compacted: {result['dropped']} expired, {result['merged']} merged")
+
+    def _chunk_networks(self) -> List[Tuple[str, ipaddress.IPv4Network]]:
+        """Configured subnets split into scan chunks, paired with their network objects"""
+        chunks = self.split_subnets(self.config['subnets'], self._scan_settings()['chunk_prefix'])
+        return [(chunk, ipaddress.ip_network(chunk)) for chunk in chunks]
+
+    @staticmethod
+    def _chunk_of(ip: str, networks: List[Tuple[str, ipaddress.IPv4Network]]) -> Optional[str]:
+        """Return the scan chunk an address belongs to"""
+        address = ipaddress.ip_address(ip)
+        for chunk, network in networks:
+            if address in network:
+                return chunk
+        return None
+
+    def known_hosts(self, networks: List[Tuple[str, ipaddress.IPv4Network]], max_age_hours: float) -> List[str]:
+        """Discovered IPs inside the given chunks, most recently seen first"""
+        cutoff = (datetime.now() - timedelta(hours=max_age_hours)).isoformat()
+        return [
+            ip for ip, _ in self.inventory.seen_since(cutoff)
+            if ip not in self.config['exclude']['ips'] and self._chunk_of(ip, networks)
+        ]
+
+    def plan_pass(self, force_full: bool = False) -> dict:
+        """Decide between a full sweep and a liveness pass over known hosts plus churned chunks"""
+        settings = self._incremental_settings()
+        networks = self._chunk_networks()
+        cycle = self.scan_state.get('cycle', 0)
+
+        if (force_full or not settings['enabled'] or not self.inventory.count()
+                or cycle % settings['full_sweep_every'] == 0):
+            return {'mode': 'full', 'subnets': [chunk for chunk, _ in networks], 'hosts': []}
+
+        churn = set(self.scan_state.get('churn', []))
+        # Known hosts inside chunks that get a full sweep anyway are not pinged twice
+        quiet = [(chunk, network) for chunk, network in networks if chunk not in churn]
+        return {
+            'mode': 'incremental',
+            'subnets': [chunk for chunk, _ in networks if chunk in churn],
+            'hosts': self.known_hosts(quiet, settings['max_age_hours'])
+        }
+
+    def build_scan_jobs(self, subnets: List[str], hosts: Optional[List[str]] = None) -> List[Tuple[str, List[str]]]:
+        """Turn subnets and known hosts into (label, nmap targets) jobs, known hosts first"""
+        jobs = []
+        if hosts:
+            batch_size = self._incremental_settings()['batch_size']
+            for i in range(0, len(hosts), batch_size):
+                jobs.append((f"known/{i // batch_size + 1}", hosts[i:i + batch_size]))
+        for chunk in self.split_subnets(subnets, self._scan_settings()['chunk_prefix']):
+            jobs.append((chunk, [chunk]))
+        return jobs
+
+    def scan_all(self, subnets: List[str], hosts: Optional[List[str]] = None) -> List[Dict]:
+        """Scan subnets and known hosts concurrently on a bounded worker pool within an overall deadline"""
+        settings = self._scan_settings()
+        jobs = self.build_scan_jobs(subnets, hosts)
+        workers = min(settings['workers'], len(jobs)) or 1
+        started = time.monotonic()
+        deadline_at = started + settings['deadline']
+        self.scan_metrics = {}
+        self.last_scan_jobs = jobs
+
+        logger.info(f"Scanning {len(jobs)} chunk(s) with {workers} worker(s), "
+                    f"deadline {settings['deadline']:g}s")
+
+        def run(label, targets):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0 or self.stop.is_set():
+                self._record_scan_metric(label, time.monotonic(), 0, 'skipped')
+                return []
+            return self.scan_targets(label, targets, timeout=min(settings['subnet_timeout'], remaining))
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+        futures = [executor.submit(run, label, targets) for label, targets in jobs]
+        _, pending = wait_until(futures, deadline_at, self.stop)
+        if pending and self.stop.is_set():
+            logger.warning(f"Stopping with {len(pending)} chunk(s) unfinished")
+        elif pending:
+            logger.warning(f"Scan deadline of {settings['deadline']:g}s reached with "
+                           f"{len(pending)} chunk(s) unfinished, keeping partial results")
+        # Queued chunks are dropped; running ones are already capped at the deadline
+        executor.shutdown(wait=True, cancel_futures=True)
+
+        # Merge in job order so overlapping subnets keep the first result per IP
+        devices_by_ip = {}
+        for (label, _), future in zip(jobs, futures):
+            if future.cancelled():
+                self._record_scan_metric(label, time.monotonic(), 0, 'skipped')
+                continue
+            for device in future.result():
+                devices_by_ip.setdefault(device['ip'], device)
+
+        for label, _ in jobs:
+            metric = self.scan_metrics.get(label)
+            if metric:
+                logger.info(f"  {label:18} {metric['status']:8} {metric['devices']:4d} devices "
+                            f"in {metric['duration']:.1f}s")
+
+        self.last_scan_duration = round(time.monotonic() - started, 3)
+        logger.info(f"Scanned {len(jobs)} chunk(s) in {self.last_scan_duration:.1f}s")
+
+        return list(devices_by_ip.values())
+
+    def update_churn(self, plan: dict, devices: List[Dict]):
+        """Mark chunks whose set of live hosts changed so the next pass sweeps them fully"""
+        networks = self._chunk_networks()
+
+        # Only judge what was actually scanned to completion this pass
+        completed = [targets for label, targets in self.last_scan_jobs
+                     if self.scan_metrics.get(label, {}).get('status') == 'ok']
+        swept = {t for targets in completed for t in targets if '/' in t}
+        pinged = {t for targets in completed for t in targets if '/' not in t}
+
+        def in_scope(ip):
+            return ip in pinged or self._chunk_of(ip, networks) in swept
+
+        previous = {ip for ip in self.scan_state.get('alive', []) if self._chunk_of(ip, networks)}
+        alive = {d['ip'] for d in devices}
+        changed = {ip for ip in previous ^ alive if in_scope(ip)}
+        # The very first pass has nothing to compare against
+        if not self.scan_state.get('cycle'):
+            changed = set()
+        churn = sorted({self._chunk_of(ip, networks) for ip in changed} - {None})
+
+        self.scan_state.update({
+            'cycle': self.scan_state.get('cycle', 0) + 1,
+            'mode': plan['mode'],
+            'churn': churn,
+            'alive': sorted({ip for ip in previous if not in_scope(ip)} | alive),
+        })
+        if churn:
+            logger.info(f"Churn detected in {len(churn)} chunk(s): {', '.join(churn)}")
+
+    def scan_subnet(self, subnet: str, timeout: float = 120) -> List[Dict]:
         """Scan subnet using nmap with ARP discovery"""
-        logger.info(f"Scanning subnet: {subnet}")
+        return self.scan_targets(subnet, [subnet], timeout)
+
+    def scan_targets(self, label: str, targets: List[str], timeout: float = 120) -> List[Dict]:
+        """Ping-scan subnets or explicit host lists, streaming results as nmap reports them"""
+        logger.info(f"Scanning {label}" + (f" ({len(targets)} hosts)" if [label] != targets else ""))
+        started = time.monotonic()
+        devices = []
 
         try:
             # nmap scan: ARP discovery (works best for local network)
@@ -84,144 +833,230 @@ class NetworkDiscovery:
                 '-sn',  # Ping scan only
                 '-PR',  # ARP ping (best for local network)
                 '-PE',  # ICMP echo (fallback)
+                '-n',   # No nmap DNS - names come from the cached resolver
                 '-T4',  # Faster timing
                 '--min-rate', '300',
                 '--max-retries', '2',
                 '--host-timeout', '10s',
-                subnet
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-            
-            devices = self.parse_nmap_output(result.stdout)
+                '-oX', '-',  # XML on stdout, parsed while the scan runs
+            ] + targets
 
-            # Get hostnames (skip port scan for speed)
-            for device in devices:
-                device['ports'] = []  # Skip individual port scans for speed
-                if not device.get('hostname'):
-                    device['hostname'] = self.get_hostname(device['ip'])
+            # Hosts are collected as nmap reports them; they are classified in discover()
+            # once hostnames and ports are known
+            for device in self.stream_nmap_hosts(cmd, timeout):
+                device['ports'] = []  # Filled in by the batched fingerprint_ports pass
+                devices.append(device)
 
+            self._record_scan_metric(label, started, len(devices), 'ok')
             return devices
             
         except subprocess.TimeoutExpired:
-            logger.error(f"Scan timeout for subnet {subnet}")
-            return []
+            logger.error(f"Scan timeout for {label}")
+            self._record_scan_metric(label, started, len(devices), 'timeout')
+            return devices
         except FileNotFoundError:
             logger.error("nmap not found. Install with: apt install nmap")
+            self._record_scan_metric(label, started, 0, 'error')
             return []
         except Exception as e:
-            logger.error(f"Error scanning subnet {subnet}: {e}")
-            return []
-    
-    def parse_nmap_output(self, output: str) -> List[Dict]:
-        """Parse nmap output to extract devices"""
-        devices = []
-        current_device = None
-        
-        for line in output.split('\n'):
-            # Match IP address line
-            ip_match = re.search(r'Nmap scan report for (?:([^\s]+) \()?(\d+\.\d+\.\d+\.\d+)', line)
-            if ip_match:
-                if current_device:
-                    devices.append(current_device)
-                
-                hostname = ip_match.group(1) if ip_match.group(1) else ''
-                ip = ip_match.group(2)
-                
-                current_device = {
-                    'ip': ip,
-                    'hostname': hostname,
-                    'mac': '',
-                    'vendor': ''
-                }
-            
-            # Match MAC address
-            mac_match = re.search(r'MAC Address: ([0-9A-F:]+) \(([^)]+)\)', line)
-            if mac_match and current_device:
-                current_device['mac'] = mac_match.group(1)
-                current_device['vendor'] = mac_match.group(2)
-        
-        if current_device:
-            devices.append(current_device)
-        
-        return devices
+            logger.error(f"Error scanning {label}: {e}")
+            self._record_scan_metric(label, started, len(devices), 'error')
+            return devices
+
+    def stream_nmap_hosts(self, cmd: List[str], timeout: float) -> Iterator[Dict]:
+        """Run nmap with -oX - and yield each host as soon as its <host> element closes"""
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                start_new_session=True)
+        timed_out = threading.Event()
+        finished = threading.Event()
+
+        def watch():
+            # Kill nmap at its timeout, or as soon as the daemon is asked to stop
+            deadline_at = time.monotonic() + timeout
+            while not finished.wait(min(0.5, max(0, deadline_at - time.monotonic()))):
+                if self.stop.is_set() or time.monotonic() >= deadline_at:
+                    timed_out.set()
+                    # Kill the whole process group so no child keeps stdout open
+                    try:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    return
+
+        watcher = threading.Thread(target=watch, name='nmap-watch', daemon=True)
+        watcher.start()
+        parser = ET.XMLPullParser(events=('end',))
+        try:
+            for chunk in iter(lambda: proc.stdout.read1(65536), b''):
+                parser.feed(chunk)
+                for _, elem in parser.read_events():
+                    if elem.tag == 'host':
+                        device = self.parse_host_element(elem)
+                        elem.clear()
+                        if device:
+                            yield device
+            proc.wait()
+        finally:
+            finished.set()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    @staticmethod
+    def parse_host_element(host: ET.Element) -> Optional[Dict]:
+        """Convert an nmap XML <host> element into a device dict (None if not up)"""
+        status = host.find('status')
+        if status is not None and status.get('state') != 'up':
+            return None
+
+        device = {'ip': '', 'hostname': '', 'mac': '', 'vendor': ''}
+        for address in host.iterfind('address'):
+            addrtype = address.get('addrtype')
+            if addrtype == 'ipv4':
+                device['ip'] = address.get('addr', '')
+            elif addrtype == 'mac':
+                device['mac'] = address.get('addr', '')
+                device['vendor'] = address.get('vendor', '')
+
+        hostname = host.find('hostnames/hostname')
+        if hostname is not None:
+            device['hostname'] = hostname.get('name', '')
+
+        ports = host.find('ports')
+        if ports is not None:
+            device['ports'] = [
+                int(port.get('portid'))
+                for port in ports.iterfind('port')
+                if port.get('protocol') == 'tcp' and port.find("state[@state='open']") is not None
+            ]
+
+        return device if device['ip'] else None
     
-    def scan_ports(self, ip: str) -> List[int]:
-        """Quick port scan for common ports"""
-        common_ports = [22, 80, 443, 554, 3389, 445, 139, 8000, 8080]
-        open_ports = []
+    def _port_scan_settings(self) -> dict:
+        """Return port fingerprint options with defaults applied"""
+        port_scan = self.config.get('port_scan') or {}
+        ports = port_scan.get('ports')
+        if not ports:
+            # Probe exactly the ports the classification rules look at
+            rules = self.config['device_classification'].get('port_rules', [])
+            ports = sorted({port for rule in rules for port in rule['ports']}) or DEFAULT_FINGERPRINT_PORTS
+        return {
+            'enabled': bool(port_scan.get('enabled', True)),
+            'ports': [int(p) for p in ports],
+            'batch_size': max(1, int(port_scan.get('batch_size', 256))),
+            'workers': max(1, int(port_scan.get('workers', 2))),
+            'ttl': float(port_scan.get('ttl', 86400)),
+            'timeout': float(port_scan.get('timeout', 120)),
+        }
+
+    @staticmethod
+    def _port_cache_key(device: Dict) -> str:
+        """Port results are cached per MAC; devices seen only via ICMP fall back to IP"""
+        return device['mac'].upper() if device.get('mac') else f"ip:{device['ip']}"
+
+    def scan_ports(self, ips: List[str], ports: List[int], timeout: float = 120) -> Dict[str, List[int]]:
+        """Scan many hosts for open ports in a single nmap run
+
+        Only a run that completes says anything about hosts nmap did not
+        report; after a timeout or failure just the reported hosts are returned.
+        """
+        wanted = set(ips)
+        open_ports = {}
+        if self.stop.is_set():
+            return open_ports
 
         try:
             cmd = [
                 'nmap',
-                '-p', ','.join(map(str, common_ports)),
+                '-p', ','.join(map(str, ports)),
                 '--open',
-                '-T5',  # Fastest timing
-                '--host-timeout', '5s',
-                ip
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=15
-            )
+                '-Pn',  # Hosts are already known to be up
+                '-n',
+                '-T4',
+                '--max-retries', '1',
+                '--host-timeout', '10s',
+                '-oX', '-',
+            ] + ips
             
-            for line in result.stdout.split('\n'):
-                port_match = re.search(r'(\d+)/tcp\s+open', line)
-                if port_match:
-                    open_ports.append(int(port_match.group(1)))
+            for device in self.stream_nmap_hosts(cmd, timeout):
+                if device['ip'] in wanted:
+                    open_ports[device['ip']] = sorted(device.get('ports', []))
         
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Port scan timed out for {len(ips)} host(s); keeping {len(open_ports)} reported")
+            return open_ports
         except Exception as e:
-            logger.debug(f"Port scan error for {ip}: {e}")
+            logger.debug(f"Port scan error for {len(ips)} host(s): {e}")
+            return open_ports
         
-        return open_ports
+        # With --open, hosts nmap did not report have none of the ports open
+        return {ip: open_ports.get(ip, []) for ip in ips}
+
+    def fingerprint_ports(self, devices: List[Dict]):
+        """Fill in open ports for a pass with a few batched nmap runs, skipping cached hosts"""
+        settings = self._port_scan_settings()
+        if not settings['enabled'] or not devices:
+            return
+
+        to_scan = {}
+        cached = 0
+        for device in devices:
+            ports = self.port_cache.get(self._port_cache_key(device))
+            if ports is None:
+                to_scan[device['ip']] = device
+            else:
+                device['ports'] = ports
+                cached += 1
+
+        if to_scan:
+            started = time.monotonic()
+            ips = list(to_scan)
+            batches = [ips[i:i + settings['batch_size']] for i in range(0, len(ips), settings['batch_size'])]
+            with ThreadPoolExecutor(max_workers=min(settings['workers'], len(batches)),
+                                    thread_name_prefix='ports') as executor:
+                results = executor.map(
+                    lambda batch: self.scan_ports(batch, settings['ports'], settings['timeout']),
+                    batches
+                )
+                scanned = 0
+                for batch_result in results:
+                    for ip, ports in batch_result.items():
+                        device = to_scan[ip]
+                        device['ports'] = ports
+                        self.port_cache.put(self._port_cache_key(device), ports, settings['ttl'])
+                        scanned += 1
+
+            logger.info(f"Port fingerprint: {cached} cached, {scanned} scanned in "
+                        f"{len(batches)} batch(es) in {time.monotonic() - started:.1f}s")
+            self.port_cache.save()
     
     def get_hostname(self, ip: str) -> str:
         """Get hostname via reverse DNS"""
-        try:
-            result = subprocess.run(
-                ['host', ip],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            
-            match = re.search(r'pointer (.+)\.', result.stdout)
-            if match:
-                return match.group(1)
-        except Exception:
-            pass
-        
-        return ''
+        return self.resolver.resolve_many([ip]).get(ip, '')
+
+    def resolve_hostnames(self, devices: List[Dict]):
+        """Fill in missing hostnames with one batched, cached reverse DNS pass"""
+        unnamed = [d['ip'] for d in devices if not d.get('hostname')]
+        if not unnamed:
+            return
+        hostnames = self.resolver.resolve_many(unnamed, self.stop)
+        for device in devices:
+            if not device.get('hostname'):
+                device['hostname'] = hostnames.get(device['ip'], '')
+        self.resolver.save_cache()
     
-    def classify_device(self, device: Dict) -> str:
-        """Classify device type based on heuristics"""
-        
-        # Check port-based rules
-        for rule in self.config['device_classification']['port_rules']:
-            if any(port in device.get('ports', []) for port in rule['ports']):
-                return rule['type']
-        
-        # Check hostname patterns
-        hostname = device.get('hostname', '')
-        for rule in self.config['device_classification']['hostname_rules']:
-            if re.search(rule['pattern'], hostname):
-                return rule['type']
-        
-        # Check MAC vendor
-        vendor = device.get('vendor', '')
-        for rule in self.config['device_classification']['mac_vendor_rules']:
-            if rule['vendor'].lower() in vendor.lower():
-                return rule['type']
-        
-        return 'unknown'
+    def classify_device(self, device: Dict) -> Tuple[str, str]:
+        """Classify device type based on heuristics, returning (type, confidence)"""
+        # nmap only names vendors it knows; fall back to the local OUI registry
+        if not device.get('vendor') and device.get('mac'):
+            device['vendor'] = self.oui.lookup(device['mac'])
+        return self.classifier.classify(device)
     
     def should_exclude(self, device: Dict) -> bool:
         """Check if device should be excluded"""
@@ -233,152 +1068,175 @@ class NetworkDiscovery:
         
         # Check excluded MAC prefixes
         mac = device.get('mac', '')
-        for prefix in self.config['exclude']['mac_prefixes']:
-            if mac.startswith(prefix):
+        if mac:
+            if self.excluded_ouis and OUIIndex.oui_key(mac) in self.excluded_ouis:
                 return True
+            if self.excluded_prefixes:
+                hexdigits = mac.replace(':', '').replace('-', '').upper()
+                if any(hexdigits.startswith(prefix) for prefix in self.excluded_prefixes):
+                    return True
         
         return False
     
-    def discover(self):
+    def discover(self, force_full: bool = False):
         """Main discovery process"""
+        started = time.monotonic()
+        plan = self.plan_pass(force_full)
+
         logger.info("=" * 60)
-        logger.info("Starting network discovery")
+        logger.info(f"Starting network discovery ({plan['mode']} pass)")
         logger.info("=" * 60)
         
-        all_devices = []
-        
-        # Scan all configured subnets
-        for subnet in self.config['subnets']:
-            devices = self.scan_subnet(subnet)
-            all_devices.extend(devices)
+        if plan['mode'] == 'incremental':
+            logger.info(f"Liveness check for {len(plan['hosts'])} known host(s), "
+                        f"full sweep of {len(plan['subnets'])} churned chunk(s)")
+
+        # Scan all configured subnets (or only known hosts and churned chunks)
+        all_devices = self.scan_all(plan['subnets'], plan['hosts'])
         
         logger.info(f"Found {len(all_devices)} devices")
+
+        candidates = [d for d in all_devices
+                      if not self.should_exclude(d) and d['ip'] not in self.manual_devices]
+        self.resolve_hostnames(candidates)
+        self.fingerprint_ports(candidates)
+        if self.stop.is_set():
+            # Partial results would look like churn and missing ports; leave everything as it was
+            logger.warning("Stop requested, discarding this pass")
+            return
+        self.update_churn(plan, all_devices)
+        # Classified once everything is known, so ports, then hostname, then vendor decide
+        for device in candidates:
+            device['type'], device['confidence'] = self.classify_device(device)
         
         # Process discovered devices
         new_devices = 0
         updated_devices = 0
+        retyped_devices = 0
+        renamed_devices = 0
+        now = datetime.now().isoformat()
+        known_devices = self.inventory.get_many(d['ip'] for d in all_devices)
         
-        for device in all_devices:
-            ip = device['ip']
-            
-            # Skip excluded devices
-            if self.should_exclude(device):
-                logger.debug(f"Excluding {ip}")
-                continue
-            
-            # Skip manually managed devices
-            if ip in self.manual_devices:
-                logger.debug(f"Skipping manual device {ip}")
-                continue
-            
-            # Classify device
-            device_type = self.classify_device(device)
-            
-            # Generate device name
-            if device.get('hostname'):
-                device_name = device['hostname']
-            else:
-                device_name = f"Device-{ip.split('.')[-1]}"
-            
-            # Update discovered database
-            if ip not in self.discovered_devices:
-                # New device
-                self.discovered_devices[ip] = {
-                    'name': device_name,
-                    'type': device_type,
-                    'mac': device.get('mac', ''),
-                    'vendor': device.get('vendor', ''),
-                    'first_seen': datetime.now().isoformat(),
-                    'last_seen': datetime.now().isoformat(),
-                    'ports': device.get('ports', []),
-                    'auto_discovered': True
-                }
-                new_devices += 1
-                logger.info(f"✨ New device: {ip} ({device_name}) - {device_type}")
-            else:
-                # Update existing device
-                self.discovered_devices[ip]['last_seen'] = datetime.now().isoformat()
-                self.discovered_devices[ip]['ports'] = device.get('ports', [])
+        # One transaction per pass; only the devices seen in this pass are written
+        with self.inventory.transaction():
+            for device in all_devices:
+                ip = device['ip']
+                
+                # Skip excluded devices
+                if self.should_exclude(device):
+                    logger.debug(f"Excluding {ip}")
+                    continue
+                
+                # Skip manually managed devices
+                if ip in self.manual_devices:
+                    logger.debug(f"Skipping manual device {ip}")
+                    continue
+                
+                device_type = device['type']
+                confidence = device['confidence']
+                
+                # Generate device name
+                placeholder = f"Device-{ip.split('.')[-1]}"
+                device_name = device.get('hostname') or placeholder
                 
-                # Update type if it was unknown
-                if self.discovered_devices[ip]['type'] == 'unknown' and device_type != 'unknown':
-                    self.discovered_devices[ip]['type'] = device_type
-                    logger.info(f"🔄 Updated type for {ip}: {device_type}")
+                # Update discovered database
+                known = known_devices.get(ip)
+                if known is None:
+                    # New device
+                    self.inventory.upsert({
+                        'ip': ip,
+                        'name': device_name,
+                        'type': device_type,
+                        'confidence': confidence,
+                        'mac': device.get('mac', ''),
+                        'vendor': device.get('vendor', ''),
+                        'first_seen': now,
+                        'last_seen': now,
+                        'ports': device.get('ports', []),
+                        'auto_discovered': True
+                    })
+                    new_devices += 1
+                    logger.info(f"✨ New device: {ip} ({device_name}) - {device_type}")
+                    continue
+
+                # Update type if it was unknown or a more confident rule now matches
+                known_rank = CONFIDENCE_RANK.get(known.get('confidence', 'low'), 1)
+                if known['type'] == 'unknown':
+                    known_rank = 0
+                retype = (device_type != 'unknown' and device_type != known['type']
+                          and CONFIDENCE_RANK.get(confidence, 0) > known_rank)
+                # A name given while DNS was slow or down is replaced once a lookup succeeds
+                rename = device_name != placeholder and known['name'] == placeholder
+                if retype or rename:
+                    if retype:
+                        known.update(type=device_type, confidence=confidence)
+                        logger.info(f"🔄 Updated type for {ip}: {device_type} ({confidence} confidence)")
+                        retyped_devices += 1
+                    if rename:
+                        known['name'] = device_name
+                        logger.info(f"🏷️  Named {ip}: {device_name}")
+                        renamed_devices += 1
+                    known.update(last_seen=now, ports=device.get('ports', []))
+                    self.inventory.upsert(known)
+                else:
+                    # Existing device: only the sighting changes
+                    self.inventory.touch(ip, now, device.get('ports', []))
                 
                 updated_devices += 1
-        
-        # Save discovered database
-        self.save_discovered_db()
-        
-        # Update network_devices.txt
-        self.update_devices_file()
-        
-        # Generate Prometheus targets
-        self.generate_targets()
+
+        self.record_history(all_devices)
+
+        # Device list and targets only depend on names/types, so rewrite them when those
+        # changed, on full sweeps, or when network_devices.txt was edited by hand
+        devices_mtime = DEVICES_FILE.stat().st_mtime if DEVICES_FILE.exists() else 0
+        if (new_devices or retyped_devices or renamed_devices or plan['mode'] == 'full'
+                or devices_mtime != self.scan_state.get('devices_mtime')):
+            # Update network_devices.txt
+            self.update_devices_file()
+            
+            # Generate Prometheus targets
+            self.generate_targets()
+            self.scan_state['devices_mtime'] = DEVICES_FILE.stat().st_mtime
+        else:
+            logger.info("No device changes, target files left untouched")
+
+        self.save_scan_state()
+
+        self.stats['passes'][plan['mode']] = self.stats['passes'].get(plan['mode'], 0) + 1
+        self.stats['new_devices'] += new_devices
+        self.stats['devices_found'] = len(all_devices)
+        self.stats['last_pass_timestamp'] = time.time()
+        self.stats['last_pass_duration'] = time.monotonic() - started
         
         logger.info("=" * 60)
         logger.info(f"Discovery complete: {new_devices} new, {updated_devices} updated")
         logger.info("=" * 60)
     
     def _read_all_devices(self):
-        """Read all devices from network_devices.txt (deduplicated)"""
-        devices = []
-        seen_ips = set()
-        if DEVICES_FILE.exists():
-            with open(DEVICES_FILE, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        parts = [p.strip() for p in line.split(',')]
-                        if len(parts) == 3:
-                            ip = parts[0]
-                            # Skip duplicates (keep first occurrence)
-                            if ip not in seen_ips:
-                                seen_ips.add(ip)
-                                devices.append({
-                                    'ip': ip,
-                                    'name': parts[1],
-                                    'type': parts[2]
-                                })
+        """All devices for the targets file: manual entries in file order, then auto-discovered ones"""
+        devices = list(self.inventory.manual_devices())
+        manual_ips = self.inventory.manual_ips()
+        for info in self.inventory.devices(auto_only=True):
+            if info['ip'] not in manual_ips:
+                devices.append({'ip': info['ip'], 'name': info['name'], 'type': info['type']})
         return devices
 
     def update_devices_file(self):
         """Update network_devices.txt with discovered devices"""
-        # Read existing manual entries (stop at AUTO-DISCOVERED marker)
-        manual_lines = []
-        manual_ips = set()
-        in_auto_section = False
-
-        if DEVICES_FILE.exists():
-            with open(DEVICES_FILE, 'r') as f:
-                for line in f:
-                    line_stripped = line.strip()
-                    # Stop reading manual entries when we hit auto-discovered section
-                    if '# AUTO-DISCOVERED' in line_stripped:
-                        in_auto_section = True
-                        continue
-                    if in_auto_section:
-                        continue
-                    manual_lines.append(line)
-                    # Track manual IPs to avoid duplicates
-                    if line_stripped and not line_stripped.startswith('#'):
-                        parts = line_stripped.split(',')
-                        if len(parts) >= 1:
-                            manual_ips.add(parts[0].strip())
-
-        # Write back with auto-discovered section
-        with open(DEVICES_FILE, 'w') as f:
-            # Write manual entries
-            for line in manual_lines:
-                f.write(line)
-
-            # Write auto-discovered section (excluding IPs already in manual section)
-            auto_devices = {ip: info for ip, info in self.discovered_devices.items()
-                          if info.get('auto_discovered', False) and ip not in manual_ips}
-            if auto_devices:
-                f.write('\n# AUTO-DISCOVERED DEVICES (managed automatically)\n')
-                for ip, info in sorted(auto_devices.items()):
-                    f.write(f"{ip},{info['name']},{info['type']}\n")
+        # Manual section as last parsed (kept verbatim, comments included)
+        self.inventory.sync_manual(DEVICES_FILE)
+        manual_ips = self.inventory.manual_ips()
+
+        # Manual entries, then the auto-discovered section (excluding IPs already in manual section)
+        lines = [self.inventory.manual_section()]
+        auto_devices = [info for info in self.inventory.devices(auto_only=True)
+                        if info['ip'] not in manual_ips]
+        if auto_devices:
+            lines.append('\n# AUTO-DISCOVERED DEVICES (managed automatically)\n')
+            lines += [f"{info['ip']},{info['name']},{info['type']}\n" for info in auto_devices]
+        # Written to a temp file and renamed, so a kill mid-write can't truncate it
+        write_atomic(DEVICES_FILE, ''.join(lines).encode())
+        self.inventory.mark_devices_file_written(DEVICES_FILE)
         
         logger.info(f"Updated {DEVICES_FILE}")
     
@@ -396,35 +1254,161 @@ class NetworkDiscovery:
                 }
             })
 
-        # Write targets
-        TARGETS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(TARGETS_FILE, 'w') as f:
-            json.dump(targets, f, indent=2)
-
-        logger.info(f"Generated {len(targets)} Prometheus targets")
+        # Write targets (skipped when nothing changed); file_sd picks them up without a reload
+        if write_targets(TARGETS_FILE, targets):
+            logger.info(f"Generated {len(targets)} Prometheus targets")
+        else:
+            logger.info(f"Prometheus targets unchanged ({len(targets)} targets)")
 
-        # Reload Prometheus
+        # Reload Prometheus only if its config changed
         self._reload_prometheus()
 
     def _reload_prometheus(self):
-        """Reload Prometheus configuration"""
+        """Reload Prometheus configuration if prometheus.yml or a rule file changed"""
         prometheus_host = os.environ.get('PROMETHEUS_HOST', 'prometheus')
         prometheus_port = os.environ.get('PROMETHEUS_PORT', '9090')
         prometheus_url = f"http://{prometheus_host}:{prometheus_port}/-/reload"
 
         try:
-            result = subprocess.run(
-                ['curl', '-s', '-X', 'POST', prometheus_url],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                logger.info("Prometheus configuration reloaded")
-            else:
-                logger.warning("Could not reload Prometheus")
+            result = reload_if_needed(prometheus_url, PROMETHEUS_CONFIG)
         except Exception as e:
+            self.stats['prometheus_reloads']['failure'] += 1
             logger.warning(f"Could not reload Prometheus: {e}")
+            return
+
+        if result['reloaded']:
+            self.stats['prometheus_reloads']['reloaded'] += 1
+            self.stats['last_prometheus_reload_latency'] = result['latency']
+            logger.info(f"Prometheus configuration reloaded in {result['latency'] * 1000:.0f}ms")
+        else:
+            self.stats['prometheus_reloads']['skipped'] += 1
+            logger.info(f"Prometheus reload skipped: {result['reason']}")
+
+    def render_metrics(self) -> str:
+        """Render discovery statistics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP network_discovery_pass_duration_seconds Duration of the last discovery pass.',
+            '# TYPE network_discovery_pass_duration_seconds gauge',
+            f"network_discovery_pass_duration_seconds {self.stats['last_pass_duration']:.3f}",
+            '# HELP network_discovery_scan_duration_seconds Duration of the nmap phase of the last pass.',
+            '# TYPE network_discovery_scan_duration_seconds gauge',
+            f"network_discovery_scan_duration_seconds {self.last_scan_duration:.3f}",
+            '# HELP network_discovery_chunk_duration_seconds Duration of each scan chunk in the last pass.',
+            '# TYPE network_discovery_chunk_duration_seconds gauge',
+        ]
+        with self._metrics_lock:
+            chunk_metrics = dict(self.scan_metrics)
+        for chunk, metric in sorted(chunk_metrics.items()):
+            lines.append(f'network_discovery_chunk_duration_seconds{{chunk="{chunk}",status="{metric["status"]}"}} '
+                         f'{metric["duration"]:.3f}')
+        lines += [
+            '# HELP network_discovery_devices_found Devices that answered in the last pass.',
+            '# TYPE network_discovery_devices_found gauge',
+            f"network_discovery_devices_found {self.stats['devices_found']}",
+            '# HELP network_discovery_devices_known Devices in the discovered database.',
+            '# TYPE network_discovery_devices_known gauge',
+            f"network_discovery_devices_known {self.inventory.count()}",
+            '# HELP network_discovery_new_devices_total Devices discovered for the first time.',
+            '# TYPE network_discovery_new_devices_total counter',
+            f"network_discovery_new_devices_total {self.stats['new_devices']}",
+            '# HELP network_discovery_passes_total Completed discovery passes by mode.',
+            '# TYPE network_discovery_passes_total counter',
+        ]
+        for mode, count in sorted(self.stats['passes'].items()):
+            lines.append(f'network_discovery_passes_total{{mode="{mode}"}} {count}')
+        lines += [
+            '# HELP network_discovery_pass_failures_total Discovery passes that raised an error.',
+            '# TYPE network_discovery_pass_failures_total counter',
+            f"network_discovery_pass_failures_total {self.stats['pass_failures']}",
+            '# HELP network_discovery_last_pass_timestamp_seconds Unix time the last pass finished.',
+            '# TYPE network_discovery_last_pass_timestamp_seconds gauge',
+            f"network_discovery_last_pass_timestamp_seconds {self.stats['last_pass_timestamp']:.0f}",
+            '# HELP network_discovery_config_reloads_total Config reloads by result.',
+            '# TYPE network_discovery_config_reloads_total counter',
+        ]
+        for result, count in sorted(self.stats['reloads'].items()):
+            lines.append(f'network_discovery_config_reloads_total{{result="{result}"}} {count}')
+        lines += [
+            '# HELP network_discovery_config_reload_duration_seconds Duration of the last successful reload.',
+            '# TYPE network_discovery_config_reload_duration_seconds gauge',
+            f"network_discovery_config_reload_duration_seconds {self.stats['last_reload_duration']:.6f}",
+            '# HELP network_discovery_prometheus_reloads_total Prometheus /-/reload decisions by result.',
+            '# TYPE network_discovery_prometheus_reloads_total counter',
+        ]
+        for result, count in sorted(self.stats['prometheus_reloads'].items()):
+            lines.append(f'network_discovery_prometheus_reloads_total{{result="{result}"}} {count}')
+        lines += [
+            '# HELP network_discovery_prometheus_reload_latency_seconds Latency of the last Prometheus reload.',
+            '# TYPE network_discovery_prometheus_reload_latency_seconds gauge',
+            f"network_discovery_prometheus_reload_latency_seconds {self.stats['last_prometheus_reload_latency']:.3f}",
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def serve_metrics(self, port: int) -> ThreadingHTTPServer:
+        """Serve /metrics on a background thread"""
+        discovery = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = discovery.render_metrics().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        logger.info(f"Serving metrics on :{port}/metrics")
+        return server
+
+    def run_daemon(self, interval: Optional[float] = None, metrics_port: int = 0,
+                   stop: Optional[threading.Event] = None, poll: float = 2.0):
+        """Run discovery passes on a fixed schedule, hot-reloading the config when it changes"""
+        stop = self.stop = stop or self.stop
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                signal.signal(sig, lambda *_: stop.set())
+            except ValueError:
+                pass  # Not on the main thread
+
+        server = self.serve_metrics(metrics_port) if metrics_port else None
+        next_run = time.monotonic()
+
+        try:
+            while not stop.is_set():
+                try:
+                    mtime = self.config_path.stat().st_mtime
+                except OSError:
+                    mtime = self.config_mtime
+                if mtime != self.config_mtime:
+                    self.config_mtime = mtime
+                    self.reload_config()
+
+                if time.monotonic() >= next_run:
+                    # Manual entries can be edited between passes
+                    self.manual_devices = self.load_manual_devices()
+                    try:
+                        self.discover()
+                    except Exception as e:
+                        self.stats['pass_failures'] += 1
+                        logger.exception(f"Discovery pass failed: {e}")
+                    period = interval or float(self.config.get('scan_interval', 300))
+                    # Keep a fixed cadence, but never queue up passes after an overrun
+                    next_run = max(next_run + period, time.monotonic())
+                    logger.info(f"Next pass in {next_run - time.monotonic():.0f}s")
+
+                stop.wait(max(0.1, min(poll, next_run - time.monotonic())))
+        finally:
+            if server:
+                server.shutdown()
+            logger.info("Discovery daemon stopped")
 
 
 def main():
@@ -432,13 +1416,40 @@ def main():
     
     parser = argparse.ArgumentParser(description='Network Device Discovery')
     parser.add_argument('--scan', action='store_true', help='Run discovery scan')
+    parser.add_argument('--full', action='store_true', help='Force a full sweep of every subnet')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run continuously with an internal scheduler and config hot reload')
+    parser.add_argument('--interval', type=float, default=float(os.environ.get('SCAN_INTERVAL', 0)) or None,
+                        help='Seconds between passes in daemon mode (default: scan_interval from config)')
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('METRICS_PORT', 9992)),
+                        help='Port for the /metrics endpoint in daemon mode, 0 to disable (default: 9992)')
     parser.add_argument('--config', default=str(CONFIG_FILE), help='Config file path')
+    parser.add_argument('--build-oui-index', nargs='?', const='', metavar='REGISTRY',
+                        help='Build the OUI vendor index from an IEEE registry file and exit')
+    parser.add_argument('--benchmark-classifier', type=int, nargs='?', const=10000, metavar='N',
+                        help='Time the compiled classifier on N synthetic devices (default: 10000)')
     
     args = parser.parse_args()
     
-    if args.scan:
+    if args.build_oui_index is not None:
+        source = Path(args.build_oui_index) if args.build_oui_index else next(
+            (p for p in OUI_SOURCES if p.exists()), None)
+        if not source:
+            parser.error("no IEEE registry file found; pass one explicitly")
+        count = OUIIndex.build(source, OUI_INDEX)
+        print(f"Indexed {count} OUIs from {source} into {OUI_INDEX}")
+    elif args.benchmark_classifier:
+        with open(args.config, 'r') as f:
+            config = yaml.safe_load(f)
+        result = benchmark_classifier(config, args.benchmark_classifier)
+        print(f"Classified {result['devices']} devices in {result['total_ms']:.1f}ms "
+              f"({result['per_device_us']:.2f}us/device, rules compiled in {result['build_ms']:.2f}ms)")
+    elif args.daemon:
+        discovery = NetworkDiscovery(Path(args.config))
+        discovery.run_daemon(interval=args.interval, metrics_port=args.metrics_port)
+    elif args.scan:
         discovery = NetworkDiscovery(Path(args.config))
-        discovery.discover()
+        discovery.discover(force_full=args.full)
     else:
         parser.print_help()
 
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Prometheus API Client
+Shared by check_health.py, verify_prometheus_targets.py, target_health.py and deploy_monitor.py.
+
+One client per process keeps a small pool of keep-alive connections to
+Prometheus, runs independent queries concurrently, and caches the target and
+alert lists for a couple of seconds so several checks in one command share a
+single fetch. Responses are parsed into compact named tuples that keep only
+the fields the scripts use (the discovered labels, which make up most of a
+/api/v1/targets response, are dropped).
+"""
+
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+
+PROMETHEUS_URL = os.environ.get('PROMETHEUS_URL', 'http://localhost:9990')
+DEFAULT_TIMEOUT = 10
+# Seconds a /api/v1/targets or /api/v1/alerts response is reused
+CACHE_TTL = 2.0
+MAX_IDLE = 4
+
+Target = namedtuple('Target', 'job instance endpoint scrape_url health last_error last_scrape scrape_duration labels')
+Alert = namedtuple('Alert', 'name state severity summary active_at labels annotations')
+Sample = namedtuple('Sample', 'labels value timestamp')
+
+_STALE = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+class PrometheusError(Exception):
+    """Prometheus could not be reached or answered with an error"""
+
+    def __init__(self, message, unreachable=False):
+        super().__init__(message)
+        self.unreachable = unreachable
+
+
+def _target(raw):
+    labels = raw.get('labels', {})
+    scrape_url = raw.get('scrapeUrl', '')
+    return Target(
+        job=sys.intern(labels.get('job', 'unknown')),
+        instance=labels.get('instance', 'unknown'),
+        endpoint=urlparse(scrape_url).netloc,
+        scrape_url=scrape_url,
+        health=sys.intern(raw.get('health', 'unknown')),
+        last_error=raw.get('lastError', ''),
+        last_scrape=raw.get('lastScrape'),
+        scrape_duration=raw.get('lastScrapeDuration', 0.0),
+        labels=labels,
+    )
+
+
+def _alert(raw):
+    labels = raw.get('labels', {})
+    annotations = raw.get('annotations', {})
+    return Alert(
+        name=labels.get('alertname', 'unknown'),
+        state=sys.intern(raw.get('state', 'unknown')),
+        severity=sys.intern(labels.get('severity', 'unknown')),
+        summary=annotations.get('summary', 'No summary'),
+        active_at=raw.get('activeAt'),
+        labels=labels,
+        annotations=annotations,
+    )
+
+
+def _samples(data):
+    """Samples of an instant query result (vector or scalar)"""
+    result = data.get('result', [])
+    if data.get('resultType') == 'scalar':
+        return [Sample({}, float(result[1]), result[0])]
+    return [Sample(item.get('metric', {}), float(item['value'][1]), item['value'][0])
+            for item in result if 'value' in item]
+
+
+class PrometheusClient:
+    """Pooled, caching client for the Prometheus HTTP API"""
+
+    def __init__(self, url=PROMETHEUS_URL, timeout=DEFAULT_TIMEOUT, cache_ttl=CACHE_TTL, max_idle=MAX_IDLE):
+        self.url = url.rstrip('/')
+        parsed = urlparse(self.url)
+        self._https = parsed.scheme == 'https'
+        self._host = parsed.hostname
+        self._port = parsed.port or (443 if self._https else 80)
+        self._prefix = parsed.path
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+        self._cache = {}        # key -> (fetched_at, parsed)
+        self._key_locks = {}
+        self.requests = 0
+        self.cache_hits = 0
+
+    def _connection(self):
+        cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        return cls(self._host, self._port, timeout=self.timeout)
+
+    def _send(self, conn, target):
+        conn.request('GET', target, headers={'Accept': 'application/json'})
+        response = conn.getresponse()
+        return response, response.read()
+
+    def api(self, path, params=None):
+        """GET an API path and return its 'data' field; raises PrometheusError"""
+        target = f"{self._prefix}{path}" + (f"?{urlencode(params)}" if params else '')
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.requests += 1
+        reused = conn is not None
+        if conn is None:
+            conn = self._connection()
+        try:
+            try:
+                response, body = self._send(conn, target)
+            except _STALE:
+                conn.close()
+                if not reused:
+                    raise
+                # The pooled connection had been closed by Prometheus; one retry on a fresh one
+                conn = self._connection()
+                response, body = self._send(conn, target)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise PrometheusError(f"Cannot connect to Prometheus at {self.url}: {e}", unreachable=True)
+
+        with self._lock:
+            keep = not response.will_close and len(self._idle) < self.max_idle
+            if keep:
+                self._idle.append(conn)
+        if not keep:
+            conn.close()
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise PrometheusError(f"{path}: HTTP {response.status}, response is not JSON")
+        if response.status != 200 or payload.get('status') != 'success':
+            raise PrometheusError(f"{path}: {payload.get('error') or f'HTTP {response.status}'}")
+        return payload.get('data', {})
+
+    def _cached(self, key, fetch, max_age):
+        """Reuse a recent result; concurrent callers for the same key share one fetch"""
+        max_age = self.cache_ttl if max_age is None else max_age
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] <= max_age:
+                with self._lock:
+                    self.cache_hits += 1
+                return cached[1]
+            value = fetch()
+            self._cache[key] = (time.monotonic(), value)
+            return value
+
+    def targets(self, state='active', max_age=None):
+        """Scrape targets as Target tuples; max_age=0 forces a fresh fetch"""
+        def fetch():
+            data = self.api('/api/v1/targets', {'state': state})
+            return [_target(raw) for raw in data.get('activeTargets', [])]
+        return self._cached(('targets', state), fetch, max_age)
+
+    def targets_raw(self, state='active'):
+        """The unparsed /api/v1/targets data, for callers that dump it"""
+        return self.api('/api/v1/targets', {'state': state})
+
+    def alerts(self, max_age=None):
+        """Active alerts as Alert tuples"""
+        def fetch():
+            return [_alert(raw) for raw in self.api('/api/v1/alerts').get('alerts', [])]
+        return self._cached(('alerts',), fetch, max_age)
+
+    def query(self, expr, at=None):
+        """Instant query; returns a list of Sample tuples"""
+        params = {'query': expr}
+        if at is not None:
+            params['time'] = at
+        return _samples(self.api('/api/v1/query', params))
+
+    def query_many(self, exprs, parallel=8):
+        """Run instant queries concurrently; returns {expr: [Sample] or PrometheusError}"""
+        def run(expr):
+            try:
+                return self.query(expr)
+            except PrometheusError as e:
+                return e
+        exprs = list(exprs)
+        if not exprs:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(exprs)))) as pool:
+            return dict(zip(exprs, pool.map(run, exprs)))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    """Process-wide client, so every check in a command shares its pool and cache"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = PrometheusClient()
+        return _default
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run instant queries against Prometheus concurrently')
+    parser.add_argument('queries', nargs='+', help='PromQL expressions')
+    parser.add_argument('--prometheus', default=PROMETHEUS_URL, help=f'Prometheus URL (default: {PROMETHEUS_URL})')
+    args = parser.parse_args()
+
+    client = PrometheusClient(args.prometheus)
+    failed = 0
+    for expr, result in client.query_many(args.queries).items():
+        if isinstance(result, PrometheusError):
+            failed += 1
+            print(f"❌ {expr}: {result}")
+            continue
+        print(f"✓ {expr}: {len(result)} series")
+        for sample in result[:10]:
+            labels = ', '.join(f'{k}="{v}"' for k, v in sorted(sample.labels.items()))
+            print(f"   {{{labels}}} {sample.value}")
+    print(f"\n{client.requests} request(s)")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Prometheus Reload Coordinator
+Shared by the discovery and device management scripts.
+
+file_sd target files are re-read by Prometheus on its own, so a /-/reload is
+only needed when prometheus.yml or a rule file changed. Reloads are keyed on a
+hash of the config files: whichever tool reloads first records the hash, and
+every other tool seeing the same hash skips its reload. A short debounce waits
+for in-progress edits to settle before reloading.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import time
+import urllib.request
+from pathlib import Path
+
+import yaml
+
+DEBOUNCE_SECONDS = 2.0
+# The debounce gives up after this many windows, so a file with a future mtime
+# (clock skew, cp -p) can't hold the lock forever
+MAX_DEBOUNCE_WINDOWS = 5
+STATE_FILE = '.reload_state.json'
+LOCK_FILE = '.reload.lock'
+
+
+def target_file_names(config_file):
+    """Basenames of every file referenced by a file_sd_configs block"""
+    try:
+        with open(config_file, 'r') as f:
+            config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError):
+        return set()
+    names = set()
+    for job in config.get('scrape_configs') or []:
+        for sd in job.get('file_sd_configs') or []:
+            for pattern in sd.get('files') or []:
+                names.add(os.path.basename(pattern))
+    return names
+
+
+def config_files(config_file):
+    """Every file under the config directory that only takes effect after a reload"""
+    root = Path(config_file).parent
+    targets = target_file_names(config_file)
+    files = []
+    for path in sorted(root.rglob('*')):
+        if not path.is_file() or path.name.startswith('.') or path.name in targets:
+            continue
+        if path.suffix in ('.yml', '.yaml'):
+            files.append(path)
+    return files
+
+
+def config_fingerprint(config_file):
+    """Hash of the reload-relevant config files and the newest mtime among them"""
+    digest = hashlib.sha256()
+    newest = 0.0
+    for path in config_files(config_file):
+        try:
+            data = path.read_bytes()
+            newest = max(newest, path.stat().st_mtime)
+        except OSError:
+            continue
+        digest.update(str(path.relative_to(Path(config_file).parent)).encode())
+        digest.update(b'\0')
+        digest.update(data)
+    return digest.hexdigest(), newest
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_state(state_path, state):
+    tmp = f"{state_path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, state_path)
+
+
+def reload_if_needed(reload_url, config_file, force=False, debounce=DEBOUNCE_SECONDS, timeout=5):
+    """Reload Prometheus only if its config changed since the last recorded reload
+
+    Returns a dict with 'reloaded' (bool), 'reason' and, after a reload,
+    'latency' in seconds. Raises on a failed reload so callers can report it.
+    """
+    config_file = Path(config_file)
+    if not config_file.exists():
+        return {'reloaded': False, 'reason': f"{config_file} not found"}
+    state_path = config_file.parent / STATE_FILE
+
+    fingerprint, _ = config_fingerprint(config_file)
+    if not force and _load_state(state_path).get('fingerprint') == fingerprint:
+        return {'reloaded': False, 'reason': 'only targets changed'}
+
+    # Serialise tools on the lock file so concurrent callers coalesce into one reload
+    with open(config_file.parent / LOCK_FILE, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Wait for the config to stop changing before reloading
+            give_up_at = time.monotonic() + debounce * MAX_DEBOUNCE_WINDOWS
+            while True:
+                fingerprint, newest = config_fingerprint(config_file)
+                quiet_for = time.time() - newest
+                remaining = give_up_at - time.monotonic()
+                if quiet_for >= debounce or remaining <= 0:
+                    break
+                time.sleep(min(debounce - quiet_for, debounce, remaining))
+
+            state = _load_state(state_path)
+            if not force and state.get('fingerprint') == fingerprint:
+                return {'reloaded': False, 'reason': 'already reloaded by another tool'}
+
+            started = time.monotonic()
+            request = urllib.request.Request(reload_url, method='POST')
+            with urllib.request.urlopen(request, timeout=timeout):
+                pass
+            latency = time.monotonic() - started
+
+            _save_state(state_path, {
+                'fingerprint': fingerprint,
+                'reloaded_at': time.time(),
+                'latency': latency,
+            })
+            return {'reloaded': True, 'reason': 'config changed', 'latency': latency}
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
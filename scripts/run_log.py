@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Deployment Run Log
+Written by deploy_monitor.py while a run is in progress.
+
+Every event (run start/end, each timed step, each host's outcome, health
+results, rollout stages) is appended to a JSON-lines file as it happens, so a
+crashed run still has everything up to the crash. --resume reads the log back
+to skip hosts that already finished; running this script summarises slow
+hosts and slow steps across runs.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS_DIR = os.environ.get('DEPLOY_RUNS_DIR', os.path.join(BASE_DIR, 'deploy_runs'))
+
+# Final host states a resumed run does not need to repeat
+DONE_STATUSES = {'healthy', 'skipped_health', 'skipped', 'converged'}
+
+
+class RunLog:
+    """Append-only JSON-lines event log, safe to write from several threads"""
+
+    def __init__(self, path=None):
+        os.makedirs(RUNS_DIR, exist_ok=True)
+        self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self.path = path or os.path.join(RUNS_DIR, f"{self.run_id}.jsonl")
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def event(self, kind, **fields):
+        record = {'event': kind, 'run': self.run_id, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            # Flushed per event so a crash loses nothing already reported
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_events(path):
+    """Events of a run log, skipping a torn last line"""
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def _is_plan(event):
+    """Whether a run_start event belongs to a --plan run (older logs only have it in options)"""
+    return bool(event.get('plan', (event.get('options') or {}).get('plan')))
+
+
+def latest_log():
+    """Newest log that was started by an apply run; --plan runs deployed nothing to resume"""
+    for path in sorted(glob.glob(os.path.join(RUNS_DIR, '*.jsonl')), reverse=True):
+        start = next((e for e in read_events(path) if e.get('event') == 'run_start'), None)
+        if start is not None and not _is_plan(start):
+            return path
+    return None
+
+
+def completed_hosts(path):
+    """Hosts whose last status reported by an apply run in the log is final"""
+    plan_runs = set()
+    status = {}
+    for event in read_events(path):
+        if event.get('event') == 'run_start' and _is_plan(event):
+            plan_runs.add(event.get('run'))
+        elif event.get('event') in ('host', 'status') and event.get('ip') and event.get('run') not in plan_runs:
+            status[event['ip']] = event.get('status')
+    return {ip for ip, state in status.items() if state in DONE_STATUSES}
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarise slow hosts and steps across deploy runs')
+    parser.add_argument('logs', nargs='*', help=f'Run logs (default: every log in {RUNS_DIR})')
+    parser.add_argument('--top', type=int, default=10, help='Slowest hosts to show (default: 10)')
+    args = parser.parse_args()
+
+    paths = args.logs or sorted(glob.glob(os.path.join(RUNS_DIR, '*.jsonl')))
+    if not paths:
+        print(f"⚠️  No run logs found in {RUNS_DIR}")
+        return
+
+    steps = {}
+    hosts = {}
+    runs = set()
+    for path in paths:
+        for event in read_events(path):
+            runs.add(event.get('run'))
+            if event.get('event') == 'step':
+                steps.setdefault(event['step'], []).append(event['seconds'])
+            elif event.get('event') == 'host':
+                hosts.setdefault(event['ip'], []).append(event.get('seconds', 0))
+
+    print(f"📊 {len(runs)} run(s), {len(hosts)} host(s)\n")
+    print(f"{'Step':24s} {'count':>6s} {'p50':>8s} {'p95':>8s} {'max':>8s}")
+    for name, values in sorted(steps.items(), key=lambda item: -sum(item[1])):
+        print(f"{name:24s} {len(values):6d} {_percentile(values, 0.5):7.2f}s "
+              f"{_percentile(values, 0.95):7.2f}s {max(values):7.2f}s")
+
+    print(f"\n🐢 Slowest hosts (mean per run):")
+    slowest = sorted(hosts.items(), key=lambda item: -sum(item[1]) / len(item[1]))[:args.top]
+    for ip, values in slowest:
+        print(f"   {ip:20s} {sum(values) / len(values):7.2f}s over {len(values)} run(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Scrape Cost Profiler
+Scrapes every exporter in the deploy script's file_sd target files and shows where the series come from.
+
+Each target in prometheus/targets.json, docker_targets.json and
+mysql_targets.json is scraped concurrently and streamed through the
+exposition parser. Metric families are ranked per job by series and bytes,
+and the profiler suggests what to cut: cAdvisor -docker_only and
+-disable_metrics flags, and metric_relabel_configs drop rules for families
+that no dashboard or alert rule in this repo uses, each with the number of
+series it would save.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import http_probe
+import target_files
+from exposition import ExpositionParser
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMETHEUS_DIR = os.path.join(BASE_DIR, 'prometheus')
+
+# file_sd file -> the job that scrapes it in prometheus.yml
+TARGET_FILES = [
+    ('targets.json', 'remote_hosts'),
+    ('docker_targets.json', 'remote_docker'),
+    ('mysql_targets.json', 'remote_mysql'),
+]
+CADVISOR_JOB = 'remote_docker'
+
+# cAdvisor -disable_metrics group of each container_* family; more specific prefixes first
+CADVISOR_METRIC_GROUPS = [
+    ('container_network_tcp_usage_total', 'tcp'),
+    ('container_network_tcp6_usage_total', 'tcp'),
+    ('container_network_udp_usage_total', 'udp'),
+    ('container_network_udp6_usage_total', 'udp'),
+    ('container_network_advance_tcp_stats_total', 'advtcp'),
+    ('container_network_', 'network'),
+    ('container_fs_inodes_', 'disk'),
+    ('container_fs_limit_bytes', 'disk'),
+    ('container_fs_usage_bytes', 'disk'),
+    ('container_fs_', 'diskIO'),
+    ('container_blkio_', 'diskIO'),
+    ('container_memory_numa_', 'memory_numa'),
+    ('container_memory_bandwidth_', 'resctrl'),
+    ('container_llc_occupancy_bytes', 'resctrl'),
+    ('container_referenced_bytes', 'referenced_memory'),
+    ('container_memory_', 'memory'),
+    ('container_cpu_load_average_10s', 'cpuLoad'),
+    ('container_tasks_state', 'cpuLoad'),
+    ('container_cpu_schedstat_', 'sched'),
+    ('container_cpu_', 'cpu'),
+    ('container_hugetlb_', 'hugetlb'),
+    ('container_perf_', 'perf_event'),
+    ('container_processes', 'process'),
+    ('container_threads', 'process'),
+    ('container_sockets', 'process'),
+    ('container_file_descriptors', 'process'),
+    ('container_ulimits_soft', 'process'),
+    ('container_oom_events_total', 'oom_event'),
+]
+# cAdvisor's own -disable_metrics default; passing the flag replaces it, so it is always repeated
+CADVISOR_DEFAULT_DISABLED = ['advtcp', 'cpu_topology', 'cpuset', 'hugetlb', 'memory_numa', 'process',
+                             'referenced_memory', 'resctrl', 'sched', 'tcp', 'udp']
+# Never suggested for removal, whatever they cost
+CADVISOR_KEEP = {'cpu', 'memory'}
+DOCKER_CGROUP = re.compile(r'^/(docker/|system\.slice/docker-)')
+
+SUFFIXES = ('', '_total', '_bucket', '_sum', '_count', '_created')
+DEFAULT_MIN_SAVINGS = 500
+
+
+@lru_cache(maxsize=None)
+def cadvisor_group(family):
+    for prefix, group in CADVISOR_METRIC_GROUPS:
+        if family.startswith(prefix):
+            return group
+    return None
+
+
+def load_endpoints():
+    """(job, host:port) for every target in the file_sd files"""
+    endpoints = []
+    for filename, job in TARGET_FILES:
+        for group in target_files.read_targets(os.path.join(PROMETHEUS_DIR, filename)):
+            for target in group.get('targets', []):
+                endpoints.append((group.get('labels', {}).get('job', job), target))
+    return endpoints
+
+
+def used_metric_names():
+    """Every identifier that appears in the repo's dashboards and alert/recording rules"""
+    names = set()
+    roots = [os.path.join(BASE_DIR, 'grafana'), PROMETHEUS_DIR]
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if not filename.endswith(('.json', '.yml', '.yaml')) or filename.endswith('targets.json'):
+                    continue
+                try:
+                    with open(os.path.join(dirpath, filename), 'r', encoding='utf-8', errors='replace') as f:
+                        names.update(re.findall(r'[a-zA-Z_:][a-zA-Z0-9_:]*', f.read()))
+                except OSError:
+                    continue
+    return names
+
+
+def is_used(family, used):
+    return any(family + suffix in used for suffix in SUFFIXES)
+
+
+def profile_target(job, endpoint, timeout, max_series):
+    """Scrape one target and count its series per family, sample name and cAdvisor group"""
+    host, _, port = endpoint.rpartition(':')
+    names = Counter()
+    groups = Counter()
+    extra = Counter()
+
+    def on_sample(name, family, labels):
+        names[name] += 1
+        if family.startswith('container_'):
+            groups[cadvisor_group(family)] += 1
+            cgroup = labels.get('id')
+            if cgroup is not None and cgroup != '/' and not DOCKER_CGROUP.match(cgroup):
+                extra['non_docker'] += 1
+            if name == 'container_cpu_usage_seconds_total' and labels.get('cpu', 'total') != 'total':
+                extra['percpu'] += 1
+
+    parser = ExpositionParser(max_series=max_series, on_sample=on_sample)
+    result = http_probe.probe(host.strip('[]'), int(port), timeout=timeout, parser=parser)
+    families = {f.name: {'type': f.type, 'series': f.series, 'bytes': f.bytes} for f in parser.families.values()}
+    return {
+        'job': job, 'endpoint': endpoint, 'ok': result['ok'], 'error': result['error'],
+        'seconds': result['seconds'], 'series': parser.series, 'bytes': parser.bytes,
+        'truncated': parser.stopped == 'max_series', 'parse_errors': parser.error_count,
+        'families': families, 'names': names, 'groups': groups, 'extra': extra,
+    }
+
+
+def aggregate(profiles):
+    """Per-job totals across every target of the job"""
+    jobs = {}
+    for profile in profiles:
+        job = jobs.setdefault(profile['job'], {'targets': [], 'series': 0, 'bytes': 0, 'families': {},
+                                               'names': Counter(), 'groups': Counter(), 'extra': Counter()})
+        job['targets'].append(profile)
+        if not profile['ok']:
+            continue
+        job['series'] += profile['series']
+        job['bytes'] += profile['bytes']
+        for name, stats in profile['families'].items():
+            family = job['families'].setdefault(name, {'type': stats['type'], 'series': 0, 'bytes': 0, 'targets': 0})
+            family['series'] += stats['series']
+            family['bytes'] += stats['bytes']
+            family['targets'] += 1
+        job['names'].update(profile['names'])
+        job['groups'].update(profile['groups'])
+        job['extra'].update(profile['extra'])
+    return jobs
+
+
+def suggest(job_name, job, used, min_savings):
+    """Suggested cuts for one job, each with the series it would save"""
+    suggestions = []
+    covered = set()
+
+    if job_name == CADVISOR_JOB and job['groups']:
+        disable = []
+        for group, series in job['groups'].most_common():
+            if group is None or group in CADVISOR_KEEP or group in CADVISOR_DEFAULT_DISABLED or series < min_savings:
+                continue
+            families = [name for name in job['families'] if cadvisor_group(name) == group]
+            if any(is_used(name, used) for name in families):
+                continue
+            disable.append({'group': group, 'series': series})
+            covered.update(families)
+        if job['extra']['percpu'] >= min_savings:
+            disable.append({'group': 'percpu', 'series': job['extra']['percpu']})
+        if disable:
+            groups = CADVISOR_DEFAULT_DISABLED + sorted(d['group'] for d in disable)
+            suggestions.append({
+                'kind': 'cadvisor_flag',
+                'flag': f"-disable_metrics={','.join(groups)}",
+                'series': sum(d['series'] for d in disable),
+                'detail': disable,
+            })
+        if job['extra']['non_docker'] >= min_savings:
+            suggestions.append({
+                'kind': 'cadvisor_flag',
+                'flag': '-docker_only=true',
+                'series': job['extra']['non_docker'],
+                'detail': [{'group': 'non-Docker cgroups', 'series': job['extra']['non_docker']}],
+            })
+
+    drops = []
+    for name, family in sorted(job['families'].items(), key=lambda item: -item[1]['series']):
+        if name in covered or family['series'] < min_savings:
+            continue
+        if job_name == CADVISOR_JOB and cadvisor_group(name) in CADVISOR_KEEP:
+            continue
+        if not is_used(name, used):
+            drops.append({'metric': name if family['type'] not in ('histogram', 'summary') else f"{name}(_bucket|_sum|_count|_created)?",
+                          'series': family['series']})
+        elif family['type'] == 'histogram' and f"{name}_bucket" not in used:
+            # Dashboards only use _sum/_count: the buckets can go
+            buckets = job['names'][f"{name}_bucket"]
+            if buckets >= min_savings:
+                drops.append({'metric': f"{name}_bucket", 'series': buckets})
+    if drops:
+        suggestions.append({
+            'kind': 'metric_relabel_drop',
+            'regex': '|'.join(drop['metric'] for drop in drops),
+            'series': sum(drop['series'] for drop in drops),
+            'detail': drops,
+        })
+    return suggestions
+
+
+def print_job(job_name, job, suggestions, top):
+    reachable = [t for t in job['targets'] if t['ok']]
+    print(f"\n{'='*78}")
+    print(f"📊 {job_name}: {len(reachable)}/{len(job['targets'])} target(s) scraped, "
+          f"{job['series']:,} series, {job['bytes'] / 1048576:.1f} MiB per scrape round")
+    print(f"{'='*78}")
+    if not reachable:
+        return
+
+    print(f"\n{'Family':52s} {'type':>9s} {'series':>9s} {'share':>6s} {'KiB':>8s}")
+    ranked = sorted(job['families'].items(), key=lambda item: (-item[1]['series'], -item[1]['bytes']))
+    for name, family in ranked[:top]:
+        share = family['series'] / job['series'] * 100 if job['series'] else 0
+        print(f"{name[:52]:52s} {family['type']:>9s} {family['series']:9,d} {share:5.1f}% {family['bytes'] / 1024:8.1f}")
+
+    print(f"\n🐢 Most expensive targets:")
+    for target in sorted(job['targets'], key=lambda t: (-t['series'], -t['bytes']))[:top]:
+        if not target['ok']:
+            print(f"   ❌ {target['endpoint']:24s} {target['error']}")
+            continue
+        flags = ' (stopped at --max-series)' if target['truncated'] else ''
+        flags += f" ({target['parse_errors']} malformed line(s))" if target['parse_errors'] else ''
+        print(f"   {target['endpoint']:24s} {target['series']:9,d} series {target['bytes'] / 1024:9.1f} KiB "
+              f"{target['seconds']:6.2f}s{flags}")
+
+    if not suggestions:
+        print(f"\n✅ Nothing worth cutting (no unused family or cAdvisor group above the threshold)")
+        return
+    print(f"\n💡 Suggestions:")
+    for suggestion in suggestions:
+        share = suggestion['series'] / job['series'] * 100 if job['series'] else 0
+        if suggestion['kind'] == 'cadvisor_flag':
+            print(f"\n   cAdvisor flag (CADVISOR_UNIT in deploy_monitor.py), saves ~{suggestion['series']:,} series ({share:.0f}%):")
+            print(f"      {suggestion['flag']}")
+        else:
+            print(f"\n   prometheus.yml, job '{job_name}', saves ~{suggestion['series']:,} series ({share:.0f}%):")
+            print(f"      metric_relabel_configs:")
+            print(f"        - source_labels: [__name__]")
+            print(f"          regex: '{suggestion['regex']}'")
+            print(f"          action: drop")
+        for item in suggestion['detail']:
+            print(f"         - {item.get('group') or item.get('metric')}: {item['series']:,} series")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile scrape cost per exporter and suggest what to drop')
+    parser.add_argument('--job', action='append', help='Only profile these jobs (default: all)')
+    parser.add_argument('--top', type=int, default=15, help='Families and targets to list per job (default: 15)')
+    parser.add_argument('--parallel', '-j', type=int, default=16, help='Targets scraped at once (default: 16)')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds per scrape (default: 30)')
+    parser.add_argument('--max-series', type=int, help='Stop reading a target after this many series')
+    parser.add_argument('--min-savings', type=int, default=DEFAULT_MIN_SAVINGS,
+                        help=f'Smallest saving (in series) worth suggesting (default: {DEFAULT_MIN_SAVINGS})')
+    parser.add_argument('--json', action='store_true', help='Print the profile as JSON')
+    args = parser.parse_args()
+
+    endpoints = [(job, endpoint) for job, endpoint in load_endpoints() if not args.job or job in args.job]
+    if not endpoints:
+        print(f"⚠️  No targets found in {PROMETHEUS_DIR}")
+        sys.exit(1)
+    if not args.json:
+        print(f"🔍 Scraping {len(endpoints)} target(s), {max(1, min(args.parallel, len(endpoints)))} at a time...")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(args.parallel, len(endpoints)))) as pool:
+        profiles = list(pool.map(lambda e: profile_target(e[0], e[1], args.timeout, args.max_series), endpoints))
+    jobs = aggregate(profiles)
+    used = used_metric_names()
+    suggestions = {name: suggest(name, job, used, args.min_savings) for name, job in jobs.items()}
+
+    if args.json:
+        print(json.dumps({
+            'seconds': round(time.time() - started, 2),
+            'jobs': {name: {
+                'series': job['series'],
+                'bytes': job['bytes'],
+                'targets': [{k: t[k] for k in ('endpoint', 'ok', 'error', 'seconds', 'series', 'bytes', 'truncated')}
+                            for t in job['targets']],
+                'families': dict(sorted(job['families'].items(), key=lambda item: -item[1]['series'])[:args.top]),
+                'suggestions': suggestions[name],
+            } for name, job in jobs.items()},
+        }, indent=2))
+        return
+
+    for name, job in jobs.items():
+        print_job(name, job, suggestions[name], args.top)
+    total = sum(job['series'] for job in jobs.values())
+    count = sum(len(job_suggestions) for job_suggestions in suggestions.values())
+    # Suggestions can overlap (e.g. -docker_only and -disable_metrics), so their savings are not summed
+    print(f"\n⏱️  Profiled {len(endpoints)} target(s) in {time.time() - started:.1f}s: {total:,} series, "
+          f"{count} suggestion(s)")
+
+
+if __name__ == '__main__':
+    main()
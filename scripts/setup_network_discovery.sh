@@ -88,6 +88,6 @@ echo "  • View log:     tail -f /var/log/network_discovery.log"
 echo "  • List cron:    crontab -l"
 echo "  • Remove cron:  crontab -e (delete the network_discovery line)"
 echo ""
-echo "Configuration: network_discovery.yml"
-echo "Discovered DB:  network_devices_discovered.json"
+echo "Configuration: network-discovery/network_discovery.yml"
+echo "Discovered DB:  network_devices.db (python3 scripts/device_inventory.py list)"
 echo ""
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+SSH Connection Pool
+Shared by deploy_monitor.py and diagnose_monitoring.py.
+
+Keeps one authenticated OpenSSH ControlMaster session per user@host for the
+length of a run, so each remote command reuses it instead of doing a new TCP
+handshake, key exchange and authentication. Masters are closed on exit.
+Set SSH_MULTIPLEX=0 to fall back to one connection per command.
+"""
+
+import atexit
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+BASE_OPTIONS = ['-o', 'StrictHostKeyChecking=no']
+CONTROL_PERSIST = 300  # Seconds an idle master is kept if the run dies without cleanup
+ENABLED = os.environ.get('SSH_MULTIPLEX', '1') != '0' and os.name != 'nt'
+
+_lock = threading.Lock()
+_host_locks = {}
+_masters = {}   # (user, ip) -> True if a master is up, False if it could not be started
+_control_dir = None
+
+
+def control_dir():
+    """Private directory for the control sockets"""
+    global _control_dir
+    if _control_dir is None:
+        path = os.environ.get('SSH_CONTROL_DIR') or os.path.join(
+            tempfile.gettempdir(), f"monitoring-ssh-{os.getuid()}")
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        _control_dir = path
+    return _control_dir
+
+
+def control_options():
+    """Options that route a command through the host's master socket, if there is one"""
+    if not ENABLED:
+        return []
+    # %C is a hash of the connection, which keeps socket paths short
+    return ['-o', f"ControlPath={os.path.join(control_dir(), '%C')}", '-o', 'ControlMaster=no']
+
+
+def _host_lock(user, ip):
+    with _lock:
+        return _host_locks.setdefault((user, ip), threading.Lock())
+
+
+def ensure_master(user, ip, connect_timeout=5, batch=True):
+    """Start (or reuse) the master session for user@ip; returns False if it could not connect"""
+    if not ENABLED:
+        return False
+    key = (user, ip)
+    with _host_lock(user, ip):
+        # One attempt per run: a dead socket just makes ssh connect directly again
+        if key in _masters:
+            return _masters[key]
+        options = BASE_OPTIONS + [
+            '-o', f'ConnectTimeout={connect_timeout}',
+            '-o', f"ControlPath={os.path.join(control_dir(), '%C')}",
+            '-o', 'ControlMaster=yes',
+            '-o', f'ControlPersist={CONTROL_PERSIST}',
+            # Compression is fixed when the master connects; it mostly helps binary pushes
+            '-o', 'Compression=yes',
+        ]
+        if batch:
+            options += ['-o', 'BatchMode=yes', '-o', 'PasswordAuthentication=no']
+        try:
+            # -f backgrounds after authentication; no pipes, so the daemon can't hold them open
+            result = subprocess.run(['ssh', '-f', '-N'] + options + [f'{user}@{ip}'],
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL, timeout=connect_timeout + 10)
+            _masters[key] = result.returncode == 0
+        except (subprocess.TimeoutExpired, OSError):
+            _masters[key] = False
+        return _masters[key]
+
+
+def ssh_argv(user, ip, cmd, connect_timeout=5, extra_options=None):
+    """Full ssh command line for one remote command, reusing the pooled session"""
+    ensure_master(user, ip, connect_timeout)
+    return (['ssh'] + BASE_OPTIONS + ['-o', f'ConnectTimeout={connect_timeout}']
+            + control_options() + (extra_options or []) + [f'{user}@{ip}', cmd])
+
+
+def run(user, ip, cmd, timeout=None, connect_timeout=5, extra_options=None):
+    """Run a remote command and return the CompletedProcess (text mode, output captured)"""
+    return subprocess.run(ssh_argv(user, ip, cmd, connect_timeout, extra_options),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, timeout=timeout)
+
+
+def push(user, ip, local_path, cmd, timeout=None, connect_timeout=5):
+    """Stream a local file into a remote command's stdin over a compressed session"""
+    with open(local_path, 'rb') as source:
+        result = subprocess.run(ssh_argv(user, ip, cmd, connect_timeout, ['-o', 'Compression=yes']),
+                                stdin=source, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=timeout)
+    result.stdout = result.stdout.decode(errors='replace')
+    result.stderr = result.stderr.decode(errors='replace')
+    return result
+
+
+def close(user, ip):
+    """Shut down the master for user@ip"""
+    if _masters.pop((user, ip), None):
+        subprocess.run(['ssh'] + control_options() + ['-O', 'exit', f'{user}@{ip}'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def close_all():
+    for user, ip in list(_masters):
+        close(user, ip)
+
+
+atexit.register(close_all)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare per-command SSH latency with and without pooling')
+    parser.add_argument('target', help='user@host')
+    parser.add_argument('--count', '-n', type=int, default=10, help='Commands to run (default: 10)')
+    args = parser.parse_args()
+    user, _, ip = args.target.rpartition('@')
+    user = user or 'root'
+
+    def timed(options):
+        started = time.time()
+        for _ in range(args.count):
+            subprocess.run(['ssh'] + BASE_OPTIONS + options + [f'{user}@{ip}', 'true'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return (time.time() - started) / args.count * 1000
+
+    print(f"🔌 Plain ssh:  {timed(['-o', 'ControlPath=none']):.0f}ms per command")
+    if not ensure_master(user, ip):
+        print(f"❌ Could not open a master session to {user}@{ip}")
+        raise SystemExit(1)
+    print(f"⚡ Pooled ssh: {timed(control_options()):.0f}ms per command")
+
+
+if __name__ == '__main__':
+    main()
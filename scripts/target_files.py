@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Prometheus file_sd Target File Writer
+Shared by the discovery, deployment and device management scripts.
+
+Writes are skipped when the content hash is unchanged and are done atomically
+(temp file + rename), so Prometheus never reads a half-written file and only
+rebuilds its service discovery state when targets actually change. Inside
+batch(), writes to the same file are staged and flushed once.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+_lock = threading.RLock()
+_staged = {}       # path -> target groups waiting for flush() inside batch()
+_batch_depth = 0
+_known = {}        # path -> (mtime_ns, size, sha256) of what is on disk
+
+
+def _key(path):
+    return str(Path(path).resolve())
+
+
+def render(groups):
+    """Serialise target groups the way the repo's target files are formatted"""
+    return json.dumps(groups, indent=2).encode('utf-8')
+
+
+def _disk_digest(path):
+    """Hash of the file on disk, reusing the last hash while mtime and size are unchanged"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    known = _known.get(_key(path))
+    if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+        return known[2]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _known[_key(path)] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def write_atomic(path, data):
+    """Write via a temp file in the same directory and rename it over the target"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix='.tmp', dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            os.chmod(tmp, path.stat().st_mode & 0o777)
+        else:
+            os.chmod(tmp, 0o644)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # A single-file bind mount cannot be renamed over; fall back to an in-place write
+            with open(path, 'wb') as f:
+                f.write(data)
+            os.unlink(tmp)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def read_targets(path):
+    """Load target groups, seeing staged (not yet flushed) content inside batch()"""
+    with _lock:
+        staged = _staged.get(_key(path))
+        if staged is not None:
+            return json.loads(json.dumps(staged))
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return []
+
+
+def _write_if_changed(path, data, digest):
+    if _disk_digest(path) == digest:
+        return False
+    write_atomic(path, data)
+    st = os.stat(path)
+    _known[_key(path)] = (st.st_mtime_ns, st.st_size, digest)
+    return True
+
+
+def write_targets(path, groups):
+    """Write target groups if they differ from what is on disk
+
+    Returns True when the file changed (or, inside batch(), when a change was
+    staged) and False when the write was skipped.
+    """
+    data = render(groups)
+    digest = hashlib.sha256(data).hexdigest()
+    with _lock:
+        if not _batch_depth:
+            return _write_if_changed(path, data, digest)
+        staged = _staged.get(_key(path))
+        current = _disk_digest(path) if staged is None else hashlib.sha256(render(staged)).hexdigest()
+        if current == digest:
+            return False
+        _staged[_key(path)] = groups
+        return True
+
+
+def update_targets(path, update):
+    """Read-modify-write a target file under the module lock
+
+    update(groups) edits the list in place or returns a new one. Returns True
+    if the file (or staged content) changed.
+    """
+    with _lock:
+        groups = read_targets(path)
+        result = update(groups)
+        return write_targets(path, groups if result is None else result)
+
+
+def flush():
+    """Write every staged file, returning the paths whose content changed"""
+    with _lock:
+        staged = dict(_staged)
+        _staged.clear()
+        changed = []
+        for path, groups in staged.items():
+            data = render(groups)
+            if _write_if_changed(path, data, hashlib.sha256(data).hexdigest()):
+                changed.append(path)
+        return changed
+
+
+@contextmanager
+def batch():
+    """Stage target writes and flush each file once when the outermost batch exits"""
+    global _batch_depth
+    with _lock:
+        _batch_depth += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _batch_depth -= 1
+            outermost = _batch_depth == 0
+        if outermost:
+            flush()
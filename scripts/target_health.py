@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Target Health Watcher
+Used by deploy_monitor.py to wait for Prometheus to scrape new exporters.
+
+Instead of every host polling /api/v1/targets on its own, one background
+poller fetches the active target list, indexes it by scrape address
+(host:port) and resolves every waiting endpoint from that one snapshot. The
+poll interval starts short and backs off while nothing changes, and the poller
+stops when nobody is waiting.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+from prometheus_api import PROMETHEUS_URL, PrometheusClient, PrometheusError, default_client
+
+MIN_INTERVAL = 1.0
+MAX_INTERVAL = 8.0
+
+# Prefer the healthiest entry when several jobs scrape the same address
+_HEALTH_RANK = {'up': 2, 'down': 1}
+
+
+class _Waiter:
+    def __init__(self, endpoint, want_up, deadline):
+        self.endpoint = endpoint
+        self.want_up = want_up
+        self.deadline = deadline
+        self.future = Future()
+
+
+class TargetHealth:
+    """Shared, snapshot-based wait for Prometheus target health"""
+
+    def __init__(self, client=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.client = client or default_client()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._cond = threading.Condition()
+        self._waiters = {}   # (endpoint, want_up) -> _Waiter
+        self._thread = None
+        self.index = {}
+        self.snapshot_at = 0.0
+        self.error = None
+        self.fetches = 0
+
+    def watch(self, endpoint, timeout=30, want_up=True):
+        """Future resolved with the endpoint's status once it is up (or, with want_up=False, scraped at all)
+
+        Watching an endpoint that is already being watched returns the same future.
+        """
+        key = (endpoint, want_up)
+        with self._cond:
+            waiter = self._waiters.get(key)
+            if waiter and not waiter.future.done():
+                return waiter.future
+            waiter = _Waiter(endpoint, want_up, time.monotonic() + timeout)
+            self._waiters[key] = waiter
+            if time.monotonic() - self.snapshot_at < self.min_interval:
+                self._resolve(waiter)
+            if not waiter.future.done():
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='target-health', daemon=True)
+                    self._thread.start()
+                # A new waiter resets the backoff
+                self._cond.notify()
+            return waiter.future
+
+    def wait(self, endpoint, timeout=30, want_up=True):
+        """Blocking form of watch(); returns the status dict"""
+        return self.watch(endpoint, timeout, want_up).result()
+
+    def _status(self, endpoint, resolved):
+        target = self.index.get(endpoint)
+        return {
+            'endpoint': endpoint,
+            'resolved': resolved,
+            'found': target is not None,
+            'health': target.health if target else None,
+            'last_error': target.last_error if target else '',
+            'job': target.job if target else None,
+            'error': self.error,
+        }
+
+    def _resolve(self, waiter):
+        """Settle a waiter from the current snapshot; returns True if it was settled"""
+        target = self.index.get(waiter.endpoint)
+        health = target.health if target else None
+        settled = health == 'up' or (not waiter.want_up and health == 'down')
+        if settled:
+            waiter.future.set_result(self._status(waiter.endpoint, True))
+        elif time.monotonic() >= waiter.deadline:
+            waiter.future.set_result(self._status(waiter.endpoint, False))
+        else:
+            return False
+        del self._waiters[(waiter.endpoint, waiter.want_up)]
+        return True
+
+    def _fetch(self):
+        try:
+            # Always fresh for the poller; the result still lands in the shared cache
+            targets = self.client.targets(max_age=0)
+        except PrometheusError as e:
+            self.error = str(e)
+            return False
+        index = {}
+        for target in targets:
+            current = index.get(target.endpoint)
+            if current is None or _HEALTH_RANK.get(target.health, 0) > _HEALTH_RANK.get(current.health, 0):
+                index[target.endpoint] = target
+        self.index = index
+        self.error = None
+        return True
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            ok = self._fetch()
+            with self._cond:
+                self.fetches += 1
+                self.snapshot_at = time.monotonic()
+                pending = len(self._waiters)
+                settled = sum(self._resolve(w) for w in list(self._waiters.values()))
+                if not self._waiters:
+                    self._thread = None
+                    return
+
+                # Poll fast while things are changing, back off while they aren't
+                if ok and settled:
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * 2, self.max_interval)
+                earliest = min(w.deadline for w in self._waiters.values())
+                sleep = max(0.0, min(interval, earliest - time.monotonic()))
+
+                # New waiters wake the poller early and reset the backoff
+                if self._cond.wait_for(lambda: len(self._waiters) > pending - settled, timeout=sleep):
+                    interval = self.min_interval
+                    remaining = self.min_interval - (time.monotonic() - self.snapshot_at)
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Wait for Prometheus to report targets as up')
+    parser.add_argument('endpoints', nargs='+', help='host:port of each target')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait (default: 30)')
+    parser.add_argument('--prometheus', default=PROMETHEUS_URL, help=f'Prometheus URL (default: {PROMETHEUS_URL})')
+    args = parser.parse_args()
+
+    health = TargetHealth(PrometheusClient(args.prometheus))
+    futures = [health.watch(endpoint, args.timeout) for endpoint in args.endpoints]
+    failed = 0
+    for future in futures:
+        status = future.result()
+        if status['resolved']:
+            print(f"✓ {status['endpoint']} is UP ({status['job']})")
+        else:
+            failed += 1
+            detail = status['last_error'] or status['error'] or 'not found in Prometheus'
+            print(f"✗ {status['endpoint']}: {status['health'] or 'missing'} - {detail}")
+    print(f"\n{health.fetches} target list fetch(es) for {len(futures)} endpoint(s)")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,28 +3,29 @@
 Verify Prometheus targets health and display detailed status
 """
 
-import requests
 import json
 import sys
 from datetime import datetime
 
-PROMETHEUS_URL = "http://localhost:9990"
+from prometheus_api import PROMETHEUS_URL, PrometheusError, default_client
 
-def get_targets():
-    """Get all targets from Prometheus"""
+def fetch_or_exit(fetch):
+    """Run an API call, exiting with a hint if Prometheus is unavailable"""
     try:
-        response = requests.get(f"{PROMETHEUS_URL}/api/v1/targets", timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.ConnectionError:
-        print("❌ Cannot connect to Prometheus at", PROMETHEUS_URL)
-        print("   Make sure Prometheus is running:")
-        print("   docker-compose ps prometheus")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ Error fetching targets: {e}")
+        return fetch()
+    except PrometheusError as e:
+        if e.unreachable:
+            print("❌ Cannot connect to Prometheus at", PROMETHEUS_URL)
+            print("   Make sure Prometheus is running:")
+            print("   docker-compose ps prometheus")
+        else:
+            print(f"❌ Error fetching targets: {e}")
         sys.exit(1)
 
+def get_targets():
+    """Get all active targets from Prometheus"""
+    return fetch_or_exit(default_client().targets)
+
 def format_uptime(last_scrape):
     """Calculate time since last scrape"""
     if not last_scrape:
@@ -48,10 +49,8 @@ def format_uptime(last_scrape):
     except:
         return last_scrape
 
-def display_targets(data):
+def display_targets(active_targets):
     """Display targets in a formatted table"""
-    active_targets = data.get('data', {}).get('activeTargets', [])
-    
     if not active_targets:
         print("⚠️  No targets configured")
         return
@@ -59,10 +58,7 @@ def display_targets(data):
     # Group by job
     jobs = {}
     for target in active_targets:
-        job = target.get('labels', {}).get('job', 'unknown')
-        if job not in jobs:
-            jobs[job] = []
-        jobs[job].append(target)
+        jobs.setdefault(target.job, []).append(target)
     
     print("\n" + "="*100)
     print(f"📊 PROMETHEUS TARGETS STATUS - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -75,13 +71,12 @@ def display_targets(data):
         print(f"📁 Job: {job_name}")
         print("-" * 100)
         
-        for target in sorted(targets, key=lambda x: x.get('scrapeUrl', '')):
-            health = target.get('health', 'unknown')
-            scrape_url = target.get('scrapeUrl', 'N/A')
-            instance = target.get('labels', {}).get('instance', 'N/A')
-            last_scrape = target.get('lastScrape', 'Never')
-            last_error = target.get('lastError', '')
-            scrape_duration = target.get('lastScrapeDuration', 0)
+        for target in sorted(targets, key=lambda x: x.scrape_url):
+            health = target.health
+            instance = target.instance
+            last_scrape = target.last_scrape or 'Never'
+            last_error = target.last_error
+            scrape_duration = target.scrape_duration or 0
             
             # Status icon
             if health == 'up':
@@ -117,9 +112,9 @@ def display_targets(data):
         print("⚠️  UNHEALTHY TARGETS:\n")
         for job_name, targets in jobs.items():
             for target in targets:
-                if target.get('health') == 'down':
-                    instance = target.get('labels', {}).get('instance', 'N/A')
-                    error = target.get('lastError', 'Unknown error')
+                if target.health == 'down':
+                    instance = target.instance
+                    error = target.last_error or 'Unknown error'
                     print(f"   ❌ {instance}")
                     print(f"      Job: {job_name}")
                     print(f"      Error: {error}")
@@ -136,22 +131,16 @@ def check_metrics(instance):
         'Disk': 'node_filesystem_avail_bytes{instance="' + instance + '"}'
     }
     
+    # All four queries go out at once
+    results = default_client().query_many(queries.values())
     for name, query in queries.items():
-        try:
-            response = requests.get(
-                f"{PROMETHEUS_URL}/api/v1/query",
-                params={'query': query},
-                timeout=5
-            )
-            data = response.json()
-            result = data.get('data', {}).get('result', [])
-            
-            if result:
-                print(f"   ✅ {name}: OK ({len(result)} series)")
-            else:
-                print(f"   ❌ {name}: No data")
-        except Exception as e:
-            print(f"   ❌ {name}: Error - {e}")
+        result = results[query]
+        if isinstance(result, PrometheusError):
+            print(f"   ❌ {name}: Error - {result}")
+        elif result:
+            print(f"   ✅ {name}: OK ({len(result)} series)")
+        else:
+            print(f"   ❌ {name}: No data")
 
 def main():
     if len(sys.argv) > 1:
@@ -164,23 +153,18 @@ def main():
             check_metrics(sys.argv[2])
         elif sys.argv[1] == '--json':
             # Output raw JSON
-            data = get_targets()
-            print(json.dumps(data, indent=2))
+            data = fetch_or_exit(default_client().targets_raw)
+            print(json.dumps({'status': 'success', 'data': data}, indent=2))
         else:
             print("Unknown option:", sys.argv[1])
             print("Usage: verify_prometheus_targets.py [--check <instance> | --json]")
     else:
         # Default: show formatted status
-        data = get_targets()
-        display_targets(data)
+        targets = get_targets()
+        display_targets(targets)
         
         # Offer to check metrics for down targets
-        down_targets = []
-        for target in data.get('data', {}).get('activeTargets', []):
-            if target.get('health') == 'down':
-                instance = target.get('labels', {}).get('instance')
-                if instance:
-                    down_targets.append(instance)
+        down_targets = [t.instance for t in targets if t.health == 'down' and t.instance != 'unknown']
         
         if down_targets:
             print("\n💡 TIP: Run diagnostics with:")